@@ -18,8 +18,8 @@ function HistorySidebar({ history, currentResultId, onLoadHistoryItem }) {
               {new Date(item.timestamp).toLocaleTimeString()}
             </div>
             <div className="history-stats">
-              <span>🎯 Direct: {item.directRequestTime}s</span>
-              <span>🤖 Agent: {item.agentRequestTime}s</span>
+              <span>🎯 Direct: {item.directRequestTime}s{item.directRevalidated && ' (unchanged)'}</span>
+              <span>🤖 Agent: {item.agentRequestTime}s{item.agentRevalidated && ' (unchanged)'}</span>
             </div>
           </div>
         ))}
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { fetchAuthSession } from 'aws-amplify/auth';
 import CityInput from './CityInput';
 import ResponseCard from './ResponseCard';
@@ -14,6 +14,8 @@ function LambdaTab() {
   const [history, setHistory] = useState([]);
   const [error, setError] = useState(null);
   const [aiAvailable, setAiAvailable] = useState(false);
+  // Last response and ETag per endpoint and city, revalidated with If-None-Match
+  const responseCache = useRef(new Map());
 
   useEffect(() => {
     const checkAiAvailability = async () => {
@@ -50,43 +52,39 @@ function LambdaTab() {
         return;
       }
 
-      const directPromise = (async () => {
-        const startTime = performance.now();
-        const response = await fetch(`${API_BASE_URL}/direct`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'Authorization': token,
-          },
-          body: JSON.stringify({ city: cityName }),
-        });
-        const endTime = performance.now();
-        const data = await response.json();
-        return {
-          data,
-          time: ((endTime - startTime) / 1000).toFixed(2),
-          status: response.status
+      const callLambda = async (path) => {
+        const cacheKey = `${path}:${cityName.trim().toLowerCase()}`;
+        const cached = responseCache.current.get(cacheKey);
+        const headers = {
+          'Content-Type': 'application/json',
+          'Authorization': token,
         };
-      })();
-
-      const agentPromise = (async () => {
+        if (cached) {
+          headers['If-None-Match'] = cached.etag;
+        }
         const startTime = performance.now();
-        const response = await fetch(`${API_BASE_URL}/agent`, {
+        const response = await fetch(`${API_BASE_URL}${path}`, {
           method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'Authorization': token,
-          },
+          headers,
           body: JSON.stringify({ city: cityName }),
         });
+        // 304: the answer we already have is still current
+        const data = response.status === 304 ? cached.data : await response.json();
         const endTime = performance.now();
-        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (response.ok && etag) {
+          responseCache.current.set(cacheKey, { etag, data });
+        }
         return {
           data,
           time: ((endTime - startTime) / 1000).toFixed(2),
-          status: response.status
+          status: response.status,
+          revalidated: response.status === 304
         };
-      })();
+      };
+
+      const directPromise = callLambda('/direct');
+      const agentPromise = callLambda('/agent');
 
       const [directResult, agentResult] = await Promise.all([directPromise, agentPromise]);
 
@@ -103,7 +101,9 @@ function LambdaTab() {
         directResponse: directResult.data,
         agentResponse: agentResult.data,
         directRequestTime: directResult.time,
-        agentRequestTime: agentResult.time
+        agentRequestTime: agentResult.time,
+        directRevalidated: directResult.revalidated,
+        agentRevalidated: agentResult.revalidated
       };
 
       setCurrentResult(result);
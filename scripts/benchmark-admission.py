@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Traffic-spike benchmark for admission control in lambda_direct.
+
+Requests arrive open-loop at --arrival-rps for --seconds against the offline
+stub, which allows --quota-rps model calls per rolling second and throttles
+the rest like an exhausted Bedrock quota. Two configurations handle the same
+spike:
+
+  retries only   every request goes to Bedrock; throttled calls are retried
+                 with backoff and fail once the retries run out
+  admission      a token bucket sized to the quota answers the excess with an
+                 immediate 429 + Retry-After and never sends it to Bedrock
+
+For each one the script reports status codes, Bedrock calls and throttles
+per request and the latency of successful and rejected requests, so the
+retry storm without admission control is visible next to the fast 429s.
+
+Usage:
+  python3 scripts/benchmark-admission.py [--seconds S] [--arrival-rps N]
+      [--quota-rps N] [--latency-ms MS]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import types
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--arrival-rps', type=float, default=60)
+    parser.add_argument('--quota-rps', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    args = parser.parse_args()
+
+    os.environ.setdefault('FACT_CACHE_ENABLED', 'false')
+    os.environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_direct.index as direct
+    from common.admission import AdmissionController, MemoryBucketStore
+    from common.bedrock_invoke import InvokePolicy, ResilientInvoker
+    from localdev.stub_bedrock import StubBedrockRuntime, install_stubs
+
+    configurations = [
+        ("retries only", AdmissionController(None)),
+        # Burst plus one second of refill stays within the stub's rolling one-second window
+        ("admission", AdmissionController(MemoryBucketStore(), requests_per_minute=args.quota_rps * 60 * 0.85,
+                                          burst_seconds=0.15)),
+    ]
+    total = int(args.seconds * args.arrival_rps)
+    context = types.SimpleNamespace(aws_request_id='benchmark', get_remaining_time_in_millis=lambda: 30000)
+
+    print(f"🚦 Spike: {total} requests at {args.arrival_rps:.0f}/s for {args.seconds:.0f} s, "
+          f"Bedrock quota {args.quota_rps}/s, {args.latency_ms:.0f} ms per call")
+    for label, controller in configurations:
+        stub = StubBedrockRuntime(latency_ms=args.latency_ms, shape='clean_json', quota_rps=args.quota_rps)
+        install_stubs(direct=stub)
+        direct.claude_invoker = ResilientInvoker(InvokePolicy(backoff_base_ms=50, backoff_max_ms=1000))
+        direct.admission = controller
+        time.sleep(1)  # Let the previous run's quota window drain
+
+        def one_request(index):
+            started = time.perf_counter()
+            response = direct.handler({"city": f"City {index}"}, context)
+            return response["statusCode"], (time.perf_counter() - started) * 1000
+
+        futures = []
+        started = time.perf_counter()
+        # Redirect once around the pool; redirect_stdout is process-wide, not per thread
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=256) as pool:
+            for index in range(total):
+                delay = started + index / args.arrival_rps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(one_request, index))
+            results = [future.result() for future in futures]
+        elapsed_s = time.perf_counter() - started
+
+        statuses = Counter(status for status, _ in results)
+        ok_ms = [ms for status, ms in results if status == 200]
+        rejected_ms = [ms for status, ms in results if status == 429]
+        print(f"   {label:13} {dict(sorted(statuses.items()))}  goodput {len(ok_ms) / elapsed_s:5.1f}/s  "
+              f"Bedrock calls {stub.calls / total:.2f}/request, throttled {stub.throttled}")
+        print(f"   {'':13} 200 p50 {percentile(ok_ms, 50):7.1f} ms  p95 {percentile(ok_ms, 95):7.1f} ms   "
+              f"429 p50 {percentile(rejected_ms, 50):7.1f} ms  p95 {percentile(rejected_ms, 95):7.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Import-time (init phase) benchmark for both Lambda functions.
+
+Imports each handler module in a fresh interpreter several times, in both
+CLIENT_INIT_MODE settings, using a packaged city_index.json like the real
+deployment. Compares the median against data/benchmarks/cold-start-budget.json
+and exits non-zero when any budget is exceeded.
+
+Usage:
+  python3 scripts/benchmark-cold-start.py [runs]
+  python3 scripts/benchmark-cold-start.py [runs] --update   # rewrite budgets (median + 50% headroom)
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SRC_DIR = os.path.join(REPO_ROOT, 'src')
+BUDGET_PATH = os.path.join(REPO_ROOT, 'data', 'benchmarks', 'cold-start-budget.json')
+sys.path.insert(0, SRC_DIR)
+
+from common.city_index import build_city_index  # noqa: E402
+
+MODULES = ('lambda_direct', 'lambda_agent')
+INIT_MODES = ('eager', 'lazy')
+HEADROOM = 1.5
+
+MEASURE = """
+import json, time
+started = time.perf_counter()
+import {module}.index
+from common.runtime import cold_start_report
+print(json.dumps({{"import_ms": (time.perf_counter() - started) * 1000,
+                  "client_init_ms": cold_start_report()["client_init_ms"]}}))
+"""
+
+
+def measure(module, init_mode, index_path):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': SRC_DIR,
+        'PYTHONDONTWRITEBYTECODE': '1',
+        'CLIENT_INIT_MODE': init_mode,
+        'CITY_INDEX_PATH': index_path,
+        'AWS_REGION': env.get('AWS_REGION', 'us-east-1'),
+        'BEDROCK_AGENT_ID': 'BENCHMARK',
+    })
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE.format(module=module)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    # Handlers may print during init; the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs, update):
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, 'city_index.json')
+        build_city_index(os.path.join(REPO_ROOT, 'data', 'knowledge-base')).save(index_path)
+
+        results = {}
+        print(f"⏱️  Cold-start import benchmark ({runs} runs each)")
+        for module in MODULES:
+            for init_mode in INIT_MODES:
+                samples = [measure(module, init_mode, index_path) for _ in range(runs)]
+                import_ms = [sample['import_ms'] for sample in samples]
+                median_ms = statistics.median(import_ms)
+                results[f"{module}/{init_mode}"] = median_ms
+                clients = samples[-1]['client_init_ms']
+                print(f"   {module:14} {init_mode:5}  median {median_ms:7.1f} ms  "
+                      f"min {min(import_ms):7.1f}  max {max(import_ms):7.1f}  clients {clients}")
+
+    if update:
+        budgets = {key: round(value * HEADROOM) for key, value in results.items()}
+        os.makedirs(os.path.dirname(BUDGET_PATH), exist_ok=True)
+        with open(BUDGET_PATH, 'w') as f:
+            json.dump({"unit": "ms", "budgets": budgets}, f, indent=2)
+            f.write('\n')
+        print(f"📝 Budgets written to {BUDGET_PATH}")
+        return 0
+
+    with open(BUDGET_PATH) as f:
+        budgets = json.load(f)['budgets']
+    over = {key: value for key, value in results.items() if value > budgets.get(key, float('inf'))}
+    for key, value in over.items():
+        print(f"❌ {key}: {value:.1f} ms exceeds budget of {budgets[key]} ms")
+    if over:
+        return 1
+    print("✅ All init times within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    sys.exit(main(int(args[0]) if args else 5, '--update' in sys.argv))
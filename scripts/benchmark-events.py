@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for common.events.normalize_event.
+
+Every payload in data/lambda-tests/*.json is wrapped in each event shape
+the handlers accept (direct invocation, API Gateway REST API body and query
+string, HTTP API with a base64 body, Bedrock agent action group and agent
+inputText). For each shape the script checks the decoded source and city,
+counts JSON decodes per event (at most one) and reports the time per call.
+
+Usage:
+  python3 scripts/benchmark-events.py [--iterations N]
+"""
+
+import argparse
+import base64
+import glob
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from common import events  # noqa: E402
+
+HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+
+def build_shapes(payload):
+    """
+    (shape name, expected source, expected city, event) for one direct
+    payload. Agent inputText only yields the word after "about" (or the
+    whole text when there is no city).
+    """
+    body = json.dumps(payload)
+    query = {name: str(value) for name, value in payload.items()}
+    city = payload.get("city") or ""
+    expected = city or None
+    action_text = f"Tell me about {city}"
+    input_text = f"Facts about {city}"
+    return [
+        ("direct", "direct", expected, dict(payload)),
+        ("rest-api-body", "api_gateway_v1", expected, {
+            "resource": "/city-facts", "path": "/city-facts", "httpMethod": "POST", "headers": HEADERS,
+            "queryStringParameters": None, "requestContext": {"stage": "prod"}, "body": body,
+            "isBase64Encoded": False}),
+        ("rest-api-query", "api_gateway_v1", expected, {
+            "resource": "/city-facts", "path": "/city-facts", "httpMethod": "GET", "headers": HEADERS,
+            "queryStringParameters": query, "requestContext": {"stage": "prod"}, "body": None}),
+        ("http-api-base64", "api_gateway_v2", expected, {
+            "version": "2.0", "routeKey": "POST /city-facts", "rawPath": "/city-facts",
+            "headers": {name.lower(): value for name, value in HEADERS.items()},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": base64.b64encode(body.encode('utf-8')).decode('ascii'), "isBase64Encoded": True}),
+        ("agent-action-group", "agent_action_group", expected or action_text.strip(), {
+            "messageVersion": "1.0", "agent": {"name": "city-facts"}, "sessionId": "s1",
+            "actionGroup": "CityFactsActionGroup", "apiPath": "/city-facts", "httpMethod": "POST",
+            "inputText": action_text, "requestBody": {"content": {"application/json": {
+                "properties": [{"name": name, "type": "string", "value": value}
+                               for name, value in query.items()]}}}}),
+        ("agent-input-text", "agent_action_group", city.split(' ')[0] or input_text.strip(), {
+            "messageVersion": "1.0", "sessionId": "s1", "inputText": input_text}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = {}
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, 'data', 'lambda-tests', '*.json'))):
+        with open(path) as f:
+            payloads[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+
+    decodes = [0]
+    original_loads = events.json.loads
+
+    def counting_loads(*a, **kw):
+        decodes[0] += 1
+        return original_loads(*a, **kw)
+
+    failures = []
+    timings = {}
+    for payload_name, payload in payloads.items():
+        for shape, expected_source, expected_city, event in build_shapes(payload):
+            events.json.loads = counting_loads
+            decodes[0] = 0
+            request = events.normalize_event(event)
+            events.json.loads = original_loads
+            if request.source != expected_source or request.city != expected_city or decodes[0] > 1:
+                failures.append(f"{payload_name}/{shape}: source={request.source} city={request.city!r} "
+                                f"decodes={decodes[0]}")
+
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                events.normalize_event(event)
+            elapsed_us = (time.perf_counter() - started) / args.iterations * 1e6
+            timings.setdefault(shape, []).append(elapsed_us)
+
+    print(f"⏱️  normalize_event over {len(payloads)} payloads x {len(timings)} shapes "
+          f"({args.iterations} iterations each)")
+    for shape, samples in timings.items():
+        print(f"   {shape:20} mean {sum(samples) / len(samples):6.2f} µs  max {max(samples):6.2f} µs")
+    if failures:
+        print("❌ Unexpected results:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print("✅ Every shape decoded to the expected source and city with at most one JSON decode")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Regression check and micro-benchmark for the lambda_direct fact parser.
+
+Runs every case in data/parser-corpus/claude-outputs.json through
+parse_facts() and through FactStreamParser fed in small chunks, verifies
+the extracted facts, and reports the parse cost per case.
+Exits non-zero when any case regresses.
+
+Usage: python3 scripts/benchmark-fact-parser.py [iterations]
+"""
+
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from common.fact_stream import FactStreamParser, parse_facts  # noqa: E402
+
+CORPUS_PATH = os.path.join(REPO_ROOT, 'data', 'parser-corpus', 'claude-outputs.json')
+STREAM_CHUNK_SIZES = (1, 7, 64)
+
+
+def parse_streamed(text, chunk_size):
+    parser = FactStreamParser()
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    return parser.finish()
+
+
+def time_case(text, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse_facts(text)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main(iterations):
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        cases = json.load(f)['cases']
+
+    print(f"🧪 Fact parser corpus: {len(cases)} cases, {iterations} iterations each")
+    print(f"   {'case':28} {'facts':>5} {'µs/parse':>9}  result")
+    failures = 0
+    total_us = 0.0
+    for case in cases:
+        expected = case['expected_facts']
+        problems = []
+        if parse_facts(case['output']) != expected:
+            problems.append('full text')
+        for chunk_size in STREAM_CHUNK_SIZES:
+            if parse_streamed(case['output'], chunk_size) != expected:
+                problems.append(f'stream/{chunk_size}')
+
+        per_parse_us = time_case(case['output'], iterations)
+        total_us += per_parse_us
+        status = '✅' if not problems else f"❌ mismatch: {', '.join(problems)}"
+        failures += bool(problems)
+        print(f"   {case['name']:28} {len(expected):>5} {per_parse_us:>9.1f}  {status}")
+
+    print(f"\n   Mean parse cost: {total_us / len(cases):.1f} µs")
+    if failures:
+        print(f"❌ {failures} case(s) regressed")
+        return 1
+    print("✅ All cases parsed as expected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Compare lambda_direct's classic prompt with compact (tool-use) mode.
+
+For each city both request shapes are sent through invoke_claude_request,
+and the script reports output tokens from the response usage, the
+max_tokens requested, end-to-end latency (invoke plus fact parsing) and
+the number of facts and characters returned.
+
+Offline (default) the stub Bedrock runtime answers; set --token-ms to model
+generation speed (Claude 3 Haiku streams roughly 5-8 ms per output token),
+since output tokens dominate end-to-end latency. With --live the real
+Bedrock runtime in AWS_REGION is called instead and costs apply.
+
+Usage:
+  python3 scripts/benchmark-generation-modes.py [--cities A,B,C] [--token-ms MS]
+      [--fact-count N] [--max-fact-chars N] [--live]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+DEFAULT_CITIES = "Paris,Tokyo,Lima,Oslo,Cairo,Sydney,Toronto,Mumbai"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', default=DEFAULT_CITIES, help='comma-separated city names')
+    parser.add_argument('--latency-ms', type=float, default=250, help='stub time to first byte')
+    parser.add_argument('--token-ms', type=float, default=6, help='stub generation time per output token')
+    parser.add_argument('--fact-count', type=int, default=10)
+    parser.add_argument('--max-fact-chars', type=int, default=160)
+    parser.add_argument('--live', action='store_true', help='call Bedrock instead of the stub')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FACT_CACHE_ENABLED', 'false')
+    os.environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_direct.index as direct
+    if not args.live:
+        from localdev.stub_bedrock import StubBedrockRuntime, install_stubs
+        install_stubs(direct=StubBedrockRuntime(latency_ms=args.latency_ms, token_ms=args.token_ms,
+                                                shape='clean_json'))
+
+    options = {"mode": "compact", "fact_count": args.fact_count, "max_fact_chars": args.max_fact_chars}
+    modes = [
+        ("classic", lambda city: direct.build_claude_request(direct.build_city_prompt(city)),
+         lambda body: direct.extract_facts(body['content'][0]['text'])),
+        ("compact", lambda city: direct.build_compact_request(city, options),
+         lambda body: direct.extract_tool_facts(body, options)),
+    ]
+
+    cities = [city.strip().title() for city in args.cities.split(',') if city.strip()]
+    source = "live Bedrock" if args.live else f"stub, {args.latency_ms} ms + {args.token_ms} ms/token"
+    print(f"✂️  Generation modes: {len(cities)} cities, {source}")
+    results = {}
+    for label, build_request, extract in modes:
+        rows = []
+        for city in cities:
+            request = build_request(city)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                body = direct.invoke_claude_request(request)
+                facts = extract(body)
+            rows.append({
+                "ms": (time.perf_counter() - started) * 1000,
+                "input_tokens": body.get('usage', {}).get('input_tokens', 0),
+                "output_tokens": body.get('usage', {}).get('output_tokens', 0),
+                "max_tokens": request['max_tokens'],
+                "facts": len(facts),
+                "chars": sum(len(fact) for fact in facts),
+            })
+        results[label] = rows
+        print(f"   {label:8} output tokens {statistics.fmean(r['output_tokens'] for r in rows):7.1f}  "
+              f"input tokens {statistics.fmean(r['input_tokens'] for r in rows):6.1f}  "
+              f"max_tokens {rows[0]['max_tokens']:5}  "
+              f"latency {statistics.fmean(r['ms'] for r in rows):7.1f} ms  "
+              f"facts {statistics.fmean(r['facts'] for r in rows):4.1f}  "
+              f"chars/fact {sum(r['chars'] for r in rows) / max(1, sum(r['facts'] for r in rows)):5.1f}")
+
+    classic = statistics.fmean(r['output_tokens'] for r in results['classic'])
+    compact = statistics.fmean(r['output_tokens'] for r in results['compact'])
+    classic_ms = statistics.fmean(r['ms'] for r in results['classic'])
+    compact_ms = statistics.fmean(r['ms'] for r in results['compact'])
+    if classic and classic_ms:
+        print(f"\n   compact mode: {1 - compact / classic:.0%} fewer output tokens, "
+              f"{1 - compact_ms / classic_ms:.0%} lower latency")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
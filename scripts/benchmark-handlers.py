@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for both Lambda handlers against stubbed Bedrock clients.
+
+Drives lambda_direct.index.handler and lambda_agent.index.handler with the
+payloads in data/lambda-tests/*.json plus generated API Gateway, streaming,
+batch and malformed-output scenarios. Reports per-stage latency percentiles,
+throughput and allocations, and compares p50/p95 against the baseline in
+data/benchmarks/handler-baseline.json. Timings depend on the machine, so
+the baseline is generated locally (--update) and git-ignored.
+
+Usage:
+  python3 scripts/benchmark-handlers.py --update      # store a baseline on this machine
+  python3 scripts/benchmark-handlers.py [--iterations N] [--latency-ms MS] [--token-ms MS]
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+BASELINE_PATH = os.path.join(REPO_ROOT, 'data', 'benchmarks', 'handler-baseline.json')
+TEST_EVENTS_DIR = os.path.join(REPO_ROOT, 'data', 'lambda-tests')
+
+# Regressions must exceed both the relative and the absolute slack to fail
+RELATIVE_TOLERANCE = 1.5
+ABSOLUTE_SLACK_MS = 0.2
+
+
+def load_handlers():
+    """
+    Import both handler modules with the fact cache off so every request
+    exercises the Bedrock, parsing and response-building path.
+    """
+    os.environ.setdefault('FACT_CACHE_ENABLED', 'false')
+    os.environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+    os.environ.setdefault('BEDROCK_AGENT_ID', 'STUBAGENT')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_direct.index as direct
+        import lambda_agent.index as agent
+    return direct, agent
+
+
+class StageTimer:
+    """
+    Wraps module-level functions so each call records its duration under a stage name.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._current = None
+        self._originals = []
+
+    def wrap(self, module, function_name, stage):
+        original = getattr(module, function_name)
+        self._originals.append((module, function_name, original))
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._current.setdefault(stage, 0.0)
+                self._current[stage] += (time.perf_counter() - started) * 1000
+
+        setattr(module, function_name, timed)
+
+    def restore(self):
+        for module, function_name, original in reversed(self._originals):
+            setattr(module, function_name, original)
+        self._originals = []
+
+    def start(self):
+        self._current = {}
+
+    def stop(self, total_ms):
+        self._current['total'] = total_ms
+        staged = sum(value for key, value in self._current.items() if key != 'total')
+        self._current['handler_overhead'] = max(0.0, total_ms - staged)
+        for stage, value in self._current.items():
+            self.samples.setdefault(stage, []).append(value)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_scenarios(direct, agent):
+    """
+    Return (name, handler, event, stub_shape) tuples.
+    """
+    scenarios = []
+    for path in sorted(glob.glob(os.path.join(TEST_EVENTS_DIR, '*.json'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            event = json.load(f)
+        if name.startswith('agent-'):
+            scenarios.append((f"file/{name}", agent.handler, event, None))
+        elif name.startswith('direct-'):
+            scenarios.append((f"file/{name}", direct.handler, event, None))
+        else:
+            scenarios.append((f"file/{name}/direct", direct.handler, event, None))
+            scenarios.append((f"file/{name}/agent", agent.handler, event, None))
+
+    api_body = {"body": json.dumps({"city": "Geneva"}), "headers": {"Content-Type": "application/json"}}
+    scenarios += [
+        ("gen/direct-api-gateway", direct.handler, api_body, 'clean_json'),
+        ("gen/direct-query-string", direct.handler, {"queryStringParameters": {"city": "Lisbon"}}, 'clean_json'),
+        ("gen/direct-agent-action-group", direct.handler, {
+            "messageVersion": "1.0", "actionGroup": "CityFactsActionGroup", "apiPath": "/city-facts",
+            "httpMethod": "POST", "requestBody": {"content": {"application/json": {
+                "properties": [{"name": "city", "type": "string", "value": "Oslo"}]}}}}, 'clean_json'),
+        ("gen/direct-leading-prose", direct.handler, {"city": "Vienna"}, 'leading_prose'),
+        ("gen/direct-truncated", direct.handler, {"city": "Madrid"}, 'truncated'),
+        ("gen/direct-numbered-list", direct.handler, {"city": "Prague"}, 'numbered_list'),
+        ("gen/direct-stream", direct.handler, {"city": "Seoul", "stream": True}, 'code_fence'),
+        ("gen/direct-compact", direct.handler, {"city": "Dublin", "compact": True}, None),
+        ("gen/direct-stream-compact", direct.handler, {"city": "Seoul", "stream": True, "fact_count": 5}, None),
+        ("gen/direct-batch-10", direct.handler, {"cities": [
+            "Tokyo", "Paris", "London", "Berlin", "Sydney", "Rome", "Cairo", "Lima", "Oslo", "Tokyo"]}, None),
+        ("gen/agent-api-gateway", agent.handler, {"body": json.dumps({"city": "Zurich"})}, None),
+        ("gen/agent-stream", agent.handler, {"city": "Kyoto", "stream": True}, None),
+        ("gen/agent-trace", agent.handler, {"city": "Kyoto", "trace": True}, None),
+        ("gen/agent-metrics-only", agent.handler, {"city": "Zurich, Switzerland", "metrics_only": True}, None),
+        ("gen/agent-local-retrieval", agent.handler, {"city": "Lisbon", "retrieval": "local"}, 'numbered_list'),
+    ]
+    return scenarios
+
+
+def run_scenario(handler, event, iterations, timer, direct_stub, shape, context):
+    direct_stub.shape = shape
+    sink = io.StringIO()
+    started_wall = time.perf_counter()
+    for _ in range(iterations):
+        timer.start()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sink):
+            response = handler(event, context)
+        timer.stop((time.perf_counter() - started) * 1000)
+        sink.seek(0)
+        sink.truncate()
+    wall_s = time.perf_counter() - started_wall
+
+    # Allocation pass, separate because tracemalloc slows everything down
+    tracemalloc.start()
+    with contextlib.redirect_stdout(sink):
+        before = tracemalloc.take_snapshot()
+        handler(event, context)
+        after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename') if stat.size_diff > 0)
+
+    return {
+        "status": response.get("statusCode", response.get("response", {}).get("httpStatusCode")),
+        "throughput_rps": round(iterations / wall_s, 1) if wall_s else None,
+        "peak_kb": round(peak / 1024, 1),
+        "allocated_kb": round(allocated / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='stub time to first byte')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='stub delay per streamed token')
+    parser.add_argument('--only', help='run scenarios whose name contains this text')
+    parser.add_argument('--update', action='store_true', help='store results as the new baseline')
+    args = parser.parse_args()
+
+    direct, agent = load_handlers()
+    from localdev.stub_bedrock import StubBedrockAgentRuntime, StubBedrockRuntime, install_stubs
+    direct_stub, _ = install_stubs(
+        StubBedrockRuntime(latency_ms=args.latency_ms, token_ms=args.token_ms),
+        StubBedrockAgentRuntime(latency_ms=args.latency_ms, chunk_ms=args.token_ms)
+    )
+
+    context = types.SimpleNamespace(aws_request_id='benchmark', get_remaining_time_in_millis=lambda: 30000)
+    results = {}
+    print(f"🏁 Handler benchmark: {args.iterations} iterations, stub latency {args.latency_ms} ms, "
+          f"{args.token_ms} ms/token")
+    for name, handler, event, shape in build_scenarios(direct, agent):
+        if args.only and args.only not in name:
+            continue
+        timer = StageTimer()
+        for module, function_name, stage in [
+            (direct, 'normalize_event', 'event_parsing'),
+            (direct, 'invoke_claude_request', 'bedrock_invoke'),
+            (direct, 'extract_facts', 'response_parsing'),
+            (direct, 'extract_tool_facts', 'response_parsing'),
+            (agent, 'normalize_event', 'event_parsing'),
+            (agent, 'invoke_bedrock_agent', 'bedrock_invoke'),
+        ]:
+            timer.wrap(module, function_name, stage)
+
+        summary = run_scenario(handler, event, args.iterations, timer, direct_stub, shape, context)
+        stages = {
+            stage: {"p50": round(percentile(values, 50), 3), "p95": round(percentile(values, 95), 3),
+                    "p99": round(percentile(values, 99), 3), "mean": round(statistics.fmean(values), 3)}
+            for stage, values in timer.samples.items()
+        }
+        results[name] = dict(summary, stages=stages)
+
+        timer.restore()
+
+        print(f"\n   {name}  status={summary['status']}  {summary['throughput_rps']} req/s  "
+              f"peak {summary['peak_kb']} KB  allocated {summary['allocated_kb']} KB")
+        for stage, values in sorted(stages.items(), key=lambda item: item[0] != 'total'):
+            print(f"      {stage:18} p50 {values['p50']:8.3f} ms  p95 {values['p95']:8.3f} ms  "
+                  f"p99 {values['p99']:8.3f} ms")
+
+    if args.update:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({"iterations": args.iterations, "latency_ms": args.latency_ms,
+                       "token_ms": args.token_ms, "scenarios": results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n📝 Baseline written to {BASELINE_PATH}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("\n⚠️  No baseline on this machine yet; run with --update (before your change) to create one")
+        return 0
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    if (baseline.get('latency_ms'), baseline.get('token_ms')) != (args.latency_ms, args.token_ms):
+        print("\n⚠️  Stub latency differs from the baseline run; skipping regression check")
+        return 0
+
+    regressions = []
+    for name, result in results.items():
+        for stage, values in result['stages'].items():
+            base = baseline['scenarios'].get(name, {}).get('stages', {}).get(stage)
+            if not base:
+                continue
+            for pct in ('p50', 'p95'):
+                limit = max(base[pct] * RELATIVE_TOLERANCE, base[pct] + ABSOLUTE_SLACK_MS)
+                if values[pct] > limit:
+                    regressions.append(f"{name} {stage} {pct}: {values[pct]:.3f} ms > {limit:.3f} ms "
+                                       f"(baseline {base[pct]:.3f} ms)")
+    if regressions:
+        print("\n❌ Performance regressions:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print("\n✅ No regressions against the stored baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Relevance and latency check for the local retrieval index.
+
+Builds the index from data/knowledge-base with the deterministic hashing
+embedder, saves and memory-maps it like the Lambda does, then runs
+"<city> <topic>" queries for a fixed sample of cities in each scoring mode.
+Reports hit rate@k (the city's own passage is in the top k), query latency
+percentiles and load time. The sample and embeddings are deterministic, so
+hit rates only change when the corpus, tokenizer or scoring changes.
+
+Usage:
+  python3 scripts/benchmark-retrieval.py [--queries N] [--k K] [--index PATH]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from common.retrieval import (INDEX_FILENAME, SCORING_MODES, RetrievalIndex,  # noqa: E402
+                              build_retrieval_index, load_numpy)
+
+TOPICS = ["air quality", "water pollution", "cost of living", "rent index", "groceries"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--index', help='existing retrieval_index.json instead of building one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.index
+        if path is None:
+            started = time.perf_counter()
+            built = build_retrieval_index(os.path.join(REPO_ROOT, 'data', 'knowledge-base'))
+            path = os.path.join(workdir, INDEX_FILENAME)
+            built.save(path)
+            print(f"🔎 Built {len(built)} passages in {(time.perf_counter() - started) * 1000:.0f} ms")
+        started = time.perf_counter()
+        index = RetrievalIndex.load(path)
+        print(f"   Loaded (memory-mapped) in {(time.perf_counter() - started) * 1000:.1f} ms; "
+              f"vector search via {'NumPy' if load_numpy() else 'pure Python'}, "
+              f"{index.dim}-dim {index.embedder.name} embeddings")
+
+        rng = random.Random(7)
+        cities = [doc for doc, passage in enumerate(index.passages) if passage["source"] == "city_metrics"]
+        sample = rng.sample(cities, min(args.queries, len(cities)))
+        queries = []
+        for doc in sample:
+            city = index.passages[doc]["title"].split(',')[0]
+            queries.append((doc, city, f"{city} {rng.choice(TOPICS)}"))
+
+        for mode in SCORING_MODES:
+            latencies = []
+            hits = 0
+            for doc, city, query in queries:
+                started = time.perf_counter()
+                results = index.search(query, k=args.k, mode=mode)
+                latencies.append((time.perf_counter() - started) * 1000)
+                # Same-named cities (Paris, France / Paris, Texas) count as a hit
+                hits += any(r["id"] == doc or r["title"].split(',')[0] == city for r in results)
+            print(f"   {mode:7} hit@{args.k} {hits / len(queries):6.1%}  p50 {percentile(latencies, 50):6.2f} ms  "
+                  f"p95 {percentile(latencies, 95):6.2f} ms")
+        index = None
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
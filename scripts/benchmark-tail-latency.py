@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tail-latency benchmark for lambda_direct.invoke_claude against the offline stub.
+
+The stub answers in --latency-ms, except for a --tail-rate fraction of calls
+that take an extra --tail-ms, and throttles --error-rate of calls. Each
+configuration (plain, retries only, hedged) is run for the same number of
+requests and p50/p95/p99 plus Bedrock call counts are reported, so the cost
+of hedging (extra calls) can be weighed against the p99 it saves.
+
+Usage:
+  python3 scripts/benchmark-tail-latency.py [--requests N] [--latency-ms MS]
+      [--tail-rate F] [--tail-ms MS] [--error-rate F] [--concurrency N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--tail-rate', type=float, default=0.03)
+    parser.add_argument('--tail-ms', type=float, default=800)
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ.setdefault('FACT_CACHE_ENABLED', 'false')
+    os.environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_direct.index as direct
+    from common.bedrock_invoke import InvokePolicy, ResilientInvoker
+    from localdev.stub_bedrock import StubBedrockRuntime, install_stubs
+
+    configurations = [
+        ("single attempt", InvokePolicy(max_attempts=1)),
+        ("retries", InvokePolicy(backoff_base_ms=20)),
+        ("retries + hedge", InvokePolicy(backoff_base_ms=20, hedge_enabled=True,
+                                         hedge_min_samples=20, hedge_default_delay_ms=args.latency_ms * 3)),
+    ]
+
+    print(f"🐢 Tail latency: {args.requests} requests, {args.latency_ms} ms typical, "
+          f"{args.tail_rate:.0%} at +{args.tail_ms} ms, {args.error_rate:.0%} throttled")
+    prompt = direct.build_city_prompt("Paris")
+    for label, policy in configurations:
+        stub = StubBedrockRuntime(latency_ms=args.latency_ms, shape='clean_json', error_rate=args.error_rate,
+                                  tail_rate=args.tail_rate, tail_ms=args.tail_ms, seed=7)
+        install_stubs(direct=stub)
+        direct.claude_invoker = ResilientInvoker(policy)
+
+        def one_request(_):
+            started = time.perf_counter()
+            try:
+                direct.invoke_claude(prompt)
+                ok = True
+            except Exception:
+                ok = False
+            return (time.perf_counter() - started) * 1000, ok
+
+        # Redirect once around the pool; redirect_stdout is process-wide, not per thread
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one_request, range(args.requests)))
+        latencies = [ms for ms, _ in results]
+        failures = sum(1 for _, ok in results if not ok)
+        print(f"   {label:16} p50 {percentile(latencies, 50):7.1f} ms  p95 {percentile(latencies, 95):7.1f} ms  "
+              f"p99 {percentile(latencies, 99):7.1f} ms  failed {failures:3}  "
+              f"Bedrock calls {stub.calls} ({stub.calls / args.requests:.2f}/request)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
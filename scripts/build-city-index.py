@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Build the compact city metrics index packaged with both Lambda functions,
+then check that known spellings canonicalize as expected (the build fails
+otherwise)
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from common.city_index import INDEX_FILENAME, build_city_index, canonicalize_from_index  # noqa: E402
+
+# (requested name, expected city ID, expected match). Real cities missing from the
+# dataset must keep their own name, never become the nearest spelling of another city.
+CANONICALIZATION_CHECKS = [
+    ("NYC", "new-york-city:united-states-of-america", "alias"),
+    ("new york", "new-york-city:united-states-of-america", "exact"),
+    ("Zürich", "zurich:switzerland", "exact"),
+    ("St Louis", "saint-louis:united-states-of-america", "alias"),
+    ("Portland, ME", "portland:maine:united-states-of-america", "exact"),
+    ("Hamilton, Bermuda", "hamilton:bermuda", "exact"),
+    ("Paris, Texas", "paris-texas", None),
+    ("Berln", "berln", "fuzzy"),
+    ("Macau", "macau", "fuzzy"),
+    ("Sparta", "sparta", "fuzzy"),
+    ("Metropolis", "metropolis", "fuzzy"),
+    ("Mars", "mars", "fuzzy"),
+    ("Narnia", "narnia", "fuzzy"),
+    ("Atlantis", "atlantis", None),
+]
+
+
+def check_canonicalization(index):
+    """
+    Failed checks as "name: got ..., expected ..." strings.
+    """
+    failures = []
+    for name, expected_id, expected_match in CANONICALIZATION_CHECKS:
+        city = canonicalize_from_index(index, name)
+        if (city.id, city.match) != (expected_id, expected_match):
+            failures.append(f"{name}: got {city.id} ({city.match}), expected {expected_id} ({expected_match})")
+    return failures
+
+
+def main(output_path, data_dir):
+    print(f"🗂️  Building city index from {data_dir}...")
+    started = time.perf_counter()
+    index = build_city_index(data_dir)
+    index.save(output_path)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✅ Indexed {len(index)} cities ({len(index.keys)} lookup keys) in {elapsed_ms:.0f} ms")
+    print(f"   Output: {output_path} ({os.path.getsize(output_path) // 1024} KB)")
+    failures = check_canonicalization(index)
+    for failure in failures:
+        print(f"   ❌ {failure}")
+    if failures:
+        return 1
+    print(f"✅ {len(CANONICALIZATION_CHECKS)} canonicalization checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    output = sys.argv[1] if len(sys.argv) > 1 else INDEX_FILENAME
+    data = sys.argv[2] if len(sys.argv) > 2 else os.path.join(repo_root, 'data', 'knowledge-base')
+    sys.exit(main(output, data))
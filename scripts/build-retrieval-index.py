@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Build the local retrieval index (passages, BM25 postings and embedding
+matrix) packaged with the agent Lambda
+
+Usage:
+  python3 scripts/build-retrieval-index.py [output.json] [data_dir]
+
+RETRIEVAL_EMBEDDER=titan embeds passages with Titan Text Embeddings V2
+(needs Bedrock access); the default hashing embedder runs offline.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from common.retrieval import INDEX_FILENAME, VECTORS_FILENAME, TitanEmbedder, build_retrieval_index  # noqa: E402
+
+
+def main(output_path, data_dir):
+    embedder = TitanEmbedder() if os.environ.get('RETRIEVAL_EMBEDDER', 'hashing') == 'titan' else None
+    print(f"🔎 Building retrieval index from {data_dir}...")
+    started = time.perf_counter()
+    index = build_retrieval_index(data_dir, embedder)
+    index.save(output_path)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    vectors_path = os.path.join(os.path.dirname(output_path) or '.', VECTORS_FILENAME)
+    print(f"✅ Indexed {len(index)} passages ({len(index.postings)} terms, {index.dim}-dim "
+          f"{index.embedder.name} embeddings) in {elapsed_ms:.0f} ms")
+    print(f"   Output: {output_path} ({os.path.getsize(output_path) // 1024} KB), "
+          f"{vectors_path} ({os.path.getsize(vectors_path) // 1024} KB)")
+    if embedder is None:
+        print("   ⚠️  Hashing embeddings are lexical, so this index searches with BM25 unless "
+              "RETRIEVAL_SCORING opts in (set RETRIEVAL_EMBEDDER=titan for semantic hybrid search)")
+
+
+if __name__ == "__main__":
+    repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    output = sys.argv[1] if len(sys.argv) > 1 else INDEX_FILENAME
+    data = sys.argv[2] if len(sys.argv) > 2 else os.path.join(repo_root, 'data', 'knowledge-base')
+    main(output, data)
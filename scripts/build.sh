@@ -1,28 +1,85 @@
 #!/bin/bash
 
 # Build script for Lambda functions
-echo "Building Lambda functions..."
+# Usage: ./scripts/build.sh [direct|agent|compare|all]
+# deploy-direct.sh and deploy-agent.sh build their package through this script,
+# so every deploy path ships the same artifacts
+TARGET=${1:-all}
+case "$TARGET" in
+    direct|agent|compare|all) ;;
+    *) echo "Usage: $0 [direct|agent|compare|all]"; exit 1 ;;
+esac
 
-# Create build directory
-mkdir -p build_direct build_agent
+# Facts from scripts/precompute-facts.py, served before calling Bedrock
+PRECOMPUTED_FACTS=${PRECOMPUTED_FACTS:-data/precomputed/precomputed_facts.bin}
 
 # Build direct model access Lambda
-echo "Building direct model access Lambda..."
-cp src/lambda_direct/index.py build_direct/
-cd build_direct
-zip -r ../city_facts_direct.zip .
-cd ..
+build_direct() {
+    echo "Building direct model access Lambda..."
+    mkdir -p build_direct
+    cp src/lambda_direct/*.py build_direct/
+    cp -r src/common build_direct/
+    python3 scripts/build-city-index.py build_direct/city_index.json || exit 1
+    if [ -f "$PRECOMPUTED_FACTS" ]; then
+        cp "$PRECOMPUTED_FACTS" build_direct/precomputed_facts.bin
+    fi
+    cd build_direct
+    zip -r ../city_facts_direct.zip . -x "*__pycache__*"
+    cd ..
+    rm -rf build_direct
+}
 
 # Build agent-based Lambda
-echo "Building agent-based Lambda..."
-cp src/lambda_agent/index.py build_agent/
-cd build_agent
-zip -r ../city_facts_agent.zip .
-cd ..
+build_agent() {
+    echo "Building agent-based Lambda..."
+    mkdir -p build_agent
+    cp src/lambda_agent/*.py build_agent/
+    cp -r src/common build_agent/
+    python3 scripts/build-city-index.py build_agent/city_index.json || exit 1
+    python3 scripts/build-retrieval-index.py build_agent/retrieval_index.json || exit 1
+    cd build_agent
+    zip -r ../city_facts_agent.zip . -x "*__pycache__*"
+    cd ..
+    rm -rf build_agent
+}
+
+# Build comparison Lambda: both paths' modules as packages next to its own index.py
+build_compare() {
+    echo "Building comparison Lambda..."
+    mkdir -p build_compare/lambda_direct build_compare/lambda_agent
+    cp src/lambda_compare/*.py build_compare/
+    cp src/lambda_direct/*.py build_compare/lambda_direct/
+    cp src/lambda_agent/*.py build_compare/lambda_agent/
+    cp -r src/common build_compare/
+    python3 scripts/build-city-index.py build_compare/city_index.json || exit 1
+    python3 scripts/build-retrieval-index.py build_compare/retrieval_index.json || exit 1
+    if [ -f "$PRECOMPUTED_FACTS" ]; then
+        cp "$PRECOMPUTED_FACTS" build_compare/precomputed_facts.bin
+    fi
+    cd build_compare
+    zip -r ../city_facts_compare.zip . -x "*__pycache__*"
+    cd ..
+    rm -rf build_compare
+}
 
-# Clean up build directories
-rm -rf build_direct build_agent
+echo "Building Lambda functions..."
+if [ "$TARGET" = "direct" ] || [ "$TARGET" = "all" ]; then
+    build_direct
+fi
+if [ "$TARGET" = "agent" ] || [ "$TARGET" = "all" ]; then
+    build_agent
+fi
+if [ "$TARGET" = "compare" ] || [ "$TARGET" = "all" ]; then
+    build_compare
+fi
 
 echo "Lambda functions packaged:"
-echo "- city_facts_direct.zip (direct model access)"
-echo "- city_facts_agent.zip (Bedrock agent)"
\ No newline at end of file
+if [ "$TARGET" = "direct" ] || [ "$TARGET" = "all" ]; then
+    echo "- city_facts_direct.zip (direct model access)"
+fi
+if [ "$TARGET" = "agent" ] || [ "$TARGET" = "all" ]; then
+    echo "- city_facts_agent.zip (Bedrock agent)"
+fi
+if [ "$TARGET" = "compare" ] || [ "$TARGET" = "all" ]; then
+    echo "- city_facts_compare.zip (direct and agent paths concurrently)"
+fi
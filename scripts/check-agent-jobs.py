@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the async agent job lifecycle.
+
+Runs lambda_agent.index.handler against the in-memory job store and the
+stubbed Bedrock clients, with no AWS calls:
+
+- a dispatch that raises leaves the job "failed" with the dispatch error,
+  and the client sees that error instead of a KeyError
+- concurrent workers claim a queued job exactly once
+
+Exits with status 1 when any check fails.
+
+Usage:
+  python3 scripts/check-agent-jobs.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import types
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+CONTEXT = types.SimpleNamespace(
+    aws_request_id='check-agent-jobs', function_name='city-facts-agent', memory_limit_in_mb=256,
+    get_remaining_time_in_millis=lambda: 60000)
+
+
+def load_agent():
+    os.environ['AGENT_JOB_STORE'] = 'memory'
+    os.environ['AGENT_JOB_DISPATCH'] = 'thread'
+    os.environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+    os.environ.setdefault('BEDROCK_AGENT_ID', 'STUBAGENT')
+    from localdev.stub_bedrock import install_stubs
+    with contextlib.redirect_stdout(io.StringIO()):
+        install_stubs()
+        import lambda_agent.index as agent
+    return agent
+
+
+class FailingDispatcher:
+    def dispatch(self, job_id, context, run):
+        raise RuntimeError("stub dispatcher is down")
+
+
+def check_failed_dispatch(agent):
+    dispatcher = agent.job_dispatcher
+    agent.job_dispatcher = FailingDispatcher()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = agent.handler({"city": "Tokyo", "async": True}, CONTEXT)
+    finally:
+        agent.job_dispatcher = dispatcher
+    body = json.loads(response["body"])
+    failures = []
+    if "stub dispatcher is down" not in body.get("message", ''):
+        failures.append(f"client error hides the dispatch failure: {body}")
+    job = agent.job_store.get(body["job_id"]) if body.get("job_id") else None
+    if job is None or job["status"] != "failed":
+        failures.append(f"job not marked failed: {job and job['status']}")
+    elif "stub dispatcher is down" not in job["error"].get("message", ''):
+        failures.append(f"job error hides the dispatch failure: {job['error']}")
+    return failures
+
+
+def check_single_claim(agent):
+    from common.agent_jobs import JobProgress, new_job
+    job = new_job({"city": "Tokyo"})
+    agent.job_store.create(job)
+    claims = []
+    barrier = threading.Barrier(8)
+
+    def claim():
+        barrier.wait()
+        claims.append(JobProgress(agent.job_store, dict(job, progress=dict(job["progress"]))).start())
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [] if claims.count(True) == 1 else [f"{claims.count(True)} workers claimed one job"]
+
+
+CHECKS = (
+    ("failed dispatch", check_failed_dispatch),
+    ("single claim", check_single_claim),
+)
+
+
+def main():
+    agent = load_agent()
+    failed = 0
+    for name, check in CHECKS:
+        failures = check(agent)
+        print(f"{'✅' if not failures else '❌'} {name}")
+        for failure in failures:
+            print(f"   {failure}")
+        failed += bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
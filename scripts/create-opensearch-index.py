@@ -1,40 +1,77 @@
 #!/usr/bin/env python3
 """
-Create OpenSearch Serverless vector index for Bedrock Knowledge Base
+Create OpenSearch Serverless vector index for Bedrock Knowledge Base,
+and optionally ingest the knowledge-base data into it directly.
+
+Ingestion (--ingest) replaces the data-source sync's FIXED_SIZE chunking
+(300-token windows cut across CSV rows) with row-aware chunks: one per
+city with its air-quality and cost-of-living records joined, and one per
+overview section. Each chunk carries a content hash, so re-running only
+embeds new or changed chunks and deletes the stale ones.
+
+Only documents this script wrote (those with a chunk_id) are ever deleted.
+The data sources in terraform/bedrock_knowledge_base_simple.tf still sync
+into the same index with FIXED_SIZE chunking; their documents have no
+chunk_id and are left alone, with a warning, so a sync and this pipeline
+never delete each other's documents. Pick one writer per deployment
+(KB_INGESTION in deploy-complete.sh) to avoid duplicate passages. Embedding calls
+run in batches with bounded concurrency (retried with jittered backoff)
+while earlier batches are written with the _bulk API.
+
+Usage:
+  python3 create-opensearch-index.py <collection-endpoint>             # create the index
+  python3 create-opensearch-index.py <collection-endpoint> --ingest    # create and ingest
+  python3 create-opensearch-index.py --stub /tmp/kb.pkl --ingest       # offline, local stub
 """
 
+import argparse
+import hashlib
 import json
+import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-try:
-    from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-    import boto3
-except ImportError:
-    print("❌ Error: Required Python packages not installed")
-    print("   Install with: pip3 install opensearch-py boto3")
-    sys.exit(1)
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
 
+from common.bedrock_invoke import InvokePolicy, ResilientInvoker  # noqa: E402
+from common.city_index import build_city_index, normalize_name  # noqa: E402
+from common.retrieval import HashingEmbedder, TitanEmbedder, build_corpus  # noqa: E402
+
+DEFAULT_INDEX = "bedrock-knowledge-base-default-index"
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+EMBEDDING_DIMENSION = 1536
+# Chunk size configured on the knowledge base data sources (FIXED_SIZE)
+FIXED_SIZE_CHUNK_TOKENS = 300
+# OpenSearch's default max_result_window; the stored hashes are read in one page
+MAX_EXISTING = 10000
+CITY_METRICS_URI = "city-metrics.csv"
+
+
+def make_client(collection_endpoint):
+    """
+    SigV4-signed OpenSearch Serverless client for the collection endpoint.
+    """
+    try:
+        from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+        import boto3
+    except ImportError:
+        print("❌ Error: Required Python packages not installed")
+        print("   Install with: pip3 install opensearch-py boto3")
+        sys.exit(1)
 
-def create_index(collection_endpoint, index_name="bedrock-knowledge-base-default-index"):
-    """Create vector index in OpenSearch Serverless collection"""
-    
-    print(f"🔍 Creating OpenSearch vector index...")
-    print(f"   Endpoint: {collection_endpoint}")
-    print(f"   Index: {index_name}")
-    
     # Get AWS credentials
     session = boto3.Session()
     credentials = session.get_credentials()
     region = session.region_name or 'us-east-1'
-    
+
     auth = AWSV4SignerAuth(credentials, region, 'aoss')
-    
+
     # Parse endpoint
     host = collection_endpoint.replace('https://', '').replace('http://', '')
-    
-    # Create client
-    client = OpenSearch(
+
+    return OpenSearch(
         hosts=[{'host': host, 'port': 443}],
         http_auth=auth,
         use_ssl=True,
@@ -42,7 +79,14 @@ def create_index(collection_endpoint, index_name="bedrock-knowledge-base-default
         connection_class=RequestsHttpConnection,
         timeout=300
     )
-    
+
+
+def create_index(client, index_name=DEFAULT_INDEX, dimension=EMBEDDING_DIMENSION):
+    """Create vector index in OpenSearch Serverless collection"""
+
+    print(f"🔍 Creating OpenSearch vector index...")
+    print(f"   Index: {index_name}")
+
     # Index configuration
     index_body = {
         "settings": {
@@ -56,7 +100,7 @@ def create_index(collection_endpoint, index_name="bedrock-knowledge-base-default
             "properties": {
                 "embeddings": {
                     "type": "knn_vector",
-                    "dimension": 1536,
+                    "dimension": dimension,
                     "method": {
                         "name": "hnsw",
                         "space_type": "l2",
@@ -69,22 +113,29 @@ def create_index(collection_endpoint, index_name="bedrock-knowledge-base-default
                 "bedrock-metadata": {
                     "type": "text",
                     "index": False
+                },
+                # Written by --ingest for incremental re-ingestion
+                "chunk_id": {
+                    "type": "keyword"
+                },
+                "content_hash": {
+                    "type": "keyword"
                 }
             }
         }
     }
-    
+
     try:
         # Check if exists
         if client.indices.exists(index=index_name):
             print(f"✅ Index '{index_name}' already exists")
             return True
-        
+
         # Create index
-        response = client.indices.create(index=index_name, body=index_body)
+        client.indices.create(index=index_name, body=index_body)
         print(f"✅ Index '{index_name}' created successfully")
         return True
-        
+
     except Exception as e:
         if "resource_already_exists" in str(e).lower():
             print(f"✅ Index '{index_name}' already exists")
@@ -93,11 +144,255 @@ def create_index(collection_endpoint, index_name="bedrock-knowledge-base-default
         return False
 
 
+def estimate_tokens(text):
+    # ~4 characters per token for English text and numbers
+    return max(1, len(text) // 4)
+
+
+def build_chunks(data_dir, embedding_key):
+    """
+    Row-aware chunks with stable IDs ("city:zurich-switzerland",
+    "overview:air-quality") and a hash over the embedding model and text.
+    """
+    passages = build_corpus(data_dir, build_city_index(data_dir))
+    chunks = []
+    seen = {}
+    for passage in passages:
+        prefix = 'city' if passage["source"] == "city_metrics" else 'overview'
+        chunk_id = f"{prefix}:{normalize_name(passage['title']).replace(' ', '-')}"
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        if seen[chunk_id] > 1:
+            chunk_id = f"{chunk_id}-{seen[chunk_id]}"
+        digest = hashlib.sha256(f"{embedding_key}\n{passage['text']}".encode('utf-8')).hexdigest()
+        chunks.append({
+            "chunk_id": chunk_id,
+            "title": passage["title"],
+            "source": CITY_METRICS_URI if prefix == 'city' else passage["source"],
+            "text": passage["text"],
+            "content_hash": digest,
+        })
+    return chunks
+
+
+def fetch_existing(client, index_name):
+    """
+    {chunk_id: [(document _id, content_hash), ...]} for the documents
+    already in the index. Documents without a chunk_id (written by a
+    data-source sync, not this script) are returned under None.
+    """
+    response = client.search(index=index_name, body={
+        "size": MAX_EXISTING,
+        "query": {"match_all": {}},
+        "_source": ["chunk_id", "content_hash"],
+    })
+    total = response["hits"]["total"]["value"]
+    if total > MAX_EXISTING:
+        raise RuntimeError(f"Index holds {total} documents; incremental ingestion reads at most {MAX_EXISTING}")
+    existing = {}
+    for hit in response["hits"]["hits"]:
+        source = hit.get("_source", {})
+        existing.setdefault(source.get("chunk_id"), []).append((hit["_id"], source.get("content_hash")))
+    return existing
+
+
+def plan_ingestion(chunks, existing):
+    """
+    Split chunks into (to_embed, stale document _ids, unchanged count).
+    A changed chunk is re-embedded and its old document deleted. Documents
+    without a chunk_id belong to a data-source sync and are never stale.
+    """
+    to_embed = []
+    stale_ids = []
+    unchanged = 0
+    wanted = set()
+    for chunk in chunks:
+        wanted.add(chunk["chunk_id"])
+        documents = existing.get(chunk["chunk_id"], [])
+        current = [doc_id for doc_id, digest in documents if digest == chunk["content_hash"]]
+        if current:
+            unchanged += 1
+            # Duplicates left by an interrupted run
+            stale_ids.extend(current[1:])
+        else:
+            to_embed.append(chunk)
+        stale_ids.extend(doc_id for doc_id, digest in documents if digest != chunk["content_hash"])
+    for chunk_id, documents in existing.items():
+        if chunk_id is not None and chunk_id not in wanted:
+            stale_ids.extend(doc_id for doc_id, _ in documents)
+    return to_embed, stale_ids, unchanged
+
+
+def make_embed_call(embedder, invoker):
+    """
+    embed(text) retried on Bedrock throttling with jittered backoff.
+    """
+    model_id = getattr(embedder, 'model_id', embedder.name)
+
+    def embed(text):
+        return invoker.invoke(lambda _model_id: embedder.embed(text), model_id)
+    return embed
+
+
+def document_for(chunk, vector, source_uri_prefix):
+    return {
+        "embeddings": [float(value) for value in vector],
+        "text": chunk["text"],
+        "chunk_id": chunk["chunk_id"],
+        "content_hash": chunk["content_hash"],
+        "bedrock-metadata": json.dumps({
+            "source": f"{source_uri_prefix}{chunk['source']}",
+            "x-amz-bedrock-kb-source-uri": f"{source_uri_prefix}{chunk['source']}",
+            "title": chunk["title"],
+        }),
+    }
+
+
+def send_bulk(client, index_name, lines):
+    """
+    POST one _bulk body and raise if any item failed. Deletes of
+    documents that are already gone are not failures.
+    """
+    response = client.bulk(body='\n'.join(lines) + '\n', index=index_name)
+    if response.get("errors"):
+        failures = [item for item in response["items"]
+                    for operation, result in item.items()
+                    if result.get("status", 200) >= 300 and not (operation == 'delete' and result["status"] == 404)]
+        if failures:
+            raise RuntimeError(f"{len(failures)} bulk item(s) failed, first: {json.dumps(failures[0])}")
+    return len(response["items"])
+
+
+def ingest(client, index_name, data_dir, embedder, embedding_key, batch_size=64, concurrency=8,
+           bulk_size=500, source_uri_prefix="", dry_run=False):
+    """
+    Chunk, diff, embed and bulk-index the knowledge-base data. Returns a
+    stats dict.
+    """
+    started = time.perf_counter()
+    chunks = build_chunks(data_dir, embedding_key)
+    existing = fetch_existing(client, index_name)
+    to_embed, stale_ids, unchanged = plan_ingestion(chunks, existing)
+    if existing.get(None):
+        print(f"⚠️  {len(existing[None])} documents from a data-source sync are also in {index_name}; "
+              f"they are kept, so passages may be duplicated")
+    stats = {"chunks": len(chunks), "embedded": 0, "unchanged": unchanged, "deleted": 0, "bulk_requests": 0,
+             "avg_chunk_tokens": sum(estimate_tokens(c["text"]) for c in chunks) / max(1, len(chunks))}
+    print(f"📦 {len(chunks)} chunks: {len(to_embed)} to embed, {unchanged} unchanged, {len(stale_ids)} stale")
+    if dry_run:
+        stats["elapsed_s"] = time.perf_counter() - started
+        return stats
+
+    invoker = ResilientInvoker(InvokePolicy(max_attempts=6, attempt_timeout_ms=30000, backoff_base_ms=200,
+                                            backoff_max_ms=5000), max_workers=concurrency * 2)
+    embed = make_embed_call(embedder, invoker)
+    lines = []
+
+    def flush():
+        if lines:
+            send_bulk(client, index_name, lines)
+            stats["bulk_requests"] += 1
+            lines.clear()
+
+    # New documents are written before stale ones are deleted, so a
+    # changed chunk is never missing from the index
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='embed') as pool:
+        for start in range(0, len(to_embed), batch_size):
+            batch = to_embed[start:start + batch_size]
+            for chunk, vector in zip(batch, pool.map(embed, [chunk["text"] for chunk in batch])):
+                lines.append(json.dumps({"index": {"_index": index_name}}))
+                lines.append(json.dumps(document_for(chunk, vector, source_uri_prefix)))
+                stats["embedded"] += 1
+                if len(lines) >= bulk_size * 2:
+                    flush()
+            print(f"   Embedded {stats['embedded']}/{len(to_embed)}")
+    flush()
+
+    for doc_id in stale_ids:
+        lines.append(json.dumps({"delete": {"_index": index_name, "_id": doc_id}}))
+        stats["deleted"] += 1
+        if len(lines) >= bulk_size:
+            flush()
+    flush()
+    stats["elapsed_s"] = time.perf_counter() - started
+    return stats
+
+
+def print_summary(stats, top_k=5):
+    print(f"✅ Ingestion complete in {stats['elapsed_s']:.1f}s")
+    print(f"   Embedded: {stats['embedded']}, unchanged: {stats['unchanged']}, deleted: {stats['deleted']}, "
+          f"bulk requests: {stats['bulk_requests']}")
+    average = stats["avg_chunk_tokens"]
+    print(f"   Chunk size: ~{average:.0f} tokens (FIXED_SIZE chunks: up to {FIXED_SIZE_CHUNK_TOKENS})")
+    print(f"   Context per {top_k}-result retrieval: ~{average * top_k:.0f} tokens "
+          f"(FIXED_SIZE: up to {FIXED_SIZE_CHUNK_TOKENS * top_k})")
+
+
+def run_query(client, index_name, embedder, query, k=5):
+    vector = [float(value) for value in embedder.embed(query)]
+    started = time.perf_counter()
+    response = client.search(index=index_name, body={
+        "size": k,
+        "query": {"knn": {"embeddings": {"vector": vector, "k": k}}},
+        "_source": ["chunk_id", "text"],
+    })
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    hits = response["hits"]["hits"]
+    tokens = sum(estimate_tokens(hit["_source"]["text"]) for hit in hits)
+    print(f"🔎 '{query}': {len(hits)} results, ~{tokens} context tokens, {elapsed_ms:.0f} ms")
+    for hit in hits:
+        print(f"   {hit['_score']:.4f}  {hit['_source']['chunk_id']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('endpoint', nargs='?', help='OpenSearch Serverless collection endpoint')
+    parser.add_argument('--index', default=DEFAULT_INDEX)
+    parser.add_argument('--ingest', action='store_true', help='chunk, embed and bulk-index the data')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_ROOT, 'data', 'knowledge-base'))
+    parser.add_argument('--batch-size', type=int, default=64, help='chunks per embedding batch')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent embedding calls')
+    parser.add_argument('--bulk-size', type=int, default=500, help='actions per _bulk request')
+    parser.add_argument('--embedding-model', default=EMBEDDING_MODEL_ID)
+    parser.add_argument('--dimension', type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument('--source-uri-prefix', default='',
+                        help='prefix for the source URI in chunk metadata, e.g. s3://<bucket>/')
+    parser.add_argument('--stub', nargs='?', const='', metavar='STATE_PATH',
+                        help='use the local OpenSearch stub and hashing embedder (state kept in STATE_PATH)')
+    parser.add_argument('--query', help='run a knn query after ingesting')
+    parser.add_argument('--dry-run', action='store_true', help='report the ingestion plan only')
+    args = parser.parse_args()
+
+    if args.stub is not None:
+        from localdev.stub_opensearch import StubOpenSearch
+
+        client = StubOpenSearch(args.stub or None)
+        embedder = HashingEmbedder(args.dimension)
+        embedding_key = f"hashing-{args.dimension}"
+        print(f"🧪 Using the local OpenSearch stub{f' ({args.stub})' if args.stub else ''}")
+    elif args.endpoint:
+        print(f"   Endpoint: {args.endpoint}")
+        client = make_client(args.endpoint)
+        embedder = TitanEmbedder(args.dimension, args.embedding_model)
+        embedding_key = f"{args.embedding_model}-{args.dimension}"
+    else:
+        parser.print_usage()
+        return 1
+
+    if not create_index(client, args.index, args.dimension):
+        return 1
+    if args.ingest:
+        try:
+            stats = ingest(client, args.index, args.data_dir, embedder, embedding_key, args.batch_size,
+                           args.concurrency, args.bulk_size, args.source_uri_prefix, args.dry_run)
+        except Exception as e:
+            print(f"❌ Ingestion failed: {e}")
+            return 1
+        if not args.dry_run:
+            print_summary(stats)
+    if args.query:
+        run_query(client, args.index, embedder, args.query)
+    return 0
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 create-opensearch-index.py <collection-endpoint>")
-        sys.exit(1)
-    
-    endpoint = sys.argv[1]
-    success = create_index(endpoint)
-    sys.exit(0 if success else 1)
+    sys.exit(main())
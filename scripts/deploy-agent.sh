@@ -20,14 +20,9 @@ if [ -f "terraform/terraform.tfvars" ]; then
     fi
 fi
 
-# Build only the agent Lambda
+# Build only the agent Lambda, with the same artifacts as a full build
 echo "📦 Building agent Lambda package..."
-mkdir -p build_agent
-cp src/lambda_agent/index.py build_agent/
-cd build_agent
-zip -r ../city_facts_agent.zip .
-cd ..
-rm -rf build_agent
+./scripts/build.sh agent
 
 echo "🔄 Updating Lambda function..."
 aws lambda update-function-code \
@@ -108,8 +108,8 @@ echo "🔨 Step 2: Building Lambda functions..."
 
 # Move ZIP files to terraform directory
 echo "   Moving Lambda packages to terraform directory..."
-if [ -f "city_facts_direct.zip" ] && [ -f "city_facts_agent.zip" ]; then
-    mv city_facts_direct.zip city_facts_agent.zip terraform/
+if [ -f "city_facts_direct.zip" ] && [ -f "city_facts_agent.zip" ] && [ -f "city_facts_compare.zip" ]; then
+    mv city_facts_direct.zip city_facts_agent.zip city_facts_compare.zip terraform/
     echo "✅ Lambda functions built and packaged"
 else
     echo "❌ Error: Lambda ZIP files not found after build"
@@ -183,74 +183,88 @@ echo "   Try testing with: Geneva, Berlin, Tokyo, London, Paris, New York, or Sa
 # Step 6: Ingest knowledge base data
 echo "📊 Step 6: Ingesting knowledge base data..."
 
-# Get IDs from Terraform output
-cd terraform
-KB_ID=$(terraform output -raw knowledge_base_id)
-DS1_ID=$(terraform output -raw air_quality_data_source_id)
-DS2_ID=$(terraform output -raw cost_of_living_data_source_id)
-cd ..
-
-echo "   Knowledge Base ID: $KB_ID"
-echo "   Air Quality Data Source ID: $DS1_ID"
-echo "   Cost of Living Data Source ID: $DS2_ID"
-
-# Start first ingestion job
-echo "   🔄 Starting air quality data ingestion..."
-aws bedrock-agent start-ingestion-job \
-  --knowledge-base-id "$KB_ID" \
-  --data-source-id "$DS1_ID" \
-  --description "Initial ingestion of air quality data" \
-  --region us-east-1 > /dev/null
-
-# Wait for first job to complete
-echo "   ⏳ Waiting for air quality ingestion to complete..."
-while true; do
-    STATUS=$(aws bedrock-agent list-ingestion-jobs \
+# KB_INGESTION=pipeline writes row-aware chunks straight into the vector
+# index (scripts/create-opensearch-index.py --ingest) instead of running the
+# data-source ingestion jobs; use one or the other, not both
+if [ "${KB_INGESTION:-sync}" = "pipeline" ]; then
+    cd terraform
+    COLLECTION_ENDPOINT=$(terraform output -raw opensearch_collection_endpoint)
+    KB_BUCKET=$(terraform output -raw s3_knowledge_base_bucket)
+    cd ..
+
+    echo "   🔄 Running row-aware ingestion pipeline..."
+    python3 scripts/create-opensearch-index.py "$COLLECTION_ENDPOINT" --ingest \
+      --source-uri-prefix "s3://$KB_BUCKET/"
+else
+    # Get IDs from Terraform output
+    cd terraform
+    KB_ID=$(terraform output -raw knowledge_base_id)
+    DS1_ID=$(terraform output -raw air_quality_data_source_id)
+    DS2_ID=$(terraform output -raw cost_of_living_data_source_id)
+    cd ..
+
+    echo "   Knowledge Base ID: $KB_ID"
+    echo "   Air Quality Data Source ID: $DS1_ID"
+    echo "   Cost of Living Data Source ID: $DS2_ID"
+
+    # Start first ingestion job
+    echo "   🔄 Starting air quality data ingestion..."
+    aws bedrock-agent start-ingestion-job \
       --knowledge-base-id "$KB_ID" \
       --data-source-id "$DS1_ID" \
-      --region us-east-1 \
-      --query 'ingestionJobSummaries[0].status' \
-      --output text)
-    
-    if [ "$STATUS" = "COMPLETE" ]; then
-        echo "   ✅ Air quality data ingestion completed"
-        break
-    elif [ "$STATUS" = "FAILED" ]; then
-        echo "   ❌ Air quality data ingestion failed"
-        exit 1
-    fi
-    
-    sleep 5
-done
-
-# Start second ingestion job
-echo "   🔄 Starting cost of living data ingestion..."
-aws bedrock-agent start-ingestion-job \
-  --knowledge-base-id "$KB_ID" \
-  --data-source-id "$DS2_ID" \
-  --description "Initial ingestion of cost of living data" \
-  --region us-east-1 > /dev/null
-
-# Wait for second job to complete
-echo "   ⏳ Waiting for cost of living ingestion to complete..."
-while true; do
-    STATUS=$(aws bedrock-agent list-ingestion-jobs \
+      --description "Initial ingestion of air quality data" \
+      --region us-east-1 > /dev/null
+
+    # Wait for first job to complete
+    echo "   ⏳ Waiting for air quality ingestion to complete..."
+    while true; do
+        STATUS=$(aws bedrock-agent list-ingestion-jobs \
+          --knowledge-base-id "$KB_ID" \
+          --data-source-id "$DS1_ID" \
+          --region us-east-1 \
+          --query 'ingestionJobSummaries[0].status' \
+          --output text)
+
+        if [ "$STATUS" = "COMPLETE" ]; then
+            echo "   ✅ Air quality data ingestion completed"
+            break
+        elif [ "$STATUS" = "FAILED" ]; then
+            echo "   ❌ Air quality data ingestion failed"
+            exit 1
+        fi
+
+        sleep 5
+    done
+
+    # Start second ingestion job
+    echo "   🔄 Starting cost of living data ingestion..."
+    aws bedrock-agent start-ingestion-job \
       --knowledge-base-id "$KB_ID" \
       --data-source-id "$DS2_ID" \
-      --region us-east-1 \
-      --query 'ingestionJobSummaries[0].status' \
-      --output text)
-    
-    if [ "$STATUS" = "COMPLETE" ]; then
-        echo "   ✅ Cost of living data ingestion completed"
-        break
-    elif [ "$STATUS" = "FAILED" ]; then
-        echo "   ❌ Cost of living data ingestion failed"
-        exit 1
-    fi
-    
-    sleep 5
-done
+      --description "Initial ingestion of cost of living data" \
+      --region us-east-1 > /dev/null
+
+    # Wait for second job to complete
+    echo "   ⏳ Waiting for cost of living ingestion to complete..."
+    while true; do
+        STATUS=$(aws bedrock-agent list-ingestion-jobs \
+          --knowledge-base-id "$KB_ID" \
+          --data-source-id "$DS2_ID" \
+          --region us-east-1 \
+          --query 'ingestionJobSummaries[0].status' \
+          --output text)
+
+        if [ "$STATUS" = "COMPLETE" ]; then
+            echo "   ✅ Cost of living data ingestion completed"
+            break
+        elif [ "$STATUS" = "FAILED" ]; then
+            echo "   ❌ Cost of living data ingestion failed"
+            exit 1
+        fi
+
+        sleep 5
+    done
+fi
 
 echo "✅ All data ingestion completed"
 echo ""
@@ -20,14 +20,9 @@ if [ -f "terraform/terraform.tfvars" ]; then
     fi
 fi
 
-# Build only the direct Lambda
+# Build only the direct Lambda, with the same artifacts as a full build
 echo "📦 Building direct Lambda package..."
-mkdir -p build_direct
-cp src/lambda_direct/index.py build_direct/
-cd build_direct
-zip -r ../city_facts_direct.zip .
-cd ..
-rm -rf build_direct
+./scripts/build.sh direct
 
 echo "🔄 Updating Lambda function..."
 aws lambda update-function-code \
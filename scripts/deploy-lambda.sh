@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # Deploy Lambda functions without running Terraform
-# Usage: ./deploy-lambda.sh [direct|agent|both]
+# Usage: ./deploy-lambda.sh [direct|agent|compare|both]
 # Automatically detects resource prefix from terraform.tfvars
 
 set -e
@@ -44,8 +44,16 @@ case $FUNCTION_TYPE in
     echo "✅ Agent Lambda updated successfully!"
     ;;
   
+  "compare")
+    echo "🔄 Updating comparison Lambda..."
+    aws lambda update-function-code \
+      --function-name ${FULL_PROJECT_NAME}-city-facts-compare \
+      --zip-file fileb://city_facts_compare.zip
+    echo "✅ Comparison Lambda updated successfully!"
+    ;;
+  
   "both"|*)
-    echo "🔄 Updating both Lambda functions..."
+    echo "🔄 Updating all Lambda functions..."
     
     echo "  → Updating direct model access Lambda..."
     aws lambda update-function-code \
@@ -57,7 +65,12 @@ case $FUNCTION_TYPE in
       --function-name ${FULL_PROJECT_NAME}-city-facts-agent \
       --zip-file fileb://city_facts_agent.zip
     
-    echo "✅ Both Lambda functions updated successfully!"
+    echo "  → Updating comparison Lambda..."
+    aws lambda update-function-code \
+      --function-name ${FULL_PROJECT_NAME}-city-facts-compare \
+      --zip-file fileb://city_facts_compare.zip
+    
+    echo "✅ All Lambda functions updated successfully!"
     ;;
 esac
 
@@ -66,4 +79,5 @@ echo "🎉 Lambda deployment complete!"
 echo ""
 echo "💡 Test your functions:"
 echo "   Direct:  aws lambda invoke --function-name ${FULL_PROJECT_NAME}-city-facts-direct --cli-binary-format raw-in-base64-out --payload '{\"city\": \"Tokyo\"}' response.json"
-echo "   Agent:   aws lambda invoke --function-name ${FULL_PROJECT_NAME}-city-facts-agent --cli-binary-format raw-in-base64-out --payload '{\"city\": \"Paris\"}' response.json"
\ No newline at end of file
+echo "   Agent:   aws lambda invoke --function-name ${FULL_PROJECT_NAME}-city-facts-agent --cli-binary-format raw-in-base64-out --payload '{\"city\": \"Paris\"}' response.json"
+echo "   Compare: aws lambda invoke --function-name ${FULL_PROJECT_NAME}-city-facts-compare --cli-binary-format raw-in-base64-out --payload '{\"city\": \"Rome\"}' response.json"
\ No newline at end of file
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Replay recorded API requests against the City Facts API at a target rate.
+
+Requests come from a JSONL log, one {"method", "path", "headers", "query",
+"body"} object per line: the file scripts/local-api-gateway.py --record
+writes, or data/load-tests/sample-requests.jsonl. They are sent open-loop
+(a request starts on schedule whether or not earlier ones finished) at
+--rps, cycling through the log, for --duration seconds or --requests
+requests. --rps 0 keeps the recorded inter-arrival times instead.
+
+The report has, per route, a latency histogram and p50/p90/p99/max, the
+status codes, the error rate (5xx and connection failures), throttled
+requests (429), the fact cache hit ratio (from cache_status in /direct and
+/compare answers) and the cold starts the local gateway reported.
+
+Usage:
+  python3 scripts/load-generator.py [--url http://127.0.0.1:3000] [--log FILE]
+      [--rps N] [--duration S | --requests N] [--timeout S] [--header "Name: value"] [--json]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_LOG = os.path.join(REPO_ROOT, 'data', 'load-tests', 'sample-requests.jsonl')
+HISTOGRAM_WIDTH = 40
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_requests(path):
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                requests.append(json.loads(line))
+    if not requests:
+        raise ValueError(f"No requests in {path}")
+    return requests
+
+
+def schedule(requests, rps, count, duration_s):
+    """
+    (offset_s, request) pairs: evenly spaced at rps, or at the recorded
+    timestamps (repeating the log) when rps is 0.
+    """
+    if rps > 0:
+        total = count or int(duration_s * rps)
+        return [(index / rps, requests[index % len(requests)]) for index in range(total)]
+    first = requests[0].get("ts", 0)
+    span = (requests[-1].get("ts", 0) - first) + 1.0
+    plan = []
+    index = 0
+    while True:
+        request = requests[index % len(requests)]
+        offset = (index // len(requests)) * span + (request.get("ts", 0) - first)
+        if (count and index >= count) or (not count and offset >= duration_s):
+            return plan
+        plan.append((offset, request))
+        index += 1
+
+
+def cache_status_of(path, payload):
+    if not isinstance(payload, dict):
+        return None
+    if path.endswith('/compare'):
+        payload = payload.get("direct") or {}
+    return payload.get("cache_status")
+
+
+def send(base_url, request, timeout_s, extra_headers=None):
+    """
+    One request; returns a result dict with route, status, latency and what
+    the response says about caching and cold starts.
+    """
+    path = request.get("path", "/direct")
+    url = base_url.rstrip('/') + path
+    if request.get("query"):
+        url += '?' + urlencode(request["query"])
+    body = request.get("body")
+    data = body.encode('utf-8') if isinstance(body, str) else (json.dumps(body).encode('utf-8') if body else None)
+    headers = dict(request.get("headers") or {})
+    headers.setdefault("Content-Type", "application/json")
+    headers.update(extra_headers or {})
+    http_request = urllib.request.Request(url, data=data, headers=headers, method=request.get("method", "POST"))
+    started = time.perf_counter()
+    result = {"route": path.replace('/prod', '', 1) if path.startswith('/prod/') else path}
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout_s) as response:
+            status, response_headers, content = response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        status, response_headers, content = e.code, e.headers, e.read()
+    except Exception as e:
+        result.update(status=None, error=type(e).__name__, latency_ms=(time.perf_counter() - started) * 1000)
+        return result
+    result["latency_ms"] = (time.perf_counter() - started) * 1000
+    result["status"] = status
+    result["cold_start"] = response_headers.get("X-Local-Cold-Start") == "true"
+    try:
+        result["cache_status"] = cache_status_of(result["route"], json.loads(content))
+    except ValueError:
+        result["cache_status"] = None
+    return result
+
+
+def histogram(latencies):
+    """
+    [upper bound ms, count] for log-scale buckets (1, 2, 5, 10, 20, 50 ms ...)
+    from the fastest to the slowest request.
+    """
+    if not latencies:
+        return []
+    bounds = []
+    bound = 1.0
+    while not bounds or bounds[-1] < max(latencies):
+        for step in (1, 2, 5):
+            bounds.append(bound * step)
+        bound *= 10
+    counts = Counter(next(b for b in bounds if ms <= b) for ms in latencies)
+    return [[upper, counts.get(upper, 0)] for upper in bounds if min(counts) <= upper <= max(counts)]
+
+
+def summarize(results, elapsed_s):
+    routes = defaultdict(list)
+    for result in results:
+        routes[result["route"]].append(result)
+    summary = {"requests": len(results), "elapsed_s": round(elapsed_s, 2),
+               "achieved_rps": round(len(results) / elapsed_s, 1) if elapsed_s else 0.0, "routes": {}}
+    for route, route_results in sorted(routes.items()):
+        latencies = [r["latency_ms"] for r in route_results]
+        statuses = Counter(str(r["status"]) if r["status"] is not None else r["error"] for r in route_results)
+        errors = sum(1 for r in route_results if r["status"] is None or r["status"] >= 500)
+        cache_statuses = [r["cache_status"] for r in route_results if r.get("cache_status")]
+        hits = sum(1 for status in cache_statuses if status.endswith('_hit'))
+        summary["routes"][route] = {
+            "requests": len(route_results),
+            "statuses": dict(sorted(statuses.items())),
+            "error_rate": round(errors / len(route_results), 4),
+            "throttled": statuses.get("429", 0),
+            "cache_hit_ratio": round(hits / len(cache_statuses), 4) if cache_statuses else None,
+            "cold_starts": sum(1 for r in route_results if r.get("cold_start")),
+            "latency_ms": {name: round(value, 1) for name, value in (
+                ("p50", percentile(latencies, 50)), ("p90", percentile(latencies, 90)),
+                ("p99", percentile(latencies, 99)), ("max", max(latencies)))},
+            "histogram": histogram(latencies)
+        }
+    return summary
+
+
+def print_summary(summary, target_rps):
+    print(f"📊 {summary['requests']} requests in {summary['elapsed_s']} s "
+          f"({summary['achieved_rps']}/s achieved{f', {target_rps:g}/s target' if target_rps else ''})")
+    for route, stats in summary["routes"].items():
+        latency = stats["latency_ms"]
+        hit_ratio = stats["cache_hit_ratio"]
+        print(f"\n   {route}  {stats['requests']} requests  statuses {stats['statuses']}")
+        print(f"      error rate {stats['error_rate']:.1%}  throttled {stats['throttled']}  "
+              f"cache hits {'n/a' if hit_ratio is None else f'{hit_ratio:.1%}'}  cold starts {stats['cold_starts']}")
+        print(f"      p50 {latency['p50']:.1f} ms  p90 {latency['p90']:.1f} ms  "
+              f"p99 {latency['p99']:.1f} ms  max {latency['max']:.1f} ms")
+        peak = max(count for _, count in stats["histogram"])
+        for upper, count in stats["histogram"]:
+            bar = '█' * math.ceil(count / peak * HISTOGRAM_WIDTH) if count else ''
+            print(f"      ≤{upper:>7g} ms {count:6d} {bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:3000', help='API base URL (include the stage if any)')
+    parser.add_argument('--log', default=DEFAULT_LOG, help='JSONL request log to replay')
+    parser.add_argument('--rps', type=float, default=10, help='target requests per second (0 = recorded pacing)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='send this many requests instead of running for --duration')
+    parser.add_argument('--timeout', type=float, default=35, help='per-request timeout in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=256)
+    parser.add_argument('--header', action='append', default=[],
+                        help='"Name: value" added to every request (repeatable), e.g. an Authorization token')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    extra_headers = dict(header.split(':', 1) for header in args.header)
+    extra_headers = {name.strip(): value.strip() for name, value in extra_headers.items()}
+    plan = schedule(load_requests(args.log), args.rps, args.requests, args.duration)
+    if not args.json:
+        print(f"🚚 Replaying {len(plan)} requests from {os.path.relpath(args.log)} against {args.url}")
+
+    results = []
+    lock = threading.Lock()
+
+    def run(request):
+        result = send(args.url, request, args.timeout, extra_headers)
+        with lock:
+            results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+        for offset, request in plan:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, request)
+    elapsed_s = time.perf_counter() - started
+
+    summary = summarize(results, elapsed_s)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, args.rps)
+    failed = sum(1 for r in results if r["status"] is None)
+    return 1 if results and failed == len(results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Run the City Facts API locally: the routes of terraform/api_gateway.tf
+(POST /direct, /agent and /compare, also under /prod) in front of the
+Lambda handlers, each function in its own pool of container processes.
+
+A request is served by a warm container when one is idle and otherwise
+starts a new one (a cold start) up to --max-containers per function;
+beyond that it gets 429, like a Lambda at its concurrency limit. Idle
+containers are stopped after --idle-timeout seconds. With --stub the
+containers use the offline Bedrock stubs, so no AWS account is needed.
+
+State that must be shared across containers needs a file-backed store,
+e.g. FACT_CACHE_STORE=sqlite:/tmp/facts.db, AGENT_JOB_STORE=sqlite:/tmp/jobs.db
+or ADMISSION_STORE=sqlite:/tmp/admission.db in the environment.
+
+Usage:
+  python3 scripts/local-api-gateway.py [--port 3000] [--stub] [--max-containers N]
+      [--idle-timeout S] [--prewarm N] [--throttle-rate N] [--throttle-burst N]
+      [--record requests.jsonl] [--latency-ms MS] [--token-ms MS]
+      [--agent-latency-ms MS] [--quota-rps N] [--quiet]
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from localdev.api_gateway import (  # noqa: E402
+    DEFAULT_THROTTLE_BURST, DEFAULT_THROTTLE_RATE, ROUTES, ContainerPool, LocalApiGateway, make_server
+)
+
+
+def container_environ(args):
+    """
+    Environment for the container processes: the caller's, plus what the
+    handlers need to run offline when --stub is set.
+    """
+    environ = dict(os.environ)
+    environ.setdefault('AWS_REGION', 'us-east-1')
+    if args.stub:
+        environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+        environ.setdefault('BEDROCK_AGENT_ID', 'LOCALAGENT')
+        environ.setdefault('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
+    return environ
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--stub', action='store_true', help='use the offline Bedrock stubs')
+    parser.add_argument('--max-containers', type=int, default=10, help='concurrency limit per function')
+    parser.add_argument('--idle-timeout', type=float, default=300, help='seconds before an idle container stops')
+    parser.add_argument('--prewarm', type=int, default=0, help='containers to start per function up front')
+    parser.add_argument('--throttle-rate', type=float, default=DEFAULT_THROTTLE_RATE,
+                        help='stage requests per second (0 = no stage throttle)')
+    parser.add_argument('--throttle-burst', type=float, default=DEFAULT_THROTTLE_BURST)
+    parser.add_argument('--record', help='append every request to this JSONL file for the load generator')
+    parser.add_argument('--latency-ms', type=float, default=150, help='stub time to first token')
+    parser.add_argument('--token-ms', type=float, default=0, help='stub delay between streamed tokens')
+    parser.add_argument('--agent-latency-ms', type=float, default=300, help='stub agent latency')
+    parser.add_argument('--quota-rps', type=int, help='stub Bedrock calls per second per container')
+    parser.add_argument('--quiet', action='store_true', help="discard the handlers' log output")
+    args = parser.parse_args()
+
+    stub_options = {"stub": args.stub, "quiet": args.quiet, "latency_ms": args.latency_ms,
+                    "token_ms": args.token_ms, "agent_latency_ms": args.agent_latency_ms,
+                    "quota_rps": args.quota_rps}
+    environ = container_environ(args)
+    pools = {path: ContainerPool(config, args.max_containers, args.idle_timeout, environ, stub_options)
+             for path, config in ROUTES.items()}
+    gateway = LocalApiGateway(pools, args.throttle_rate, args.throttle_burst, args.record)
+
+    if args.prewarm:
+        print(f"🔥 Prewarming {args.prewarm} container(s) per function...")
+        for pool in pools.values():
+            pool.prewarm(args.prewarm)
+
+    def reap_idle():
+        while True:
+            time.sleep(max(1.0, min(args.idle_timeout / 4, 30)))
+            stopped = gateway.reap()
+            if stopped:
+                print(f"💤 Stopped {stopped} idle container(s)")
+
+    threading.Thread(target=reap_idle, daemon=True).start()
+
+    server = make_server(gateway, args.host, args.port)
+    print(f"🚀 Local API Gateway on http://{args.host}:{args.port} "
+          f"({'stubbed Bedrock' if args.stub else 'real Bedrock'}, "
+          f"{args.max_containers} containers per function)")
+    for path, config in ROUTES.items():
+        print(f"   POST {path:9} → {config.module}.{config.handler}")
+    # Stop cleanly (and print the pool stats) on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for path, pool in pools.items():
+            print(f"   {path:9} {pool.stats()}")
+        gateway.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
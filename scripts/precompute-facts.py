@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Pre-generate city facts for every city in the dataset and write the
+precomputed facts artifact packaged with lambda_direct.
+
+Uses lambda_direct's prompt, request and parsing code (and its retrying
+invoker), so the artifact holds exactly what the handler would cache.
+Requests run with --concurrency workers behind a --rate requests/second
+limiter. Each finished city is appended to a checkpoint file, so an
+interrupted run resumes where it stopped; entries for another model or
+prompt version are ignored. Cities that fail or return no facts are
+retried on the next run.
+
+Usage:
+  python3 scripts/precompute-facts.py [--output PATH] [--concurrency N] [--rate RPS]
+      [--compact] [--cities A,B,C] [--limit N] [--fresh]
+  python3 scripts/precompute-facts.py --stub          # offline against the stub runtime
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from common.precomputed_facts import ARTIFACT_FILENAME, PrecomputedFacts, write_precomputed_facts  # noqa: E402
+
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, 'data', 'precomputed', ARTIFACT_FILENAME)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the worker threads: up to `rate` acquisitions
+    per second with bursts of `burst`.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+def load_checkpoint(path):
+    """
+    {cache_key: value} from a checkpoint file. A torn last line from an
+    interrupted run is skipped.
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[record["key"]] = record["value"]
+    return entries
+
+
+def known_cities(city_index):
+    """
+    Every city in the dataset as a CanonicalCity, one per canonical ID (the
+    same ID the handler derives from any spelling of the city).
+    """
+    cities = {}
+    for row, name in enumerate(city_index.cities):
+        if name and name.strip():
+            city = city_index.canonical(row, 'exact')
+            cities.setdefault(city.id, city)
+    return [cities[city_id] for city_id in sorted(cities)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--checkpoint', help='defaults to <output>.checkpoint.jsonl')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    parser.add_argument('--rate', type=float, default=5, help='requests per second (0 = unlimited)')
+    parser.add_argument('--timeout-ms', type=int, default=60000, help='budget per city, including retries')
+    parser.add_argument('--compact', action='store_true', help='generate compact-mode facts instead of classic')
+    parser.add_argument('--cities', help='comma-separated city names instead of the whole dataset')
+    parser.add_argument('--limit', type=int, help='only the first N cities')
+    parser.add_argument('--fresh', action='store_true', help='ignore the existing checkpoint')
+    parser.add_argument('--stub', action='store_true', help='use the offline stub Bedrock runtime')
+    parser.add_argument('--latency-ms', type=float, default=0, help='stub latency per request')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FACT_CACHE_ENABLED', 'false')
+    os.environ.setdefault('CLIENT_INIT_MODE', 'lazy')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_direct.index as direct
+    from common.bedrock_invoke import Deadline
+    from common.city_index import canonicalize_city, get_city_index
+    from common.events import normalize_event
+    from common.fact_cache import make_cache_key
+    if args.stub:
+        from localdev.stub_bedrock import StubBedrockRuntime, install_stubs
+        install_stubs(direct=StubBedrockRuntime(latency_ms=args.latency_ms))
+
+    options = direct.get_generation_options(normalize_event({"compact": args.compact}))
+    prompt_version = direct.get_cache_version(options)
+    if args.cities:
+        requested = (canonicalize_city(city) for city in args.cities.split(',') if city.strip())
+        cities = list({city.id: city for city in requested}.values())
+    else:
+        cities = known_cities(get_city_index())
+    cities = cities[:args.limit] if args.limit else cities
+    keys = {city.id: make_cache_key(city.id, direct.MODEL_ID, prompt_version) for city in cities}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+    if args.fresh and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = load_checkpoint(checkpoint_path)
+    todo = [city for city in cities if keys[city.id] not in done]
+    print(f"🏙️  {len(cities)} cities ({options['mode']} mode, prompt {prompt_version}): "
+          f"{len(cities) - len(todo)} already in the checkpoint, {len(todo)} to generate")
+
+    limiter = RateLimiter(args.rate, burst=max(1, args.concurrency))
+
+    def generate(city):
+        limiter.acquire()
+        info = {}
+        deadline = Deadline(args.timeout_ms)
+        if options["mode"] == "compact":
+            response_body = direct.invoke_claude_request(direct.build_compact_request(city.display, options), deadline, info)
+            facts = direct.extract_tool_facts(response_body, options)
+        else:
+            facts = direct.extract_facts(direct.invoke_claude(direct.build_city_prompt(city.display), deadline, info))
+        return {"facts": facts, "model_used": info.get("model_id", direct.MODEL_ID)}
+
+    started = time.perf_counter()
+    generated = failed = 0
+    interrupted = False
+    pool = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='precompute')
+    try:
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            futures = {pool.submit(generate, city): city for city in todo}
+            for future in as_completed(futures):
+                city = futures[future]
+                try:
+                    value = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"   ❌ {city.name}: {e}")
+                    continue
+                if not value["facts"]:
+                    failed += 1
+                    print(f"   ❌ {city.name}: no facts in the response")
+                    continue
+                # One line per city, flushed so a kill loses at most the cities in flight
+                checkpoint.write(json.dumps({"key": keys[city.id], "value": value}) + '\n')
+                checkpoint.flush()
+                done[keys[city.id]] = value
+                generated += 1
+                if generated % 100 == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"   {generated}/{len(todo)} generated ({generated / elapsed:.1f}/s)")
+    except KeyboardInterrupt:
+        interrupted = True
+        print("⏸️  Interrupted; re-run the same command to resume from the checkpoint")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    if interrupted:
+        return 130
+
+    entries = {keys[city.id]: done[keys[city.id]] for city in cities if keys[city.id] in done}
+    size = write_precomputed_facts(args.output, entries, {
+        "model_id": direct.MODEL_ID,
+        "prompt_version": prompt_version,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "entries": len(entries),
+    })
+    artifact = PrecomputedFacts(args.output)
+    assert len(artifact) == len(entries)
+    artifact.close()
+
+    print(f"✅ Generated {generated} cities in {time.perf_counter() - started:.1f}s ({failed} failed)")
+    print(f"   Artifact: {args.output} ({len(entries)}/{len(cities)} cities, {size // 1024} KB)")
+    if failed:
+        print("   Re-run to retry the failed cities")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # Test Lambda functions with automatic prefix detection
-# Usage: ./test-lambda.sh [direct|agent|both] [city_name]
+# Usage: ./test-lambda.sh [direct|agent|agent-async|both] [city_name]
 
 set -e
 
@@ -55,6 +55,51 @@ test_function() {
   echo ""
 }
 
+# Submit an async agent job, then poll it until it finishes
+test_agent_job() {
+  local func_name=$1
+  local output_file="test_agent_job_$(date +%s).json"
+  
+  echo "  → Submitting async agent job: $func_name"
+  aws lambda invoke \
+    --function-name "$func_name" \
+    --cli-binary-format raw-in-base64-out \
+    --payload "{\"city\": \"$CITY_NAME\", \"async\": true}" \
+    "$output_file" > /dev/null
+  
+  if ! command -v jq &> /dev/null; then
+    echo "    $(cat "$output_file")"
+    echo "    💡 Install jq to poll the job automatically"
+    return
+  fi
+  local job_id
+  job_id=$(jq -r '.body' "$output_file" | jq -r '.job_id')
+  if [ -z "$job_id" ] || [ "$job_id" = "null" ]; then
+    echo "    ❌ Submit failed:"
+    jq -r '.body' "$output_file" | jq .
+    return
+  fi
+  echo "    🆔 Job: $job_id"
+  
+  local status="queued"
+  for _ in $(seq 1 90); do
+    sleep 2
+    aws lambda invoke \
+      --function-name "$func_name" \
+      --cli-binary-format raw-in-base64-out \
+      --payload "{\"job_id\": \"$job_id\"}" \
+      "$output_file" > /dev/null
+    status=$(jq -r '.body' "$output_file" | jq -r '.status')
+    echo "    ⏳ $status $(jq -r '.body' "$output_file" | jq -c '.progress')"
+    if [ "$status" = "succeeded" ] || [ "$status" = "failed" ]; then
+      break
+    fi
+  done
+  echo "    📄 Final status saved to: $output_file"
+  jq -r '.body' "$output_file" | jq '.result // .error' | head -20
+  echo ""
+}
+
 case $FUNCTION_TYPE in
   "direct")
     test_function "${FULL_PROJECT_NAME}-city-facts-direct" "direct"
@@ -64,6 +109,10 @@ case $FUNCTION_TYPE in
     test_function "${FULL_PROJECT_NAME}-city-facts-agent" "agent"
     ;;
   
+  "agent-async")
+    test_agent_job "${FULL_PROJECT_NAME}-city-facts-agent"
+    ;;
+  
   "both"|*)
     test_function "${FULL_PROJECT_NAME}-city-facts-direct" "direct"
     test_function "${FULL_PROJECT_NAME}-city-facts-agent" "agent"
@@ -0,0 +1,3 @@
+"""
+Shared helpers packaged into both the direct and agent Lambda functions.
+"""
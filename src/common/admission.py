@@ -0,0 +1,359 @@
+"""
+Admission control sized to the Bedrock tokens-per-minute and
+requests-per-minute quotas.
+
+Before a model or agent call, the caller estimates its token cost (prompt
+characters / 4 plus max_tokens, which is what Bedrock reserves against the
+TPM quota when the call starts) and takes it from two token buckets kept
+per model: one holding tokens, one holding requests. Each bucket holds
+ADMISSION_BURST_SECONDS of quota (a minute by default) and refills
+continuously. When either bucket is short the call is not sent;
+AdmissionRejected carries how long until it would fit, and the handlers
+return 429 with Retry-After instead of letting Bedrock throttle every
+caller at once. After the call the unused part of the
+estimate (max_tokens the answer did not need) is given back.
+
+One logical call can reach Bedrock several times (ResilientInvoker retries,
+hedges and fallback models). Each extra call is charged afterwards with
+charge_extra() at the full estimate, since a timed-out or abandoned attempt
+may still have used its tokens; only the answered call is settled.
+
+Bucket state follows the fact cache's spec strings so every container sees
+the same budget: "memory" (one process, the local stand-in), "sqlite:<path>"
+(shared by processes on one machine) or "dynamodb:<table>" (string partition
+key `bucket_key`, updated with a conditional write on `version`). If the
+store fails, calls are admitted: Bedrock's own throttling still applies.
+
+Environment variables:
+  ADMISSION_TOKENS_PER_MINUTE    token quota to stay under (0 = no token limit)
+  ADMISSION_REQUESTS_PER_MINUTE  request quota to stay under (0 = no request limit)
+  ADMISSION_STORE                bucket store spec (default "memory")
+  ADMISSION_BURST_SECONDS        seconds of quota a bucket holds, i.e. the largest burst (default 60)
+  ADMISSION_MAX_WAIT_MS          wait this long for budget before rejecting (default 0)
+  ADMISSION_AGENT_TOKENS         token estimate for one agent run (default 9000)
+  ADMISSION_AGENT_REQUESTS       model calls estimated for one agent run (default 4)
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from common.metrics import current_metrics
+
+CHARS_PER_TOKEN = 4
+DEFAULT_AGENT_TOKENS = 9000
+DEFAULT_AGENT_REQUESTS = 4
+DYNAMODB_WRITE_ATTEMPTS = 5
+
+
+class AdmissionRejected(Exception):
+    """
+    Not enough quota left for a call; retry_after_s is how long until it fits.
+    """
+
+    def __init__(self, key, retry_after_s, tokens, requests):
+        super().__init__(f"Bedrock quota budget for {key} exhausted; retry in {retry_after_s:.1f} s "
+                         f"(needs {tokens} tokens, {requests} requests)")
+        self.key = key
+        self.retry_after_s = retry_after_s
+        self.tokens = tokens
+        self.requests = requests
+
+    @property
+    def retry_after(self):
+        """
+        Whole seconds for the Retry-After header (at least 1).
+        """
+        return max(1, math.ceil(self.retry_after_s))
+
+
+def estimate_tokens(body, max_tokens):
+    """
+    Token cost of a Messages API call from its serialized request body.
+    Counting the whole body slightly overestimates the prompt, which is the
+    safe side for staying under the quota.
+    """
+    return math.ceil(len(body) / CHARS_PER_TOKEN) + int(max_tokens or 0)
+
+
+def take(state, limits, costs, now, force=False):
+    """
+    Refill the buckets in state (levels keyed like limits, plus updated_at)
+    to now and take costs from them. limits maps a bucket name to
+    (capacity, refill per second). Returns (new_state, wait_s): wait_s is 0
+    when the costs were taken, otherwise the time until they would fit and
+    new_state is None. force always takes (negative costs give back).
+    """
+    elapsed = max(0.0, now - state["updated_at"]) if state else 0.0
+    levels = {}
+    wait_s = 0.0
+    for name, (capacity, rate) in limits.items():
+        level = capacity if not state or name not in state else min(capacity, state[name] + elapsed * rate)
+        cost = min(costs.get(name, 0), capacity)
+        if level < cost:
+            wait_s = max(wait_s, (cost - level) / rate)
+        levels[name] = min(capacity, level - cost)
+    if wait_s > 0 and not force:
+        return None, wait_s
+    levels["updated_at"] = now
+    return levels, 0.0
+
+
+class MemoryBucketStore:
+    """
+    Bucket state in a dict. Only shared by threads of one process.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, limits, costs, now, force=False):
+        with self._lock:
+            state, wait_s = take(self._buckets.get(key), limits, costs, now, force)
+            if state is not None:
+                self._buckets[key] = state
+        return wait_s
+
+
+class SQLiteBucketStore:
+    """
+    Bucket state in a local SQLite file. BEGIN IMMEDIATE serializes the
+    read-modify-write across processes, so local workers share one budget.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS admission_buckets (bucket_key TEXT PRIMARY KEY, state TEXT NOT NULL)"
+        )
+
+    def take(self, key, limits, costs, now, force=False):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT state FROM admission_buckets WHERE bucket_key = ?", (key,)
+                ).fetchone()
+                state, wait_s = take(json.loads(row[0]) if row else None, limits, costs, now, force)
+                if state is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO admission_buckets (bucket_key, state) VALUES (?, ?)",
+                        (key, json.dumps(state))
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait_s
+
+
+class DynamoDBBucketStore:
+    """
+    Bucket state in a DynamoDB table shared by every container. Each update
+    is a conditional write on the item's version; a lost race re-reads and
+    tries again.
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from common.runtime import get_client
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def take(self, key, limits, costs, now, force=False):
+        for _ in range(DYNAMODB_WRITE_ATTEMPTS):
+            item = self.client.get_item(
+                TableName=self.table_name,
+                Key={"bucket_key": {"S": key}},
+                ConsistentRead=True
+            ).get("Item")
+            version = int(item["version"]["N"]) if item else 0
+            state, wait_s = take(json.loads(item["state"]["S"]) if item else None, limits, costs, now, force)
+            if state is None:
+                return wait_s
+            condition = {"ConditionExpression": "#version = :version",
+                         "ExpressionAttributeNames": {"#version": "version"},
+                         "ExpressionAttributeValues": {":version": {"N": str(version)}}} if item else \
+                        {"ConditionExpression": "attribute_not_exists(bucket_key)"}
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={"bucket_key": {"S": key}, "state": {"S": json.dumps(state)},
+                          "version": {"N": str(version + 1)}},
+                    **condition
+                )
+                return 0.0
+            except self.client.exceptions.ConditionalCheckFailedException:
+                continue
+        raise RuntimeError(f"Admission bucket {key} is too contended to update")
+
+
+def bucket_store_from_spec(spec):
+    """
+    Build a bucket store from "memory", "sqlite:<path>" or "dynamodb:<table>".
+    """
+    kind, _, target = (spec or 'memory').partition(':')
+    if kind == 'memory':
+        return MemoryBucketStore()
+    if kind == 'sqlite' and target:
+        return SQLiteBucketStore(target)
+    if kind == 'dynamodb' and target:
+        return DynamoDBBucketStore(target)
+    raise ValueError(f"Unsupported admission store: {spec}")
+
+
+class Ticket:
+    """
+    What an admitted call took from the buckets, for settle().
+    """
+
+    def __init__(self, key, tokens, requests):
+        self.key = key
+        self.tokens = tokens
+        self.requests = requests
+
+
+class AdmissionController:
+    """
+    Token buckets for one quota configuration. With neither quota set,
+    acquire() admits everything without touching the store.
+    """
+
+    def __init__(self, store, tokens_per_minute=0, requests_per_minute=0, max_wait_ms=0, burst_seconds=60,
+                 clock=time.time, sleep=time.sleep):
+        self.store = store
+        self.limits = {}
+        for name, per_minute in (("tokens", tokens_per_minute), ("requests", requests_per_minute)):
+            if per_minute > 0:
+                self.limits[name] = (per_minute * burst_seconds / 60.0, per_minute / 60.0)
+        self.max_wait_s = max_wait_ms / 1000
+        self.clock = clock
+        self.sleep = sleep
+
+    @property
+    def enabled(self):
+        return bool(self.limits)
+
+    def acquire(self, key, tokens, requests=1, deadline=None):
+        """
+        Take tokens and requests for a call to the model behind key. Waits up
+        to ADMISSION_MAX_WAIT_MS (and never past the deadline) for budget,
+        then raises AdmissionRejected. Returns a Ticket, or None when
+        admission control is off or the store failed.
+        """
+        if not self.enabled:
+            return None
+        metrics = current_metrics()
+        costs = {"tokens": tokens, "requests": requests}
+        waited_s = 0.0
+        with metrics.stage('admission'):
+            while True:
+                try:
+                    wait_s = self.store.take(key, self.limits, costs, self.clock())
+                except Exception as e:
+                    print(f"Admission store failed, admitting the call: {e}")
+                    metrics.count('AdmissionErrors')
+                    return None
+                if wait_s <= 0:
+                    return Ticket(key, tokens, requests)
+                max_wait_s = self.max_wait_s - waited_s
+                remaining_ms = deadline.remaining_ms() if deadline is not None else None
+                if remaining_ms is not None:
+                    max_wait_s = min(max_wait_s, remaining_ms / 1000)
+                if wait_s > max_wait_s:
+                    metrics.count('AdmissionRejected')
+                    raise AdmissionRejected(key, wait_s, tokens, requests)
+                self.sleep(wait_s)
+                waited_s += wait_s
+
+    def charge_extra(self, ticket, calls):
+        """
+        Take a ticket's cost once more for each extra Bedrock call made on
+        its behalf (retries, hedges, fallbacks). The calls already happened,
+        so this never waits or rejects.
+        """
+        if ticket is None or not calls or calls <= 0:
+            return
+        try:
+            self.store.take(ticket.key, self.limits,
+                            {"tokens": ticket.tokens * calls, "requests": ticket.requests * calls},
+                            self.clock(), force=True)
+        except Exception as e:
+            print(f"Admission store failed to charge {calls} extra call(s): {e}")
+
+    def settle(self, ticket, used_tokens):
+        """
+        Give back the part of an admitted call's token estimate it did not use.
+        """
+        if ticket is None or used_tokens is None or "tokens" not in self.limits:
+            return
+        unused = ticket.tokens - used_tokens
+        if unused <= 0:
+            return
+        try:
+            self.store.take(ticket.key, self.limits, {"tokens": -unused}, self.clock(), force=True)
+        except Exception as e:
+            print(f"Admission store failed to return {unused} tokens: {e}")
+
+
+def usage_tokens(usage):
+    """
+    Input plus output tokens from a Bedrock usage dict, or None.
+    """
+    if not usage:
+        return None
+    return (usage.get('input_tokens') or 0) + (usage.get('output_tokens') or 0)
+
+
+def agent_estimate(environ=None):
+    """
+    (tokens, requests) taken for one agent run, which makes several model calls.
+    """
+    environ = os.environ if environ is None else environ
+    return (int(environ.get('ADMISSION_AGENT_TOKENS', DEFAULT_AGENT_TOKENS)),
+            int(environ.get('ADMISSION_AGENT_REQUESTS', DEFAULT_AGENT_REQUESTS)))
+
+
+def admission_from_env(environ=None):
+    """
+    Create an AdmissionController from the ADMISSION_* environment variables.
+    An unusable store spec disables admission control rather than the Lambda.
+    """
+    environ = os.environ if environ is None else environ
+    tokens_per_minute = int(environ.get('ADMISSION_TOKENS_PER_MINUTE', 0))
+    requests_per_minute = int(environ.get('ADMISSION_REQUESTS_PER_MINUTE', 0))
+    try:
+        store = bucket_store_from_spec(environ.get('ADMISSION_STORE', 'memory'))
+    except Exception as e:
+        print(f"Admission control disabled: {e}")
+        return AdmissionController(None)
+    return AdmissionController(store, tokens_per_minute, requests_per_minute,
+                               float(environ.get('ADMISSION_MAX_WAIT_MS', 0)),
+                               float(environ.get('ADMISSION_BURST_SECONDS', 60)))
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    The process-wide controller. Both Lambda modules (and lambda_compare,
+    which loads them together) share it, so one process has one budget.
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = admission_from_env()
+    return _controller
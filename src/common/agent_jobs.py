@@ -0,0 +1,367 @@
+"""
+Submit/poll jobs for agent runs that outlive the API Gateway timeout.
+
+A submit request stores a queued job and hands its ID to a dispatcher: in
+Lambda the function invokes itself asynchronously ({"agent_job": id}), and
+locally a background thread runs it. The worker streams the agent answer
+into the job (partial text, chunk and trace-step counts, throttled to one
+store write per AGENT_JOB_PROGRESS_INTERVAL_MS) and finally stores the
+result or the error. Status requests read the job back. The worker claims
+the job with an atomic queued -> running write (claim()), so a duplicate
+async delivery finds it already claimed and does not run the agent twice.
+
+Job stores follow the fact cache's spec strings: "memory" (one process,
+for local runs and tests), "sqlite:/tmp/jobs.db" or "dynamodb:<table>"
+(string partition key `job_id`, TTL on `expires_at`).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_PROGRESS_INTERVAL_MS = 500
+# A running job whose worker deadline passed this long ago is reported as failed
+WORKER_GRACE_SECONDS = 5
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+
+def new_job(options, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.time):
+    """
+    A queued job record for the given request options.
+    """
+    now = clock()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "options": options,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": int(now + ttl_seconds),
+        "progress": {"chunks": 0, "chars": 0, "steps": 0},
+        "partial_text": "",
+        "result": None,
+        "error": None
+    }
+
+
+class MemoryJobStore:
+    """
+    Jobs in a dict. Only visible inside one process, so it pairs with the
+    thread dispatcher for local runs and tests.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["job_id"]] = json.dumps(job)
+
+    def put(self, job):
+        self.create(job)
+
+    def claim(self, job):
+        """
+        Store job (now running) if the stored copy is still queued.
+        Returns False when another worker claimed it first.
+        """
+        with self._lock:
+            stored = self._jobs.get(job["job_id"])
+            if stored is None or json.loads(stored)["status"] != "queued":
+                return False
+            self._jobs[job["job_id"]] = json.dumps(job)
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            stored = self._jobs.get(job_id)
+        return json.loads(stored) if stored is not None else None
+
+
+class SQLiteJobStore:
+    """
+    Jobs in a local SQLite file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS agent_jobs ("
+            "job_id TEXT PRIMARY KEY, job TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def create(self, job):
+        self.put(job)
+
+    def put(self, job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO agent_jobs (job_id, job, expires_at) VALUES (?, ?, ?)",
+                (job["job_id"], json.dumps(job), job["expires_at"])
+            )
+            self._conn.commit()
+
+    def claim(self, job):
+        # The write lock spans the read, so another process cannot claim in between
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job FROM agent_jobs WHERE job_id = ?", (job["job_id"],)
+                ).fetchone()
+                if row is None or json.loads(row[0])["status"] != "queued":
+                    self._conn.rollback()
+                    return False
+                self._conn.execute("UPDATE agent_jobs SET job = ? WHERE job_id = ?",
+                                   (json.dumps(job), job["job_id"]))
+                self._conn.commit()
+                return True
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job, expires_at FROM agent_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+
+class DynamoDBJobStore:
+    """
+    Jobs in a DynamoDB table shared by the submitting and worker invocations.
+    Reads are strongly consistent so a poll right after a write sees it.
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from common.runtime import get_client
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def _item(self, job):
+        return {
+            "job_id": {"S": job["job_id"]},
+            "status": {"S": job["status"]},
+            "job": {"S": json.dumps(job)},
+            "expires_at": {"N": str(int(job["expires_at"]))}
+        }
+
+    def create(self, job):
+        self.client.put_item(TableName=self.table_name, Item=self._item(job),
+                             ConditionExpression="attribute_not_exists(job_id)")
+
+    def put(self, job):
+        self.client.put_item(TableName=self.table_name, Item=self._item(job))
+
+    def claim(self, job):
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"job_id": {"S": job["job_id"]}},
+                UpdateExpression="SET #status = :running, job = :job",
+                ConditionExpression="#status = :queued",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":running": {"S": job["status"]},
+                    ":job": {"S": json.dumps(job)},
+                    ":queued": {"S": "queued"}
+                }
+            )
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def get(self, job_id):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"job_id": {"S": job_id}},
+            ConsistentRead=True
+        )
+        item = response.get("Item")
+        return json.loads(item["job"]["S"]) if item else None
+
+
+def job_store_from_spec(spec):
+    """
+    Build a job store from "memory", "sqlite:<path>" or "dynamodb:<table>".
+    Empty means async jobs are not configured.
+    """
+    if not spec:
+        return None
+    kind, _, target = spec.partition(':')
+    if kind == 'memory':
+        return MemoryJobStore()
+    if kind == 'sqlite' and target:
+        return SQLiteJobStore(target)
+    if kind == 'dynamodb' and target:
+        return DynamoDBJobStore(target)
+    raise ValueError(f"Unsupported agent job store: {spec}")
+
+
+class LambdaJobDispatcher:
+    """
+    Runs jobs by invoking the function itself asynchronously (InvocationType
+    Event). Configure the function's async retries to 0 so a failed run is
+    not repeated against Bedrock.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from common.runtime import get_client
+            self._client = get_client('lambda')
+        return self._client
+
+    def dispatch(self, job_id, context, run):
+        function_name = (getattr(context, 'invoked_function_arn', None)
+                         or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+        self.client.invoke(FunctionName=function_name, InvocationType='Event',
+                           Payload=json.dumps({"agent_job": job_id}).encode('utf-8'))
+
+
+class ThreadJobDispatcher:
+    """
+    Runs jobs on a background thread of the current process (local runs).
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def dispatch(self, job_id, context, run):
+        thread = threading.Thread(target=run, args=(job_id, context), name=f"agent-job-{job_id[:8]}", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+def dispatcher_from_env(environ=None):
+    """
+    AGENT_JOB_DISPATCH: "lambda" (default inside Lambda) or "thread".
+    """
+    environ = os.environ if environ is None else environ
+    default = 'lambda' if environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'thread'
+    mode = environ.get('AGENT_JOB_DISPATCH', default).lower()
+    if mode == 'lambda':
+        return LambdaJobDispatcher()
+    if mode == 'thread':
+        return ThreadJobDispatcher()
+    raise ValueError(f"Unsupported agent job dispatch mode: {mode}")
+
+
+class JobProgress:
+    """
+    Worker-side view of one job. Text and step updates are kept in memory
+    and written at most once per interval; start, success and failure are
+    always written. Progress write errors are logged and never fail the run.
+    """
+
+    def __init__(self, store, job, interval_ms=DEFAULT_PROGRESS_INTERVAL_MS, clock=time.time):
+        self.store = store
+        self.job = job
+        self.interval_s = interval_ms / 1000
+        self.clock = clock
+        self._parts = [job.get("partial_text") or '']
+        self._last_write = 0.0
+        self.writes = 0
+
+    def _write(self):
+        now = self.clock()
+        self.job["partial_text"] = ''.join(self._parts)
+        self.job["updated_at"] = now
+        # A job that fails before a worker claims it (e.g. dispatch) has no started_at
+        started_at = self.job.get("started_at")
+        if started_at is not None:
+            self.job["progress"]["elapsed_ms"] = round((now - started_at) * 1000, 1)
+        self._last_write = now
+        try:
+            self.store.put(self.job)
+            self.writes += 1
+        except Exception as e:
+            print(f"Agent job store write failed: {e}")
+
+    def _maybe_write(self):
+        if self.clock() - self._last_write >= self.interval_s:
+            self._write()
+
+    def start(self, worker_deadline=None):
+        """
+        Claim the queued job as running. Returns False when another worker
+        already claimed it; store errors are raised, since running unclaimed
+        could run the agent twice.
+        """
+        now = self.clock()
+        self.job["status"] = "running"
+        self.job["started_at"] = now
+        self.job["worker_deadline"] = worker_deadline
+        self.job["updated_at"] = now
+        self.job["progress"]["elapsed_ms"] = 0.0
+        if not self.store.claim(self.job):
+            return False
+        self._last_write = now
+        self.writes += 1
+        return True
+
+    def add_text(self, text):
+        self._parts.append(text)
+        self.job["progress"]["chunks"] += 1
+        self.job["progress"]["chars"] += len(text)
+        self._maybe_write()
+
+    def steps(self, count, last_step=None):
+        self.job["progress"]["steps"] = count
+        if last_step is not None:
+            self.job["progress"]["last_step"] = last_step
+        self._maybe_write()
+
+    def succeed(self, result):
+        self.job["status"] = "succeeded"
+        self.job["result"] = result
+        self.job["finished_at"] = self.clock()
+        self._write()
+
+    def fail(self, error):
+        self.job["status"] = "failed"
+        self.job["error"] = error
+        self.job["finished_at"] = self.clock()
+        self._write()
+
+
+def job_status(job, clock=time.time):
+    """
+    The job as returned to a polling client. A running job whose worker
+    passed its Lambda deadline is reported as failed (the worker was
+    stopped before it could record the outcome).
+    """
+    view = {name: job.get(name) for name in (
+        "job_id", "status", "progress", "partial_text", "result", "error", "created_at", "updated_at")}
+    deadline = job.get("worker_deadline")
+    if job["status"] == "running" and deadline is not None and clock() > deadline + WORKER_GRACE_SECONDS:
+        view["status"] = "failed"
+        view["error"] = {"error": "Worker timeout", "message": "The agent run did not finish before the worker timed out"}
+    if view["status"] in FINISHED_STATUSES:
+        view.pop("partial_text")
+    return view
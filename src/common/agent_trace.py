@@ -0,0 +1,180 @@
+"""
+Timeline of a Bedrock agent invocation built from its trace events.
+
+With enableTrace=True, invoke_agent interleaves "trace" events with the
+completion chunks. AgentTrace pairs each input with its output (model
+invocation -> model output, knowledge-base or action-group invocation ->
+observation) by traceId and turns them into steps with durations, token
+counts and retrieved-chunk counts. Durations come from the trace metadata
+when the service reports them, otherwise from when the events arrived.
+"""
+import bisect
+import time
+
+PHASES = {
+    'preProcessingTrace': 'pre_processing',
+    'orchestrationTrace': 'orchestration',
+    'postProcessingTrace': 'post_processing',
+    'routingClassifierTrace': 'routing',
+    'guardrailTrace': 'guardrail',
+}
+
+INVOCATION_TYPES = {
+    'KNOWLEDGE_BASE': 'knowledge_base',
+    'ACTION_GROUP': 'action_group',
+    'ACTION_GROUP_CODE_INTERPRETER': 'action_group',
+    'AGENT_COLLABORATOR': 'collaborator',
+}
+
+# Step type -> metrics stage
+STEP_STAGES = {
+    'model': 'agent_model',
+    'knowledge_base': 'knowledge_base',
+    'action_group': 'action_group',
+}
+
+MAX_DETAIL_CHARS = 120
+
+
+def _clip(text):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= MAX_DETAIL_CHARS else text[:MAX_DETAIL_CHARS - 1] + '…'
+
+
+class AgentTrace:
+    """
+    Collects trace events for one invoke_agent call.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.finished_ms = None
+        self.steps = []
+        self.failures = []
+        self.event_count = 0
+        self._open = {}
+        self._event_times = []
+
+    def _now_ms(self):
+        return (self.clock() - self.started) * 1000
+
+    def add(self, trace_event):
+        """
+        Add the "trace" member of one invoke_agent stream event.
+        """
+        now = self._now_ms()
+        self.event_count += 1
+        self._event_times.append(now)
+        for phase_key, body in (trace_event.get('trace') or {}).items():
+            if phase_key == 'failureTrace':
+                self.failures.append({"at_ms": round(now, 1), "reason": _clip(body.get('failureReason', ''))})
+                continue
+            if not isinstance(body, dict):
+                continue
+            phase = PHASES.get(phase_key, phase_key)
+            for kind, item in body.items():
+                if isinstance(item, dict):
+                    self._add_item(phase, kind, item, now)
+
+    def _add_item(self, phase, kind, item, now):
+        trace_id = item.get('traceId')
+        if kind == 'modelInvocationInput':
+            self._start((trace_id, 'model'), {"phase": phase, "type": "model"}, now)
+        elif kind == 'modelInvocationOutput' or (kind == 'rationale' and (trace_id, 'model') in self._open):
+            # Older agents only send a rationale after the model call
+            step = self._finish((trace_id, 'model'), now, item.get('metadata'))
+            if step is not None:
+                usage = (item.get('metadata') or {}).get('usage') or {}
+                step["input_tokens"] = usage.get('inputTokens')
+                step["output_tokens"] = usage.get('outputTokens')
+        elif kind == 'invocationInput':
+            step_type = INVOCATION_TYPES.get(item.get('invocationType'))
+            if step_type is None:
+                return
+            step = {"phase": phase, "type": step_type}
+            action = item.get('actionGroupInvocationInput') or {}
+            if action:
+                step["action_group"] = action.get('actionGroupName')
+                step["api_path"] = action.get('apiPath') or action.get('function')
+            lookup = item.get('knowledgeBaseLookupInput') or {}
+            if lookup:
+                step["knowledge_base_id"] = lookup.get('knowledgeBaseId')
+                step["query"] = _clip(lookup.get('text', ''))
+            self._start((trace_id, 'invocation'), step, now)
+        elif kind == 'observation':
+            step = self._finish((trace_id, 'invocation'), now, item.get('metadata'))
+            if step is not None and step["type"] == 'knowledge_base':
+                references = (item.get('knowledgeBaseLookupOutput') or {}).get('retrievedReferences') or []
+                step["retrieved_chunks"] = len(references)
+
+    def _start(self, key, step, now):
+        step["start_ms"] = round(now, 1)
+        step["duration_ms"] = None
+        self._open[key] = (step, now)
+        self.steps.append(step)
+
+    def _finish(self, key, now, metadata=None):
+        step, started = self._open.pop(key, (None, None))
+        if step is None:
+            return None
+        reported = (metadata or {}).get('totalTimeMs')
+        step["duration_ms"] = round(reported if reported is not None else now - started, 1)
+        return step
+
+    def finish(self):
+        """
+        Close the trace. A step whose output event never arrived ends at
+        the next trace event (or the end of the stream).
+        """
+        self.finished_ms = self._now_ms()
+        for step, started in self._open.values():
+            position = bisect.bisect_right(self._event_times, started)
+            end = self._event_times[position] if position < len(self._event_times) else self.finished_ms
+            step["duration_ms"] = round(end - started, 1)
+        self._open = {}
+        return self
+
+    def totals(self):
+        totals = {"model_ms": 0.0, "knowledge_base_ms": 0.0, "action_group_ms": 0.0, "model_calls": 0,
+                  "input_tokens": 0, "output_tokens": 0, "retrieved_chunks": 0}
+        for step in self.steps:
+            duration = step["duration_ms"] or 0.0
+            if step["type"] == 'model':
+                totals["model_ms"] += duration
+                totals["model_calls"] += 1
+                totals["input_tokens"] += step.get("input_tokens") or 0
+                totals["output_tokens"] += step.get("output_tokens") or 0
+            elif step["type"] in ('knowledge_base', 'action_group'):
+                totals[f"{step['type']}_ms"] += duration
+            totals["retrieved_chunks"] += step.get("retrieved_chunks") or 0
+        for name in ("model_ms", "knowledge_base_ms", "action_group_ms"):
+            totals[name] = round(totals[name], 1)
+        if self.finished_ms is not None:
+            totals["total_ms"] = round(self.finished_ms, 1)
+        totals["trace_events"] = self.event_count
+        return totals
+
+    def summary(self):
+        """
+        JSON-ready timeline: numbered steps, totals and any failures.
+        """
+        steps = [dict(step, step=number) for number, step in enumerate(self.steps, 1)]
+        summary = {"steps": steps, "totals": self.totals()}
+        if self.failures:
+            summary["failures"] = self.failures
+        return summary
+
+    def record_metrics(self, metrics):
+        """
+        Add step durations as stages (AgentModelMs, KnowledgeBaseMs,
+        ActionGroupMs), token usage and step/chunk counters.
+        """
+        for step in self.steps:
+            stage = STEP_STAGES.get(step["type"])
+            if stage is not None:
+                metrics.record(stage, step["duration_ms"])
+        totals = self.totals()
+        metrics.add_usage({"input_tokens": totals["input_tokens"], "output_tokens": totals["output_tokens"]})
+        metrics.count('AgentSteps', len(self.steps))
+        metrics.count('RetrievedChunks', totals["retrieved_chunks"])
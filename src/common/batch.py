@@ -0,0 +1,107 @@
+"""
+Bounded concurrent fan-out for multi-city batch requests.
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.city_index import canonicalize_city
+
+DEFAULT_MAX_CITIES = 500
+
+
+def normalize_city(city_name):
+    """
+    Normalization used to dedupe cities within a batch: the canonical city
+    ID, so "NYC" and "New York City" are generated once.
+    """
+    return canonicalize_city(city_name).id
+
+
+def get_batch_limits(default_concurrency):
+    """
+    Read the batch size and concurrency limits from the environment.
+    """
+    max_cities = int(os.environ.get('BATCH_MAX_CITIES', DEFAULT_MAX_CITIES))
+    max_concurrency = int(os.environ.get('BATCH_MAX_CONCURRENCY', default_concurrency))
+    return max_cities, max(1, max_concurrency)
+
+
+def run_batch(cities, worker, max_concurrency, time_budget_ms=None, key=normalize_city):
+    """
+    Run worker(city_name) for every unique city with at most max_concurrency
+    calls in flight. Returns one result per unique city, in request order,
+    with per-item status and timings. Blank and non-string entries are
+    counted as invalid, not as duplicates. Cities that have not started
+    when the time budget runs out are reported as errors instead of
+    overrunning the Lambda timeout.
+    """
+    started = time.perf_counter()
+    unique = []
+    seen = set()
+    invalid = 0
+    for city_name in cities:
+        if not isinstance(city_name, str) or not city_name.strip():
+            invalid += 1
+            continue
+        city_key = key(city_name)
+        if city_key in seen:
+            continue
+        seen.add(city_key)
+        unique.append(city_name)
+
+    def run_one(city_name):
+        item_started = time.perf_counter()
+        item = {"requested_city": city_name, "city": key(city_name)}
+        elapsed_ms = (item_started - started) * 1000
+        if time_budget_ms is not None and elapsed_ms >= time_budget_ms:
+            item.update({"status": "error", "error": "Skipped: batch time budget exhausted", "duration_ms": 0.0})
+            return item
+        try:
+            item.update(worker(city_name))
+            item["status"] = "ok"
+        except Exception as e:
+            print(f"Error processing {city_name} in batch: {str(e)}")
+            item["status"] = "error"
+            item["error"] = str(e)
+        item["queued_ms"] = round(elapsed_ms, 1)
+        item["duration_ms"] = round((time.perf_counter() - item_started) * 1000, 1)
+        return item
+
+    if unique:
+        # Workers run in the caller's context so per-request metrics reach them
+        request_context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(unique))) as pool:
+            futures = [pool.submit(request_context.copy().run, run_one, city_name) for city_name in unique]
+            results = [future.result() for future in futures]
+    else:
+        results = []
+
+    succeeded = sum(1 for item in results if item["status"] == "ok")
+    return {
+        "results": results,
+        "total_cities": len(cities),
+        "unique_cities": len(unique),
+        "duplicates_removed": len(cities) - invalid - len(unique),
+        "invalid": invalid,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "max_concurrency": max_concurrency,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def remaining_budget_ms(context, reserve_ms=2000, limit_ms=None):
+    """
+    Time left for batch work, keeping a reserve for building the response.
+    limit_ms caps the Lambda's remaining time (e.g. the API Gateway
+    integration timeout). Returns None when neither gives a deadline.
+    """
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    remaining = get_remaining() if get_remaining is not None else None
+    if limit_ms is not None:
+        remaining = limit_ms if remaining is None else min(remaining, limit_ms)
+    if remaining is None:
+        return None
+    return max(0, remaining - reserve_ms)
@@ -0,0 +1,364 @@
+"""
+Latency-aware invocation of Bedrock models.
+
+ResilientInvoker wraps a blocking model call with:
+  - per-attempt deadlines derived from the Lambda's remaining time
+  - jittered exponential backoff on throttling and transient errors
+  - an optional hedged second request once the call has run longer than
+    the observed p95; the first successful response wins
+  - a fallback model list tried when a model keeps failing
+
+Calls run on a shared thread pool so a deadline can be enforced while the
+call is still in flight. botocore cannot abort a request that has been
+sent, so a timed-out or losing call finishes in the background and its
+result is discarded; the client's read timeout still bounds it.
+
+Environment variables:
+  BEDROCK_FALLBACK_MODEL_IDS      comma-separated models tried after the primary
+  BEDROCK_MAX_ATTEMPTS            attempts per model (default 3)
+  BEDROCK_ATTEMPT_TIMEOUT_MS      upper bound for one attempt (default 12000)
+  BEDROCK_BACKOFF_BASE_MS         first retry backoff (default 100)
+  BEDROCK_BACKOFF_MAX_MS          backoff cap (default 2000)
+  BEDROCK_HEDGE_ENABLED           "true" to send hedged requests (default off)
+  BEDROCK_HEDGE_PERCENTILE        latency percentile used as hedge delay (default 95)
+  BEDROCK_HEDGE_MIN_SAMPLES       samples needed before the percentile is trusted (default 20)
+  BEDROCK_HEDGE_DEFAULT_DELAY_MS  hedge delay until then (default 4000)
+  BEDROCK_INVOKE_WORKERS          thread pool size; keep above 2x batch concurrency (default 32)
+  DEADLINE_RESERVE_MS             time kept back for building the response (default 1500)
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common.admission import AdmissionRejected
+from common.batch import remaining_budget_ms
+
+# Errors worth retrying against the same model after a backoff
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+    'InternalServerException',
+}
+
+# Retryable errors that mean the caller is over quota; answered with 429 like AdmissionRejected
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+THROTTLING_RETRY_AFTER_S = 1
+
+# Errors that mean this model cannot serve the request; move to the next model
+FALLBACK_ERROR_CODES = {
+    'AccessDeniedException',
+    'ResourceNotFoundException',
+    'ValidationException',
+}
+
+DEFAULT_RESERVE_MS = 1500
+LATENCY_WINDOW = 200
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when no attempt succeeded before the request deadline.
+    """
+
+
+class Deadline:
+    """
+    Absolute deadline for one request. A budget of None means no limit.
+    """
+
+    def __init__(self, budget_ms=None, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = None if budget_ms is None else clock() + budget_ms / 1000
+
+    @classmethod
+    def from_context(cls, context, reserve_ms=None, limit_ms=None):
+        """
+        Deadline from context.get_remaining_time_in_millis(), capped at
+        limit_ms (LambdaRequest.gateway_remaining_ms() for API Gateway
+        requests) and keeping reserve_ms (DEADLINE_RESERVE_MS) for building
+        the response.
+        """
+        if reserve_ms is None:
+            reserve_ms = int(os.environ.get('DEADLINE_RESERVE_MS', DEFAULT_RESERVE_MS))
+        return cls(remaining_budget_ms(context, reserve_ms, limit_ms))
+
+    def remaining_ms(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, (self.expires_at - self.clock()) * 1000)
+
+    def expired(self):
+        remaining = self.remaining_ms()
+        return remaining is not None and remaining <= 0
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies for one model.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms):
+        with self._lock:
+            self._samples.append(latency_ms)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class InvokePolicy:
+    """
+    Retry, timeout, hedging and fallback settings.
+    """
+
+    def __init__(self, fallback_model_ids=(), max_attempts=3, attempt_timeout_ms=12000,
+                 backoff_base_ms=100, backoff_max_ms=2000, hedge_enabled=False,
+                 hedge_percentile=95, hedge_min_samples=20, hedge_default_delay_ms=4000):
+        self.fallback_model_ids = list(fallback_model_ids)
+        self.max_attempts = max(1, max_attempts)
+        self.attempt_timeout_ms = attempt_timeout_ms
+        self.backoff_base_ms = backoff_base_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay_ms = hedge_default_delay_ms
+
+
+def policy_from_env(environ=None):
+    """
+    Build an InvokePolicy from the BEDROCK_* environment variables.
+    """
+    environ = os.environ if environ is None else environ
+    fallbacks = [m.strip() for m in environ.get('BEDROCK_FALLBACK_MODEL_IDS', '').split(',') if m.strip()]
+    return InvokePolicy(
+        fallback_model_ids=fallbacks,
+        max_attempts=int(environ.get('BEDROCK_MAX_ATTEMPTS', 3)),
+        attempt_timeout_ms=float(environ.get('BEDROCK_ATTEMPT_TIMEOUT_MS', 12000)),
+        backoff_base_ms=float(environ.get('BEDROCK_BACKOFF_BASE_MS', 100)),
+        backoff_max_ms=float(environ.get('BEDROCK_BACKOFF_MAX_MS', 2000)),
+        hedge_enabled=environ.get('BEDROCK_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        hedge_percentile=float(environ.get('BEDROCK_HEDGE_PERCENTILE', 95)),
+        hedge_min_samples=int(environ.get('BEDROCK_HEDGE_MIN_SAMPLES', 20)),
+        hedge_default_delay_ms=float(environ.get('BEDROCK_HEDGE_DEFAULT_DELAY_MS', 4000))
+    )
+
+
+class _AttemptTimeout(Exception):
+    pass
+
+
+def error_code(error):
+    # Imported on first use, so CLIENT_INIT_MODE=lazy does not load botocore during init
+    from botocore.exceptions import ClientError
+
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+class ResilientInvoker:
+    """
+    Runs call(model_id) under the policy. Latency is tracked per model
+    across calls, so keep one invoker per container. Calls must be
+    thread-safe; boto3 clients are.
+    """
+
+    def __init__(self, policy=None, max_workers=None, sleep=time.sleep, rng=None):
+        self.policy = policy or policy_from_env()
+        self.max_workers = max_workers or int(os.environ.get('BEDROCK_INVOKE_WORKERS', 32))
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.latency = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='bedrock-invoke')
+        return self._executor
+
+    def tracker(self, model_id):
+        tracker = self.latency.get(model_id)
+        if tracker is None:
+            with self._lock:
+                tracker = self.latency.setdefault(model_id, LatencyTracker())
+        return tracker
+
+    def hedge_delay_ms(self, model_id):
+        """
+        Delay before a hedged request: the tracked percentile latency once
+        enough samples exist, otherwise the configured default.
+        """
+        tracker = self.tracker(model_id)
+        if len(tracker) >= self.policy.hedge_min_samples:
+            return tracker.percentile(self.policy.hedge_percentile)
+        return self.policy.hedge_default_delay_ms
+
+    def backoff_ms(self, retry_number):
+        """
+        Full-jitter exponential backoff.
+        """
+        cap = min(self.policy.backoff_max_ms, self.policy.backoff_base_ms * (2 ** retry_number))
+        return self.rng.uniform(0, cap)
+
+    def invoke(self, call, model_ids, deadline=None, info=None):
+        """
+        Run call(model_id) for each model in model_ids (followed by the
+        policy's fallbacks) until one succeeds. When an info dict is passed it receives model_id,
+        attempts, retries, hedged, hedge_won and fallback_used, also when the call fails, so
+        every request sent to Bedrock (including hedges of failed attempts) is accounted for.
+        """
+        stats = {"attempts": 0, "retries": 0, "hedged": 0, "hedge_won": False, "fallback_used": False}
+        try:
+            return self._invoke(call, model_ids, deadline or Deadline(), stats)
+        finally:
+            if info is not None:
+                info.update(stats)
+
+    def _invoke(self, call, model_ids, deadline, stats):
+        if isinstance(model_ids, str):
+            model_ids = [model_ids]
+        candidates = list(dict.fromkeys(list(model_ids) + self.policy.fallback_model_ids))
+        last_error = None
+
+        for model_index, model_id in enumerate(candidates):
+            for attempt in range(self.policy.max_attempts):
+                if deadline.expired():
+                    break
+                stats["attempts"] += 1
+                try:
+                    result, hedge_won = self._attempt(call, model_id, deadline, stats)
+                except _AttemptTimeout as e:
+                    last_error = e
+                    print(f"Bedrock attempt on {model_id} exceeded its deadline")
+                    continue
+                except Exception as e:
+                    last_error = e
+                    code = error_code(e)
+                    if code in FALLBACK_ERROR_CODES:
+                        print(f"Model {model_id} unavailable ({code}); trying the next model")
+                        break
+                    if code not in RETRYABLE_ERROR_CODES:
+                        raise
+                    if attempt + 1 < self.policy.max_attempts:
+                        delay_ms = self.backoff_ms(attempt)
+                        remaining = deadline.remaining_ms()
+                        if remaining is not None:
+                            delay_ms = min(delay_ms, remaining)
+                        print(f"Bedrock {code} on {model_id}; retrying in {delay_ms:.0f} ms")
+                        stats["retries"] += 1
+                        self.sleep(delay_ms / 1000)
+                    continue
+                stats.update(model_id=model_id, hedge_won=hedge_won, fallback_used=model_index > 0)
+                return result
+            if deadline.expired():
+                break
+
+        if deadline.expired() or isinstance(last_error, _AttemptTimeout):
+            raise DeadlineExceeded(
+                f"No Bedrock response within the deadline after {stats['attempts']} attempts") from last_error
+        raise last_error
+
+    def _submit(self, call, model_id):
+        tracker = self.tracker(model_id)
+
+        def timed_call():
+            started = time.perf_counter()
+            result = call(model_id)
+            tracker.record((time.perf_counter() - started) * 1000)
+            return result
+
+        # Run in a copy of the caller's context so request metrics reach the worker
+        return self.executor.submit(contextvars.copy_context().run, timed_call)
+
+    def _attempt(self, call, model_id, deadline, stats):
+        """
+        One attempt, possibly hedged. Returns (result, hedge_won). A hedge
+        is counted in stats["hedged"] when it is sent, whatever the outcome.
+        """
+        timeout_ms = self.policy.attempt_timeout_ms
+        remaining = deadline.remaining_ms()
+        if remaining is not None:
+            timeout_ms = min(timeout_ms, remaining)
+        started = time.monotonic()
+
+        primary = self._submit(call, model_id)
+        pending = {primary}
+        hedge = None
+        if self.policy.hedge_enabled:
+            delay_ms = self.hedge_delay_ms(model_id)
+            if delay_ms is not None and delay_ms < timeout_ms:
+                done, _ = wait(pending, timeout=delay_ms / 1000)
+                if not done:
+                    hedge = self._submit(call, model_id)
+                    pending.add(hedge)
+                    stats["hedged"] += 1
+
+        error = None
+        while pending:
+            left_s = timeout_ms / 1000 - (time.monotonic() - started)
+            if left_s <= 0:
+                break
+            done, pending = wait(pending, timeout=left_s, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result(), future is hedge
+                error = future.exception()
+
+        for future in pending:
+            future.cancel()
+        if error is not None and not pending:
+            raise error
+        raise _AttemptTimeout(f"attempt on {model_id} exceeded {timeout_ms:.0f} ms")
+
+
+def error_response_status(error):
+    """
+    HTTP status and error label for an exception raised while invoking Bedrock:
+    429 when the quota budget is exhausted (admission control or Bedrock
+    throttling that outlasted the retries), 504 when the deadline ran out,
+    503 for other transient Bedrock errors, else 500.
+    """
+    if isinstance(error, AdmissionRejected) or error_code(error) in THROTTLING_ERROR_CODES:
+        return 429, "Too many requests"
+    if isinstance(error, DeadlineExceeded):
+        return 504, "Upstream timeout"
+    if error_code(error) in RETRYABLE_ERROR_CODES:
+        return 503, "Service unavailable"
+    return 500, "Internal server error"
+
+
+def error_response_headers(error):
+    """
+    Retry-After for a 429 from error_response_status(), otherwise no headers.
+    """
+    if isinstance(error, AdmissionRejected):
+        return {"Retry-After": str(error.retry_after)}
+    if error_code(error) in THROTTLING_ERROR_CODES:
+        return {"Retry-After": str(THROTTLING_RETRY_AFTER_S)}
+    return {}
@@ -0,0 +1,623 @@
+"""
+In-memory city metrics index built from the knowledge-base CSVs.
+
+The index is column-oriented: names live in plain lists and every metric
+lives in an array('d') with NaN for missing values, so ~4,500 cities fit in
+a few hundred KB. It is built once at package time (scripts/build-city-index.py)
+into city_index.json and loaded once per container at cold start.
+
+It is also where city names are canonicalized. canonicalize_city() folds
+whatever the caller typed ("NYC", "new york", "Zürich", "Hamilton, Bermuda",
+"Düsseldorf") to one dataset row and returns its canonical ID, which the
+handlers use for cache keys and metrics, and an unambiguous display name
+("Hamilton, Bermuda") for prompts. Names that match no row keep a folded
+ID, so different spellings of an unknown city still share a cache entry.
+A fuzzy match never replaces the requested name: "Macau" is not "Macae",
+so the hit is only reported as a suggestion.
+"""
+import csv
+import json
+import math
+import os
+import re
+import unicodedata
+from array import array
+
+INDEX_FILENAME = 'city_index.json'
+INDEX_VERSION = 3
+
+# Fuzzy matching: names sharing the most trigrams are checked by edit distance
+FUZZY_CANDIDATES = 25
+# Requested names canonicalized per container (misses included), cleared when full
+CANONICAL_CACHE_SIZE = 1024
+
+AIR_QUALITY_CSV = 'world_cities_air_quality_water_pollution_2021.csv'
+COST_OF_LIVING_CSV = 'world_cities_cost_of_living_2018.csv'
+
+# Metric columns in storage order: (field name, source CSV column)
+AIR_METRICS = [
+    ('air_quality', 'AirQuality'),
+    ('water_pollution', 'WaterPollution'),
+]
+COST_METRICS = [
+    ('cost_of_living_index', 'Cost of Living Index'),
+    ('rent_index', 'Rent Index'),
+    ('cost_of_living_plus_rent_index', 'Cost of Living Plus Rent Index'),
+    ('groceries_index', 'Groceries Index'),
+    ('restaurant_price_index', 'Restaurant Price Index'),
+    ('local_purchasing_power_index', 'Local Purchasing Power Index'),
+]
+METRIC_FIELDS = [name for name, _ in AIR_METRICS + COST_METRICS]
+
+# The two datasets spell some countries differently
+COUNTRY_ALIASES = {
+    'united states': 'united states of america',
+    'usa': 'united states of america',
+    'us': 'united states of america',
+    'uk': 'united kingdom',
+    'china': 'peoples republic of china',
+    'macedonia': 'north macedonia',
+    'kosovo disputed territory': 'kosovo',
+}
+
+# Common names that do not normalize to the dataset spelling
+CITY_ALIASES = {
+    'nyc': 'new york city',
+    'new york': 'new york city',
+    'new york ny': 'new york city',
+    'washington dc': 'washington d c',
+    'dc': 'washington d c',
+    'la': 'los angeles',
+    'sf': 'san francisco',
+    'new delhi': 'delhi',
+    'kyiv': 'kiev',
+    'bombay': 'mumbai',
+    'calcutta': 'kolkata',
+    'madras': 'chennai',
+    'poona': 'pune',
+    'bengaluru': 'bangalore',
+    'gurugram': 'gurgaon',
+    'saigon': 'ho chi minh city',
+    'peking': 'beijing',
+    'rangoon': 'yangon',
+    'nur sultan': 'astana',
+    'ulan bator': 'ulaanbaatar',
+    'koln': 'cologne',
+    'munchen': 'munich',
+    'wien': 'vienna',
+    'praha': 'prague',
+    'roma': 'rome',
+    'firenze': 'florence',
+    'genf': 'geneva',
+}
+
+# Abbreviated first words, tried expanded when the name itself is unknown ("St Louis")
+PREFIX_ABBREVIATIONS = {
+    'st': 'saint',
+    'ste': 'sainte',
+    'ft': 'fort',
+    'mt': 'mount',
+}
+
+# Letters NFKD does not split into a base letter and an accent
+FOLD_CHARACTERS = str.maketrans({
+    'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'ħ': 'h', 'ı': 'i', 'þ': 'th', 'æ': 'ae', 'œ': 'oe',
+})
+
+US_STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
+    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'DC': 'District of Columbia',
+    'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois',
+    'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana',
+    'ME': 'Maine', 'MD': 'Maryland', 'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota',
+    'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma', 'OR': 'Oregon',
+    'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota',
+    'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia',
+    'WA': 'Washington', 'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming',
+}
+
+
+def normalize_name(text):
+    """
+    Fold a place name to a lookup key: strip accents, lowercase,
+    drop punctuation and collapse whitespace ("Düsseldorf" -> "dusseldorf",
+    "Łódź" -> "lodz", "Washington, D.C." -> "washington d c").
+    """
+    folded = unicodedata.normalize('NFKD', text)
+    folded = ''.join(c for c in folded if not unicodedata.combining(c)).casefold().translate(FOLD_CHARACTERS)
+    folded = re.sub(r"['’]", '', folded)
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', folded).split())
+
+
+def normalize_country(text):
+    key = normalize_name(text)
+    return COUNTRY_ALIASES.get(key, key)
+
+
+def slug(text):
+    return normalize_name(text).replace(' ', '-')
+
+
+def name_variants(key):
+    """
+    The key as written, its alias and its expanded abbreviation, in that order.
+    """
+    variants = [key]
+    if key in CITY_ALIASES:
+        variants.append(CITY_ALIASES[key])
+    first, _, rest = key.partition(' ')
+    if first in PREFIX_ABBREVIATIONS and rest:
+        expanded = f"{PREFIX_ABBREVIATIONS[first]} {rest}"
+        variants.extend([expanded, CITY_ALIASES.get(expanded, expanded)])
+    return variants
+
+
+def trigrams(key):
+    """
+    Character trigrams of a key, padded so word starts count twice.
+    """
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(key):
+    """
+    Edits a fuzzy match may need: one typo in a short name changes it more
+    ("Atlantis" must not become "Atlantida").
+    """
+    return 1 if len(key) <= 8 else 2 if len(key) <= 14 else 3
+
+
+def edit_distance(a, b, limit):
+    """
+    Damerau-Levenshtein distance (adjacent transpositions count once),
+    or limit + 1 as soon as it is certain to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def display_from_input(name):
+    """
+    Tidy display form of a name the index does not know: whitespace
+    collapsed, and title case only when it was typed all in one case.
+    """
+    name = ' '.join(name.split())
+    return name.title() if name.islower() or name.isupper() else name
+
+
+def split_alternate_names(name):
+    """
+    "The Hague (Den Haag)" -> ["The Hague", "Den Haag"].
+    """
+    match = re.match(r'^(.*?)\s*\((.*)\)\s*$', name)
+    if not match:
+        return [name]
+    return [match.group(1), match.group(2)]
+
+
+class CityIndex:
+    """
+    Column-oriented city metrics with exact, alias and fuzzy lookup.
+    """
+
+    def __init__(self, cities, regions, countries, metrics, keys):
+        self.cities = cities
+        self.regions = regions
+        self.countries = countries
+        self.metrics = metrics
+        self.keys = keys
+        self._trigram_index = None
+        self._places = None
+        self._name_counts = None
+        self._canonical_names = {}
+
+    def __len__(self):
+        return len(self.cities)
+
+    def resolve(self, name, fuzzy=True):
+        """
+        Return (row, match_type) for a city name, or (None, None).
+        Tries the full key ("zurich switzerland"), then aliases and
+        abbreviations, then the city part before a country/state qualifier
+        (only rows in that place), then, unless fuzzy is False, trigram
+        fuzzy matching.
+        """
+        key = normalize_name(name or '')
+        if not key:
+            return None, None
+
+        rows = self.keys.get(key)
+        if rows:
+            return rows[0], 'exact'
+
+        for variant in name_variants(key)[1:]:
+            if variant in self.keys:
+                return self.keys[variant][0], 'alias'
+
+        qualifier = None
+        if ',' in name:
+            city_part, _, qualifier = name.partition(',')
+            key = normalize_name(city_part)
+            qualifier = normalize_name(qualifier)
+            if not key:
+                return None, None
+            for variant in name_variants(key):
+                rows = self.in_place(self.keys.get(variant, []), qualifier)
+                if rows is None:
+                    # "Paris, Texas" is not the Paris the index knows
+                    return None, None
+                if rows:
+                    return rows[0], 'qualified' if self.is_place(qualifier) else 'alias'
+
+        row = self.fuzzy_match(name_variants(key)[-1], qualifier) if fuzzy else None
+        if row is not None:
+            return row, 'fuzzy'
+        return None, None
+
+    def in_place(self, rows, qualifier):
+        """
+        The rows located in the place a qualifier names (a country, region or
+        US state code). Unrecognized qualifiers ("downtown") filter nothing;
+        None means the qualifier is a known place none of the rows is in.
+        """
+        place = self.is_place(qualifier) if rows else None
+        if not place:
+            return rows
+        matching = [row for row in rows
+                    if place in (normalize_country(self.countries[row]), normalize_name(self.regions[row]))]
+        return matching or None
+
+    def is_place(self, qualifier):
+        """
+        The normalized country or region a qualifier names ("fr" is not one,
+        "tx" is Texas), or None.
+        """
+        if not qualifier:
+            return None
+        if self._places is None:
+            self._places = ({normalize_country(country) for country in self.countries}
+                            | {normalize_name(region) for region in self.regions if region})
+        qualifier = normalize_country(qualifier)
+        state = US_STATES.get(qualifier.upper())
+        place = normalize_name(state) if state else qualifier
+        return place if place in self._places else None
+
+    def fuzzy_match(self, key, qualifier=None):
+        """
+        The closest bare city name within max_typos(key) edits, or None.
+        Candidates are the names sharing the most trigrams with the key;
+        ties go to more shared trigrams, then the earlier (more prominent)
+        row. A qualifier restricts the candidates to that place.
+        """
+        if self._trigram_index is None:
+            # Built on first use: most requests resolve exactly
+            postings = {}
+            for city_key in sorted({normalize_name(city) for city in self.cities}):
+                if city_key in self.keys:
+                    for gram in trigrams(city_key):
+                        postings.setdefault(gram, []).append(city_key)
+            self._trigram_index = postings
+        grams = trigrams(key)
+        shared = {}
+        for gram in grams:
+            for city_key in self._trigram_index.get(gram, ()):
+                shared[city_key] = shared.get(city_key, 0) + 1
+        limit = max_typos(key)
+        # Each edit changes at most three trigrams, so names sharing fewer cannot be within limit
+        required = len(grams) - 3 * limit
+        shared = {city_key: count for city_key, count in shared.items() if count >= required}
+        best = None
+        for city_key in sorted(shared, key=lambda k: -shared[k])[:FUZZY_CANDIDATES]:
+            distance = edit_distance(key, city_key, limit)
+            if distance > limit:
+                continue
+            rows = self.in_place(self.keys[city_key], qualifier)
+            if not rows:
+                continue
+            candidate = (distance, -shared[city_key], rows[0])
+            if best is None or candidate < best:
+                best = candidate
+        return best[2] if best else None
+
+    def row_metrics(self, row):
+        values = {}
+        for field in METRIC_FIELDS:
+            value = self.metrics[field][row]
+            values[field] = None if math.isnan(value) else round(value, 2)
+        return values
+
+    def lookup(self, name):
+        """
+        Return metrics for a city name as a dict, or None when unknown.
+        """
+        row, match_type = self.resolve(name)
+        if row is None:
+            return None
+        return self.describe(row, match_type)
+
+    def describe(self, row, match_type):
+        """
+        Metrics dict for a resolved row.
+        """
+        metrics = self.row_metrics(row)
+        return {
+            "city": self.cities[row],
+            "region": self.regions[row] or None,
+            "country": self.countries[row],
+            "match": match_type,
+            "air_quality": metrics["air_quality"],
+            "water_pollution": metrics["water_pollution"],
+            "cost_of_living": {field: metrics[field] for field, _ in COST_METRICS}
+        }
+
+    def canonical(self, row, match_type):
+        """
+        CanonicalCity for a resolved row. The display name adds the region
+        only when the city name alone is ambiguous within its country.
+        """
+        if row in self._canonical_names:
+            city_id, display = self._canonical_names[row]
+            return CanonicalCity(city_id, self.cities[row], display, match_type, self, row)
+        if self._name_counts is None:
+            counts = {}
+            for city, country in zip(self.cities, self.countries):
+                name_key = (normalize_name(city), normalize_country(country))
+                counts[name_key] = counts.get(name_key, 0) + 1
+            self._name_counts = counts
+        city, region, country = self.cities[row], self.regions[row], self.countries[row]
+        ambiguous = self._name_counts[(normalize_name(city), normalize_country(country))] > 1 and region
+        parts = [city, region, country] if ambiguous else [city, country]
+        if normalize_name(city) == normalize_name(country):
+            # City-states: "Singapore", not "Singapore, Singapore"
+            parts = [city]
+        city_id = ':'.join(slug(part) if part is not country else slug(normalize_country(part)) for part in parts)
+        self._canonical_names[row] = (city_id, ', '.join(parts))
+        return CanonicalCity(city_id, city, ', '.join(parts), match_type, self, row)
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "cities": self.cities,
+            "regions": self.regions,
+            "countries": self.countries,
+            # NaN is not valid JSON, so missing values are stored as null
+            "metrics": {
+                field: [None if math.isnan(v) else v for v in column]
+                for field, column in self.metrics.items()
+            },
+            "keys": self.keys
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported city index version: {data.get('version')}")
+        metrics = {
+            field: array('d', (math.nan if v is None else v for v in column))
+            for field, column in data["metrics"].items()
+        }
+        return cls(data["cities"], data["regions"], data["countries"], metrics, data["keys"])
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'), ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class CanonicalCity:
+    """
+    A requested city name resolved to its canonical form.
+
+    id       stable key for caching and metrics: "zurich:switzerland", or the
+             folded name for cities the index does not know ("springfield-gardens")
+    name     dataset spelling for responses ("Washington, D.C.")
+    display  unambiguous name for prompts ("Portland, Maine, United States of America")
+    match    how the name resolved: exact, alias, qualified ("Portland, ME"),
+             fuzzy (the requested name is kept; see suggestion) or None
+             (not in the index)
+    suggestion  for fuzzy matches, the CanonicalCity the name resembles
+                ("Berln" -> Berlin), reported in metrics but never used
+    """
+
+    def __init__(self, id, name, display, match=None, index=None, row=None, suggestion=None):
+        self.id = id
+        self.name = name
+        self.display = display
+        self.match = match
+        self.index = index
+        self.row = row
+        self.suggestion = suggestion
+
+    def metrics(self):
+        """
+        Knowledge-base metrics for the city, or None when it is not in the index.
+        """
+        return self.index.describe(self.row, self.match) if self.row is not None else None
+
+
+def build_city_index(data_dir):
+    """
+    Build the index from the two knowledge-base CSVs.
+    Air-quality rows come first (in file order, which keeps the most
+    prominent city first for ambiguous names); cost-of-living rows are
+    joined onto them by city and country, or appended when unmatched.
+    """
+    cities, regions, countries = [], [], []
+    metrics = {field: array('d') for field in METRIC_FIELDS}
+    keys = {}
+    by_city_country = {}
+    country_names = {}
+
+    def add_key(key, row):
+        if key:
+            rows = keys.setdefault(key, [])
+            if row not in rows:
+                rows.append(row)
+
+    def add_row(city, region, country):
+        row = len(cities)
+        cities.append(city)
+        regions.append(region)
+        countries.append(country)
+        for field in METRIC_FIELDS:
+            metrics[field].append(math.nan)
+        return row
+
+    with open(os.path.join(data_dir, AIR_QUALITY_CSV), encoding='utf-8', newline='') as f:
+        for record in csv.DictReader(f, skipinitialspace=True):
+            city, region, country = record['City'], record['Region'], record['Country']
+            row = add_row(city, region, country)
+            for field, column in AIR_METRICS:
+                metrics[field][row] = float(record[column])
+            city_key = normalize_name(city)
+            add_key(city_key, row)
+            add_key(f"{city_key} {normalize_name(country)}", row)
+            if region:
+                add_key(f"{city_key} {normalize_name(region)}", row)
+            by_city_country.setdefault((city_key, normalize_country(country)), []).append(row)
+            country_names.setdefault(normalize_country(country), country)
+
+    state_codes = {normalize_name(name): code.lower() for code, name in US_STATES.items()}
+    for row, (city, region) in enumerate(zip(cities, regions)):
+        code = state_codes.get(normalize_name(region)) if countries[row] == 'United States of America' else None
+        if code:
+            add_key(f"{normalize_name(city)} {code}", row)
+
+    with open(os.path.join(data_dir, COST_OF_LIVING_CSV), encoding='utf-8', newline='') as f:
+        for record in csv.DictReader(f):
+            parts = [part.strip() for part in record['City'].split(',')]
+            city, country = parts[0], parts[-1]
+            state = parts[1] if len(parts) == 3 else None
+            country_key = normalize_country(country)
+
+            row = None
+            for name in split_alternate_names(city):
+                name_key = normalize_name(name)
+                city_key = CITY_ALIASES.get(f"{name_key} {normalize_name(state)}" if state else name_key,
+                                            CITY_ALIASES.get(name_key, name_key))
+                candidates = by_city_country.get((city_key, country_key), [])
+                if state and state in US_STATES:
+                    in_state = [r for r in candidates if regions[r] == US_STATES[state]]
+                    candidates = in_state or candidates
+                if candidates:
+                    row = candidates[0]
+                    break
+
+            if row is None:
+                # Spell the country the way the air-quality rows do ("United States of America")
+                row = add_row(split_alternate_names(city)[0], US_STATES.get(state, state or ''),
+                              country_names.get(country_key, country))
+            for field, column in COST_METRICS:
+                metrics[field][row] = float(record[column])
+
+            add_key(normalize_name(record['City']), row)
+            for name in split_alternate_names(city):
+                name_key = normalize_name(name)
+                add_key(name_key, row)
+                add_key(f"{name_key} {normalize_name(country)}", row)
+                if state:
+                    add_key(f"{name_key} {normalize_name(state)}", row)
+
+    return CityIndex(cities, regions, countries, metrics, keys)
+
+
+def default_index_paths():
+    """
+    Candidate locations: CITY_INDEX_PATH, the Lambda package root and the
+    repository's knowledge-base directory (for local development).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    task_root = os.environ.get('LAMBDA_TASK_ROOT', os.path.dirname(here))
+    return {
+        "artifact": os.environ.get('CITY_INDEX_PATH', os.path.join(task_root, INDEX_FILENAME)),
+        "data_dir": os.path.join(here, '..', '..', 'data', 'knowledge-base')
+    }
+
+
+_city_index = None
+_city_index_loaded = False
+
+
+def get_city_index():
+    """
+    Load the city index once per container. Returns None when neither the
+    packaged artifact nor the source CSVs are available.
+    """
+    global _city_index, _city_index_loaded
+    if _city_index_loaded:
+        return _city_index
+    _city_index_loaded = True
+
+    paths = default_index_paths()
+    try:
+        if os.path.exists(paths["artifact"]):
+            _city_index = CityIndex.load(paths["artifact"])
+        elif os.path.exists(os.path.join(paths["data_dir"], AIR_QUALITY_CSV)):
+            _city_index = build_city_index(paths["data_dir"])
+        else:
+            print("City index not available; metrics lookups disabled")
+    except Exception as e:
+        print(f"Error loading city index: {e}")
+        _city_index = None
+    return _city_index
+
+
+def lookup_city_metrics(name):
+    """
+    Convenience wrapper returning metrics for a city name, or None.
+    """
+    index = get_city_index()
+    return index.lookup(name) if index is not None else None
+
+
+def canonicalize_from_index(index, name):
+    """
+    canonicalize_city() against a given index (None when unavailable),
+    without the per-container memo.
+    """
+    row, match_type = index.resolve(name) if index is not None else (None, None)
+    if row is not None and match_type != 'fuzzy':
+        return index.canonical(row, match_type)
+    # A typo and a different real city look the same to the index, so keep what was asked
+    display = display_from_input(name)
+    suggestion = index.canonical(row, match_type) if row is not None else None
+    return CanonicalCity(slug(name) or display, display, display, match_type, suggestion=suggestion)
+
+
+_canonical_cities = {}
+
+
+def canonicalize_city(name):
+    """
+    Resolve a requested city name to a CanonicalCity. Without the index
+    (or for unknown names) the ID is the folded name and the display name
+    is the input, tidied. Results are remembered per container, so repeat
+    names skip folding and fuzzy matching.
+    """
+    if name in _canonical_cities:
+        return _canonical_cities[name]
+    city = canonicalize_from_index(get_city_index(), name)
+    if len(_canonical_cities) >= CANONICAL_CACHE_SIZE:
+        _canonical_cities.clear()
+    _canonical_cities[name] = city
+    return city
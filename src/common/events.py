@@ -0,0 +1,282 @@
+"""
+Normalization of the Lambda events both handlers accept.
+
+normalize_event() classifies an event once through EVENT_SOURCES (Bedrock
+agent action group, API Gateway HTTP API / REST API, direct invocation),
+decodes the body at most once (including base64 bodies) and returns a
+LambdaRequest with the city, batch list, question and merged options.
+"""
+import base64
+import json
+import os
+import time
+
+from common.city_index import get_city_index
+
+AGENT_EVENT_KEYS = ('agent', 'sessionId', 'inputText', 'messageVersion')
+HTTP_EVENT_KEYS = ('requestContext', 'httpMethod', 'body', 'queryStringParameters')
+INPUT_TEXT_MARKERS = ('about', 'for', 'in')
+# Words around a city name in agent inputText that are not part of it
+INPUT_TEXT_LEADING = ('the', 'city', 'of', 'town')
+INPUT_TEXT_TRAILING = ('please', 'today', 'now', 'city')
+# Longest city name, in words, tried against the city index
+INPUT_TEXT_MAX_WORDS = 5
+# API Gateway gives up on an integration after 29 seconds, whatever the Lambda timeout
+API_GATEWAY_TIMEOUT_MS = int(os.environ.get('API_GATEWAY_TIMEOUT_MS', '29000'))
+
+
+def is_truthy(value):
+    """
+    Interpret booleans sent as JSON values or query string text.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+class LambdaRequest:
+    """
+    One Lambda event, decoded once.
+
+    source      key of the EVENT_SOURCES entry that decoded it
+    city        requested city name, or None
+    cities      batch city list, or None when no batch was requested; a
+                string is only split when cities_separator is set
+    question    optional free-text question
+    input_text  agent inputText, if any
+    options     request options; the direct payload wins over the JSON body,
+                which wins over the query string
+    headers     request headers with lower-cased names
+    received_at time.monotonic() when the event was decoded
+    """
+
+    def __init__(self, source, event, options, headers=None, input_text=None):
+        self.source = source
+        self.event = event
+        self.received_at = time.monotonic()
+        self.options = options
+        self.headers = headers or {}
+        self.input_text = input_text
+        city = options.get('city')
+        self.city = city if isinstance(city, str) and city.strip() else None
+        if self.city is None and input_text:
+            self.city = city_from_input_text(input_text)
+        question = options.get('question')
+        self.question = question if isinstance(question, str) and question else None
+        separator = options.get('cities_separator')
+        separator = separator if isinstance(separator, str) and separator else None
+        self.cities = None if self.is_agent_call else parse_cities(options.get('cities'), separator)
+
+    @property
+    def is_agent_call(self):
+        return self.source == 'agent_action_group'
+
+    def gateway_remaining_ms(self):
+        """
+        Time left before API Gateway times out the integration, or None for
+        events that did not come through API Gateway. The agent function's
+        timeout is sized for async jobs, so its remaining time alone would
+        let synchronous requests run past the gateway's 504.
+        """
+        if not self.source.startswith('api_gateway'):
+            return None
+        return max(0.0, API_GATEWAY_TIMEOUT_MS - (time.monotonic() - self.received_at) * 1000)
+
+    @property
+    def wants_event_stream(self):
+        """
+        True when the client asked for Server-Sent Events via the Accept header.
+        """
+        return 'text/event-stream' in str(self.headers.get('accept', ''))
+
+    def option(self, name, default=None):
+        value = self.options.get(name)
+        return default if value is None else value
+
+    def flag(self, name):
+        return is_truthy(self.options.get(name, False))
+
+    def int_option(self, name, default, minimum, maximum):
+        """
+        Integer option clamped to [minimum, maximum]. Missing or
+        non-numeric values give the default.
+        """
+        value = self.options.get(name)
+        if value is None or isinstance(value, bool):
+            return default
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return default
+        return min(maximum, max(minimum, value))
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+def _ends_sentence(word):
+    if word[-1] in '?!;':
+        return True
+    # "Paris." ends a sentence; "St." and "D.C." do not
+    stem = word.rstrip('.')
+    return word != stem and len(stem) > 3 and '.' not in stem
+
+
+def _phrase_after(words, start):
+    """
+    Words from start to the end of the sentence, without quotes and
+    sentence punctuation.
+    """
+    phrase = []
+    for word in words[start:]:
+        phrase.append(word.strip('"\'“”'))
+        if _ends_sentence(word):
+            break
+    if phrase:
+        last = phrase[-1].rstrip('?!;:,')
+        phrase[-1] = last[:-1] if last and _ends_sentence(last) else last
+    return [word for word in phrase if word]
+
+
+def _skip_leading(phrase):
+    """
+    Start offsets for a phrase: as written, then past each leading filler
+    word ("the city of Paris"), so "The Hague" is still tried whole.
+    """
+    offsets = [0]
+    while offsets[-1] < len(phrase) and phrase[offsets[-1]].lower() in INPUT_TEXT_LEADING:
+        offsets.append(offsets[-1] + 1)
+    return offsets
+
+
+def city_from_input_text(input_text):
+    """
+    City name from agent natural-language input. After each "about", "for"
+    or "in" the longest run of words the city index knows wins ("facts
+    about Salt Lake City in Utah" -> "Salt Lake City", "tell me about
+    Hamilton, Bermuda please" -> "Hamilton, Bermuda"). Without a known
+    city it is the rest of the sentence after the last marker, otherwise
+    the whole text.
+    """
+    words = input_text.split()
+    starts = [i + 1 for i, word in enumerate(words) if word.lower().strip(',') in INPUT_TEXT_MARKERS]
+    index = get_city_index()
+    if index is not None:
+        for start in starts:
+            phrase = _phrase_after(words, start)
+            for offset in _skip_leading(phrase):
+                for length in range(min(len(phrase) - offset, INPUT_TEXT_MAX_WORDS), 0, -1):
+                    candidate = ' '.join(phrase[offset:offset + length]).rstrip(',')
+                    match_type = index.resolve(candidate, fuzzy=False)[1]
+                    # A comma must introduce a known place, not "Hamilton, Bermuda please"
+                    if match_type in ('exact', 'qualified') or (match_type and ',' not in candidate):
+                        return candidate
+                    # "Paris, Texas" names a place, just not one the index has a Paris in
+                    if match_type is None and ',' in candidate and index.is_place(candidate.split(',', 1)[1]):
+                        return candidate
+    for start in reversed(starts):
+        phrase = _phrase_after(words, start)
+        phrase = phrase[_skip_leading(phrase)[-1]:]
+        while phrase and phrase[-1].lower() in INPUT_TEXT_TRAILING:
+            phrase.pop()
+        if phrase:
+            return ' '.join(phrase).rstrip(',')
+    return input_text.strip() or None
+
+
+def parse_cities(cities, separator=None):
+    """
+    Batch list from a JSON array. A string is one city name unless a
+    separator is given, because names like "Washington, D.C." contain
+    commas. Blank and non-string entries are kept for run_batch to count
+    as invalid.
+    """
+    if isinstance(cities, str):
+        cities = cities.split(separator) if separator else [cities]
+    if not isinstance(cities, list):
+        return None
+    return list(cities)
+
+
+def _merge(options, values):
+    for name, value in values.items():
+        if value is not None:
+            options[name] = value
+    return options
+
+
+def _lower_headers(headers):
+    if not isinstance(headers, dict):
+        return {}
+    return {str(name).lower(): value for name, value in headers.items()}
+
+
+def decode_body(event):
+    """
+    The event body as a dict: JSON text (base64-decoded when
+    isBase64Encoded is set) or an already-parsed dict. Anything else is None.
+    """
+    body = event.get('body')
+    if isinstance(body, (str, bytes)):
+        try:
+            if event.get('isBase64Encoded'):
+                body = base64.b64decode(body)
+            body = json.loads(body) if body.strip() else None
+        except ValueError:
+            return None
+    return body if isinstance(body, dict) else None
+
+
+def _decode_agent_event(event):
+    options = _merge({}, event)
+    for parameter in event.get('parameters') or []:
+        if isinstance(parameter, dict) and 'name' in parameter:
+            options[parameter['name']] = parameter.get('value')
+    try:
+        properties = event['requestBody']['content']['application/json'].get('properties', [])
+    except (KeyError, TypeError, AttributeError):
+        properties = []
+    for prop in properties:
+        if isinstance(prop, dict) and 'name' in prop:
+            options[prop['name']] = prop.get('value')
+    input_text = event.get('inputText')
+    return options, {}, input_text if isinstance(input_text, str) else None
+
+
+def _decode_http_event(event):
+    options = _merge({}, event.get('queryStringParameters') or {})
+    # A repeated ?cities=...&cities=... is a list; queryStringParameters keeps only the last
+    repeated = (event.get('multiValueQueryStringParameters') or {}).get('cities')
+    if isinstance(repeated, list) and len(repeated) > 1:
+        options['cities'] = repeated
+    _merge(options, decode_body(event) or {})
+    return options, _lower_headers(event.get('headers')), None
+
+
+def _decode_direct_event(event):
+    return dict(event), _lower_headers(event.get('headers')), None
+
+
+# (source, matches(event), decode(event) -> (options, headers, input_text)); first match wins
+EVENT_SOURCES = (
+    ('agent_action_group', lambda event: any(key in event for key in AGENT_EVENT_KEYS), _decode_agent_event),
+    ('api_gateway_v2', lambda event: event.get('version') == '2.0' and 'requestContext' in event,
+     _decode_http_event),
+    ('api_gateway_v1', lambda event: any(key in event for key in HTTP_EVENT_KEYS), _decode_http_event),
+    ('direct', lambda event: True, _decode_direct_event),
+)
+
+
+def normalize_event(event):
+    """
+    LambdaRequest for a raw Lambda event. Already-normalized requests are
+    returned unchanged, so nested entry points can be handed one.
+    """
+    if isinstance(event, LambdaRequest):
+        return event
+    if not isinstance(event, dict):
+        event = {}
+    for source, matches, decode in EVENT_SOURCES:
+        if matches(event):
+            options, headers, input_text = decode(event)
+            return LambdaRequest(source, event, options, headers, input_text)
@@ -0,0 +1,273 @@
+"""
+Two-tier cache for generated city facts.
+
+The in-process LRU tier lives at module scope, so it survives warm Lambda
+invocations. A read-only artifact of pre-generated facts (see
+precomputed_facts.py) can sit behind it, and the optional persistent tier
+is shared between containers (DynamoDB) or backed by a local SQLite file
+for development and tests.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from common.precomputed_facts import load_precomputed_facts
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def make_cache_key(city, model_id, prompt_version):
+    """
+    Build the cache key for a normalized city name.
+    The model ID and prompt version are part of the key so that changing
+    either one never serves facts generated by an older configuration.
+    """
+    return f"{prompt_version}|{model_id}|{city}"
+
+
+class SQLiteFactStore:
+    """
+    Persistent tier backed by a local SQLite file.
+    Useful for local development, tests and /tmp reuse inside one container.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS facts ("
+            "cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM facts WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO facts (cache_key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM facts WHERE cache_key = ?", (key,))
+            self._conn.commit()
+
+
+class DynamoDBFactStore:
+    """
+    Persistent tier backed by a DynamoDB table shared by all containers.
+    The table needs a string partition key named `cache_key`; enabling
+    DynamoDB TTL on `expires_at` lets expired items be removed automatically.
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from common.runtime import get_client
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def get(self, key):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"cache_key": {"S": key}},
+            ConsistentRead=False
+        )
+        item = response.get("Item")
+        if not item:
+            return None
+        return json.loads(item["value"]["S"]), float(item["expires_at"]["N"])
+
+    def put(self, key, value, expires_at):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "cache_key": {"S": key},
+                "value": {"S": json.dumps(value)},
+                "expires_at": {"N": str(int(expires_at))}
+            }
+        )
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={"cache_key": {"S": key}})
+
+
+class FactCache:
+    """
+    In-process LRU cache with TTL in front of optional precomputed facts
+    and an optional persistent store. Store errors are logged and treated as misses so a broken cache never
+    fails a request.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 store=None, enabled=True, clock=time.time, precomputed=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.precomputed = precomputed
+        self.enabled = enabled
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.precomputed_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """
+        Return (value, tier) where tier is "memory", "precomputed" or
+        "store", or (None, None) on a miss.
+        """
+        if not self.enabled:
+            return None, None
+
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value, "memory"
+                del self._entries[key]
+
+        if self.precomputed is not None:
+            try:
+                value = self.precomputed.get(key)
+            except Exception as e:
+                print(f"Precomputed facts read failed: {e}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value, now + self.ttl_seconds)
+                    self.precomputed_hits += 1
+                return value, "precomputed"
+
+        if self.store is not None:
+            try:
+                stored = self.store.get(key)
+            except Exception as e:
+                print(f"Fact cache store read failed: {e}")
+                stored = None
+            if stored is not None and stored[1] > now:
+                value, expires_at = stored
+                with self._lock:
+                    self._remember(key, value, expires_at)
+                    self.store_hits += 1
+                return value, "store"
+
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def get(self, key):
+        return self.lookup(key)[0]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        expires_at = self.clock() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self.store is not None:
+            try:
+                self.store.put(key, value, expires_at)
+            except Exception as e:
+                print(f"Fact cache store write failed: {e}")
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.store is not None:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                print(f"Fact cache store delete failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, value, expires_at):
+        # Caller holds the lock
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.precomputed_hits + self.store_hits
+            total = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "precomputed_hits": self.precomputed_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(hits / total, 4) if total else 0.0
+            }
+
+
+def store_from_spec(spec):
+    """
+    Build a persistent store from a spec string:
+    "sqlite:/tmp/facts.db" or "dynamodb:<table-name>". Empty means no store.
+    """
+    if not spec:
+        return None
+    kind, _, target = spec.partition(':')
+    if kind == 'sqlite' and target:
+        return SQLiteFactStore(target)
+    if kind == 'dynamodb' and target:
+        return DynamoDBFactStore(target)
+    raise ValueError(f"Unsupported fact cache store: {spec}")
+
+
+def cache_from_env(environ=None):
+    """
+    Create a FactCache configured from environment variables:
+    FACT_CACHE_ENABLED, FACT_CACHE_MAX_ENTRIES, FACT_CACHE_TTL_SECONDS, FACT_CACHE_STORE
+    and PRECOMPUTED_FACTS_PATH (defaults to precomputed_facts.bin in the package).
+    """
+    environ = os.environ if environ is None else environ
+    enabled = environ.get('FACT_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+    store = None
+    precomputed = None
+    if enabled:
+        try:
+            store = store_from_spec(environ.get('FACT_CACHE_STORE', ''))
+        except Exception as e:
+            print(f"Fact cache store disabled: {e}")
+        precomputed = load_precomputed_facts(environ.get('PRECOMPUTED_FACTS_PATH'))
+    return FactCache(
+        max_entries=int(environ.get('FACT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=int(environ.get('FACT_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+        store=store,
+        enabled=enabled,
+        precomputed=precomputed
+    )
@@ -0,0 +1,251 @@
+"""
+Single-pass, tolerant extraction of facts from Claude answers.
+
+Claude is asked to answer with {"city": ..., "facts": [...]}. In practice the
+JSON may be wrapped in prose or code fences, contain trailing commas or
+unescaped quotes, be cut off at max_tokens, or be replaced by a numbered
+list. FactStreamParser handles all of these in one pass over the text and
+works the same on a complete answer or on deltas from a response stream,
+emitting each fact as soon as it is complete.
+"""
+import json
+import re
+
+# Keys whose string value is the fact when facts come back as objects
+FACT_OBJECT_KEYS = ('fact', 'text', 'description', 'content')
+
+# Lines that are pure JSON punctuation in the prose fallback
+JSON_SYNTAX_LINES = {'{', '}', '[', ']', ',', '",', '"', '":"', '"facts":', '"city":'}
+
+PROSE_SPECIAL = re.compile(r'[{\n]')
+STRING_SPECIAL = re.compile(r'["\\]')
+WHITESPACE = re.compile(r'[ \t\r\n]+')
+
+# Raw control characters (e.g. newlines) inside model strings are tolerated
+STRING_DECODER = json.JSONDecoder(strict=False)
+
+MIN_PROSE_FACT_LENGTH = 20
+MAX_PROSE_FACTS = 10
+
+
+class FactStreamParser:
+    """
+    Character-level state machine over a (possibly partial) answer.
+
+    Text before the first '{' is scanned line by line as a numbered-list
+    fallback. Inside the JSON object, strings in the "facts" array are
+    emitted once the next structural character confirms they ended; a
+    quote followed by anything else is treated as part of the string, which
+    recovers from unescaped quotes. Each feed() only scans the new text, and
+    runs of prose or string content are copied in bulk rather than per char.
+    """
+
+    def __init__(self):
+        self.facts = []
+        self.city = None
+        self.done = False
+        self._started = False
+        self._prose_line = []
+        self._prose_facts = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_chars = []
+        self._pending = None
+        self._pending_gap = []
+        self._pending_comma = False
+        self._last_string = None
+        self._last_key = None
+        self._facts_depth = None
+
+    def feed(self, text):
+        """
+        Consume the next chunk of text and return the facts completed by it.
+        """
+        completed = []
+        if self.done:
+            return completed
+
+        position = 0
+        length = len(text)
+        while position < length:
+            if not self._started:
+                # Bulk-skip prose up to the next line break or opening brace
+                match = PROSE_SPECIAL.search(text, position)
+                end = match.start() if match else length
+                self._prose_line.append(text[position:end])
+                if not match:
+                    break
+                position = end + 1
+                if match.group() == '{':
+                    self._started = True
+                    self._stack.append('{')
+                self._end_prose_line()
+                continue
+
+            if self._in_string and not self._escape:
+                # Bulk-copy string content up to the next quote or backslash
+                match = STRING_SPECIAL.search(text, position)
+                end = match.start() if match else length
+                if end > position:
+                    self._string_chars.append(text[position:end])
+                if not match:
+                    break
+                position = end
+
+            char = text[position]
+            if self._pending is None and not self._in_string and char in ' \t\r\n':
+                position = WHITESPACE.match(text, position).end()
+                continue
+            position += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._string_chars.append(char)
+                    self._escape = False
+                elif char == '\\':
+                    self._string_chars.append(char)
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._pending = ''.join(self._string_chars)
+                    self._pending_gap = []
+                    self._pending_comma = False
+                continue
+
+            if self._pending is not None:
+                if char in ' \t\r\n':
+                    self._pending_gap.append(char)
+                    continue
+                if self._pending_comma:
+                    # A comma only separates facts if another element follows it
+                    structural = char in '"]{'
+                elif char == ',' and self._facts_depth == len(self._stack) and self._stack[-1] == '[':
+                    self._pending_comma = True
+                    self._pending_gap.append(char)
+                    continue
+                else:
+                    structural = char in ',]}:'
+                if not structural:
+                    # The quote was part of the text, e.g. "the "Big Apple", a nickname"
+                    self._string_chars = list(self._pending) + ['\\"'] + self._pending_gap + [char]
+                    self._pending = None
+                    self._pending_comma = False
+                    self._in_string = True
+                    if char == '\\':
+                        self._escape = True
+                    elif char == '"':
+                        self._string_chars[-1] = '\\"'
+                    continue
+                self._commit_string(completed)
+                if self._pending_comma:
+                    self._pending_comma = False
+                    self._last_key = None
+
+            if char == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif char == ':':
+                self._last_key = self._last_string
+            elif char in '{[':
+                self._stack.append(char)
+                if char == '[' and self._last_key and self._last_key.lower() == 'facts' and self._facts_depth is None:
+                    self._facts_depth = len(self._stack)
+                self._last_key = None
+            elif char in '}]':
+                if self._facts_depth is not None and len(self._stack) == self._facts_depth:
+                    self.done = True
+                    break
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    break
+            elif char == ',':
+                self._last_key = None
+
+        return completed
+
+    def finish(self):
+        """
+        Signal the end of the answer and return the final list of facts.
+        A fact whose closing quote was seen is kept even if the JSON was
+        truncated; a string cut off mid-way is dropped. When no JSON facts
+        were found, the numbered/bulleted lines before the JSON are used.
+        """
+        if self._pending is not None:
+            self._commit_string([])
+        if not self._started:
+            self._end_prose_line()
+        if self.facts:
+            return self.facts
+        return self._prose_facts[:MAX_PROSE_FACTS]
+
+    def _in_fact_object(self):
+        return (self._facts_depth is not None and len(self._stack) == self._facts_depth + 1
+                and self._stack[-1] == '{')
+
+    def _commit_string(self, completed):
+        value = self._decode_string(self._pending)
+        self._pending = None
+        depth = len(self._stack)
+        is_fact = self._facts_depth is not None and (
+            (depth == self._facts_depth and self._stack[-1] == '[') or
+            (self._in_fact_object() and self._last_key is not None and
+             self._last_key.lower() in FACT_OBJECT_KEYS)
+        )
+        if is_fact:
+            value = value.strip()
+            if value:
+                self.facts.append(value)
+                completed.append(value)
+            self._last_key = None
+            return
+        if self._last_key == 'city' and depth == 1 and self.city is None:
+            self.city = value
+        self._last_string = value
+
+    def _end_prose_line(self):
+        line = ''.join(self._prose_line).strip()
+        self._prose_line = []
+        if not line or len(line) <= 3 or line in JSON_SYNTAX_LINES:
+            return
+        if line.startswith(('{', '[', '`')) or line.endswith(('}', ']', ':')):
+            return
+        if line.startswith('"') and '":' in line:
+            return
+        cleaned = line.lstrip('0123456789.-*•) ').strip('"').strip(',').strip()
+        if len(cleaned) > MIN_PROSE_FACT_LENGTH and any(c.isalpha() for c in cleaned):
+            self._prose_facts.append(cleaned)
+
+    @staticmethod
+    def _decode_string(raw):
+        if '\\' not in raw:
+            return raw
+        try:
+            return STRING_DECODER.decode('"' + raw + '"')
+        except json.JSONDecodeError:
+            return raw.replace('\\"', '"').replace('\\n', ' ')
+
+
+def parse_facts(text):
+    """
+    Parse a complete answer and return its list of facts.
+    """
+    parser = FactStreamParser()
+    parser.feed(text)
+    return parser.finish()
+
+
+def format_ndjson(event):
+    """
+    Serialize a stream event as one NDJSON line.
+    """
+    return json.dumps(event) + "\n"
+
+
+def format_sse(event):
+    """
+    Serialize a stream event as a Server-Sent Events frame.
+    """
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
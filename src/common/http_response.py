@@ -0,0 +1,165 @@
+"""
+HTTP responses for API Gateway proxy integrations.
+
+Both Lambdas build their API Gateway responses here: shared CORS and
+content-type headers, gzip (or Brotli, when the brotli module is packaged)
+compression of bodies above RESPONSE_COMPRESSION_MIN_BYTES when the client's
+Accept-Encoding allows it, and weak ETags on deterministic responses
+(cached facts, job status, index metrics) so a client that sends
+If-None-Match with the ETag it already holds gets an empty 304. Free-form
+agent answers get no ETag: they are regenerated on every call, so a 304
+would save only the transfer and would rarely match.
+
+Compressed bodies are returned base64-encoded with isBase64Encoded set; the
+REST API needs binary media types "*/*" (terraform/api_gateway.tf) to send
+them to the client as bytes.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+
+from common.metrics import current_metrics
+
+try:
+    import brotli
+except ImportError:  # Not in the Lambda runtime unless packaged
+    brotli = None
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,If-None-Match",
+    "Access-Control-Allow-Methods": "POST,OPTIONS",
+    "Access-Control-Expose-Headers": "ETag,Retry-After"
+}
+JSON_HEADERS = {"Content-Type": "application/json", **CORS_HEADERS}
+NDJSON_HEADERS = {"Content-Type": "application/x-ndjson", **CORS_HEADERS}
+SSE_HEADERS = {"Content-Type": "text/event-stream", **CORS_HEADERS}
+
+COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', 'true').lower() not in ('0', 'false', 'no')
+COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+
+# Content codings in order of preference when the client accepts several equally
+ENCODERS = {'gzip': lambda data: gzip.compress(data, compresslevel=6, mtime=0)}
+if brotli is not None:
+    ENCODERS = {'br': lambda data: brotli.compress(data, quality=5), **ENCODERS}
+
+
+def parse_accept_encoding(value):
+    """
+    {coding: q} from an Accept-Encoding header. Codings with q=0 are left out.
+    """
+    accepted = {}
+    for part in str(value or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    """
+    The preferred coding in ENCODERS the client accepts, or None.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    best, best_q = None, 0.0
+    for coding in ENCODERS:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def make_etag(content):
+    """
+    Weak ETag for a response body (str/bytes) or for the JSON-serializable
+    content it was built from. Weak, because the same content is served
+    with different content codings and volatile fields (timings,
+    cache_status) left out.
+    """
+    if not isinstance(content, (str, bytes)):
+        content = json.dumps(content, sort_keys=True, separators=(',', ':'))
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return f'W/"{hashlib.blake2b(content, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against an ETag.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in str(if_none_match).split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def not_modified(etag, headers=JSON_HEADERS):
+    current_metrics().count('NotModified')
+    headers = {name: value for name, value in headers.items() if name != "Content-Type"}
+    return {"statusCode": 304, "headers": {**headers, "ETag": etag}, "body": ""}
+
+
+def http_response(status_code, body, request=None, headers=JSON_HEADERS, etag=None):
+    """
+    API Gateway proxy response for a serialized body. With the request,
+    the body is compressed when it is large enough and the client accepts
+    gzip or br, and a matching If-None-Match turns a 200 into a 304.
+    """
+    headers = dict(headers)
+    if etag is not None:
+        headers["ETag"] = etag
+        if status_code == 200 and request is not None and etag_matches(request.header('if-none-match'), etag):
+            return not_modified(etag, headers)
+    response = {"statusCode": status_code, "headers": headers, "body": body}
+    data = body.encode('utf-8')
+    metrics = current_metrics()
+    if request is not None and COMPRESSION_ENABLED and len(data) >= COMPRESSION_MIN_BYTES:
+        headers["Vary"] = "Accept-Encoding"
+        coding = choose_encoding(request.header('accept-encoding'))
+        compressed = ENCODERS[coding](data) if coding is not None else data
+        if len(compressed) < len(data):
+            headers["Content-Encoding"] = coding
+            response["body"] = base64.b64encode(compressed).decode('ascii')
+            response["isBase64Encoded"] = True
+            metrics.set_property('content_encoding', coding)
+            data = compressed
+    metrics.count('ResponseBytes', len(data))
+    return response
+
+
+def json_response(status_code, payload, request=None, etag_content=None, extra_headers=None, cacheable=False):
+    """
+    JSON response for payload. Successful responses get an ETag from
+    etag_content (the stable part of the payload) or, when cacheable is
+    set, from the serialized body; other responses get none. When
+    etag_content matches If-None-Match the payload is never serialized.
+    extra_headers (e.g. Retry-After) are added to the JSON headers.
+    """
+    etag = None
+    if request is not None and status_code == 200 and etag_content is not None:
+        etag = make_etag(etag_content)
+        if etag_matches(request.header('if-none-match'), etag):
+            return not_modified(etag)
+    body = json.dumps(payload)
+    if request is not None and status_code == 200 and etag is None and cacheable:
+        etag = make_etag(body)
+    headers = {**JSON_HEADERS, **extra_headers} if extra_headers else JSON_HEADERS
+    return http_response(status_code, body, request, headers, etag)
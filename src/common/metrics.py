@@ -0,0 +1,279 @@
+"""
+Per-request stage timings and token usage, emitted as CloudWatch
+Embedded Metric Format (EMF).
+
+Each handler invocation gets a RequestMetrics object. Code anywhere in the
+request (including batch worker threads) records into it through
+current_metrics(), and the handler wrapper prints one EMF line when the
+request finishes. CloudWatch turns that line into metrics without any
+PutMetricData calls.
+
+Environment variables:
+  METRICS_ENABLED          "false" turns EMF output off (default on)
+  METRICS_NAMESPACE        CloudWatch namespace (default "CityFacts")
+  DEBUG_EVENT_SAMPLE_RATE  fraction of requests whose raw event is logged (default 0)
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from common.runtime import mark_invocation
+
+DEFAULT_NAMESPACE = 'CityFacts'
+
+# Stage name -> (EMF metric name, unit)
+STAGE_METRICS = {
+    'event_parsing': ('EventParsingMs', 'Milliseconds'),
+    'retrieval': ('RetrievalMs', 'Milliseconds'),
+    'admission': ('AdmissionMs', 'Milliseconds'),
+    'bedrock_invoke': ('BedrockInvokeMs', 'Milliseconds'),
+    'agent_model': ('AgentModelMs', 'Milliseconds'),
+    'knowledge_base': ('KnowledgeBaseMs', 'Milliseconds'),
+    'action_group': ('ActionGroupMs', 'Milliseconds'),
+    'compare_direct': ('DirectPathMs', 'Milliseconds'),
+    'compare_agent': ('AgentPathMs', 'Milliseconds'),
+    'time_to_first_token': ('TimeToFirstTokenMs', 'Milliseconds'),
+    'response_parsing': ('ResponseParsingMs', 'Milliseconds'),
+    'serialization': ('SerializationMs', 'Milliseconds'),
+}
+
+COUNTER_UNITS = {
+    'InputTokens': 'Count',
+    'OutputTokens': 'Count',
+    'BedrockCalls': 'Count',
+    'CacheHits': 'Count',
+    'CacheMisses': 'Count',
+    'Errors': 'Count',
+    'Retries': 'Count',
+    'HedgedRequests': 'Count',
+    'HedgeWins': 'Count',
+    'ModelFallbacks': 'Count',
+    'AgentSteps': 'Count',
+    'RetrievedChunks': 'Count',
+    'ResponseBytes': 'Bytes',
+    'NotModified': 'Count',
+    'AdmissionRejected': 'Count',
+    'AdmissionErrors': 'Count',
+}
+
+# Every dimension must be present on the line, so unset ones get this value
+DEFAULT_DIMENSION_VALUE = 'none'
+DIMENSION_SETS = [
+    ['FunctionName'],
+    ['FunctionName', 'ColdStart'],
+    ['FunctionName', 'CacheStatus'],
+]
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def metrics_enabled():
+    return os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+
+def _status_code(response):
+    if not isinstance(response, dict):
+        return None
+    if 'statusCode' in response:
+        return response['statusCode']
+    return (response.get('response') or {}).get('httpStatusCode')
+
+
+def _memory_limit_mb(context):
+    value = getattr(context, 'memory_limit_in_mb', None)
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class RequestMetrics:
+    """
+    Stage timings, counters, dimensions and properties for one request.
+    Stage times from concurrent batch workers are summed, so for a batch
+    they describe total work rather than wall-clock time.
+    """
+
+    def __init__(self, function_name, context=None, cold_start=False, enabled=True):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.dimensions = {
+            'FunctionName': function_name,
+            'ColdStart': 'true' if cold_start else 'false',
+            'CacheStatus': DEFAULT_DIMENSION_VALUE,
+        }
+        self.properties = {
+            'request_id': getattr(context, 'aws_request_id', None),
+            'memory_limit_mb': _memory_limit_mb(context),
+            'mode': 'single',
+        }
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block and add it to the named stage.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record(self, name, duration_ms):
+        if not self.enabled or duration_ms is None:
+            return
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def record_once(self, name, duration_ms):
+        """
+        Record a stage only the first time it is seen, e.g. time to first token.
+        """
+        if not self.enabled or duration_ms is None:
+            return
+        with self._lock:
+            self.stages.setdefault(name, duration_ms)
+
+    def count(self, name, value=1):
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_usage(self, usage):
+        """
+        Add the token counts from a Messages API `usage` object.
+        """
+        if not usage:
+            return
+        self.count('InputTokens', usage.get('input_tokens'))
+        self.count('OutputTokens', usage.get('output_tokens'))
+
+    def set_dimension(self, name, value):
+        self.dimensions[name] = str(value)
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def to_emf(self, total_ms=None):
+        """
+        Build the EMF document for this request.
+        """
+        if total_ms is None:
+            total_ms = (time.perf_counter() - self.started) * 1000
+        values = {'TotalMs': round(total_ms, 3)}
+        definitions = [{'Name': 'TotalMs', 'Unit': 'Milliseconds'}]
+        with self._lock:
+            for stage, duration_ms in self.stages.items():
+                name, unit = STAGE_METRICS.get(stage, (f"{stage}_ms", 'Milliseconds'))
+                values[name] = round(duration_ms, 3)
+                definitions.append({'Name': name, 'Unit': unit})
+            for name, value in self.counters.items():
+                values[name] = value
+                definitions.append({'Name': name, 'Unit': COUNTER_UNITS.get(name, 'Count')})
+        max_rss_mb = _max_rss_mb()
+        if max_rss_mb is not None:
+            values['MaxRssMB'] = max_rss_mb
+            definitions.append({'Name': 'MaxRssMB', 'Unit': 'Megabytes'})
+
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE),
+                    'Dimensions': DIMENSION_SETS,
+                    'Metrics': definitions
+                }]
+            }
+        }
+        document.update(self.properties)
+        document.update(self.dimensions)
+        document.update(values)
+        return document
+
+    def emit(self):
+        if self.enabled:
+            print(json.dumps(self.to_emf()))
+
+
+# Returned when no request is active, e.g. generators driven from scripts
+_DETACHED = RequestMetrics('detached', enabled=False)
+
+
+def current_metrics():
+    """
+    The RequestMetrics of the active request, or a no-op recorder.
+    """
+    return _current.get() or _DETACHED
+
+
+def instrument_handler(function_name):
+    """
+    Decorator for Lambda entry points. The FunctionName dimension is the
+    deployed function name when the context has one. Marks the invocation for cold-start
+    tracking, makes a RequestMetrics current for the call and emits it as
+    one EMF line when the outermost entry point returns. Nested entry points
+    (handler -> stream_handler) share the outer request's metrics.
+    """
+    def decorator(entry_point):
+        @functools.wraps(entry_point)
+        def wrapper(event, context):
+            metrics = _current.get()
+            if metrics is not None:
+                return entry_point(event, context)
+
+            cold_start = mark_invocation(context)
+            name = getattr(context, 'function_name', None) or function_name
+            metrics = RequestMetrics(name, context, cold_start, enabled=metrics_enabled())
+            token = _current.set(metrics)
+            response = None
+            try:
+                log_event_sampled(event)
+                response = entry_point(event, context)
+                return response
+            except Exception:
+                metrics.count('Errors')
+                raise
+            finally:
+                _current.reset(token)
+                status_code = _status_code(response)
+                if status_code is not None:
+                    metrics.set_property('status_code', status_code)
+                    if status_code >= 500:
+                        metrics.count('Errors')
+                metrics.emit()
+        return wrapper
+    return decorator
+
+
+def log_event_sampled(event, sample_rate=None):
+    """
+    Log the raw event for a sample of requests (DEBUG_EVENT_SAMPLE_RATE).
+    Serializing whole events on every request is too expensive to leave on.
+    """
+    if sample_rate is None:
+        try:
+            sample_rate = float(os.environ.get('DEBUG_EVENT_SAMPLE_RATE', 0))
+        except ValueError:
+            sample_rate = 0.0
+    if sample_rate > 0 and random.random() < sample_rate:
+        print(f"Received event: {json.dumps(event)}")
+        return True
+    return False
@@ -0,0 +1,140 @@
+"""
+Read-only artifact of pre-generated city facts.
+
+scripts/precompute-facts.py writes it (nightly) for every city in the
+dataset. lambda_direct opens it at cold start and the fact cache serves
+from it before asking Bedrock, so a first request for a known city is a
+lookup. The file is memory-mapped: opening it reads only the header, and a
+lookup touches one slot-table page and one record.
+
+Layout (little-endian):
+  header   magic b"CFAC", format version u16, reserved u16, entry count u32,
+           metadata length u32, metadata JSON (model, prompt version, created_at)
+  slots    count x (key hash u64, record offset u32, record length u32), sorted by hash
+  records  key length u16, key (UTF-8), zlib-compressed JSON value
+
+Keys are fact cache keys (make_cache_key), so entries generated with another
+model or prompt version are never served.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b"CFAC"
+FORMAT_VERSION = 1
+ARTIFACT_FILENAME = 'precomputed_facts.bin'
+
+HEADER = struct.Struct('<4sHHII')
+SLOT = struct.Struct('<QII')
+KEY_LENGTH = struct.Struct('<H')
+
+
+def key_hash(key):
+    return struct.unpack('<Q', hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest())[0]
+
+
+class PrecomputedFacts:
+    """
+    Memory-mapped reader. get() returns the stored value or None.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, metadata_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a precomputed facts artifact")
+        if version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Unsupported precomputed facts format version {version}")
+        self.count = count
+        self.metadata = json.loads(self._mmap[HEADER.size:HEADER.size + metadata_length])
+        self._slots_offset = HEADER.size + metadata_length
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, position):
+        return SLOT.unpack_from(self._mmap, self._slots_offset + position * SLOT.size)
+
+    def get(self, key):
+        target = key_hash(key)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._slot(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        encoded_key = key.encode('utf-8')
+        # Several keys can share a hash; check each one
+        while low < self.count:
+            slot_hash, offset, length = self._slot(low)
+            if slot_hash != target:
+                break
+            key_length = KEY_LENGTH.unpack_from(self._mmap, offset)[0]
+            start = offset + KEY_LENGTH.size
+            if self._mmap[start:start + key_length] == encoded_key:
+                return json.loads(zlib.decompress(self._mmap[start + key_length:offset + length]))
+            low += 1
+        return None
+
+    def close(self):
+        self._mmap.close()
+
+
+def write_precomputed_facts(path, entries, metadata=None):
+    """
+    Write {cache_key: value} to path. The file is written next to the
+    target and renamed into place, so readers never see a partial artifact.
+    """
+    metadata_bytes = json.dumps(metadata or {}, sort_keys=True).encode('utf-8')
+    records = sorted((key_hash(key), key.encode('utf-8'), value) for key, value in entries.items())
+    data_offset = HEADER.size + len(metadata_bytes) + len(records) * SLOT.size
+    slots = []
+    blobs = []
+    offset = data_offset
+    for hashed, encoded_key, value in records:
+        compressed = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 9)
+        blob = KEY_LENGTH.pack(len(encoded_key)) + encoded_key + compressed
+        slots.append(SLOT.pack(hashed, offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(records), len(metadata_bytes)))
+        f.write(metadata_bytes)
+        f.writelines(slots)
+        f.writelines(blobs)
+    os.replace(temp_path, path)
+    return offset
+
+
+def default_artifact_path():
+    here = os.path.dirname(os.path.abspath(__file__))
+    task_root = os.environ.get('LAMBDA_TASK_ROOT', os.path.dirname(here))
+    return os.environ.get('PRECOMPUTED_FACTS_PATH', os.path.join(task_root, ARTIFACT_FILENAME))
+
+
+def load_precomputed_facts(path=None):
+    """
+    Open the packaged artifact, or return None when there is none or it
+    cannot be read (the cache then behaves as before).
+    """
+    path = path or default_artifact_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        artifact = PrecomputedFacts(path)
+    except Exception as e:
+        print(f"Precomputed facts disabled: {e}")
+        return None
+    print(f"Loaded {len(artifact)} precomputed facts entries "
+          f"(created {artifact.metadata.get('created_at', 'unknown')})")
+    return artifact
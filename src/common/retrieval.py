@@ -0,0 +1,463 @@
+"""
+In-process retrieval over the knowledge-base data, as an alternative to
+the OpenSearch Serverless index behind the Bedrock knowledge base.
+
+The corpus is one passage per city (both CSVs joined through the city
+index) plus one passage per section of world-cities-overview.md. It is
+built at package time (scripts/build-retrieval-index.py) into two files:
+
+  retrieval_index.json   passages, BM25 postings and embedder settings
+  retrieval_vectors.f32  row-major float32 matrix of L2-normalized passage
+                         embeddings, memory-mapped at load time
+
+Search modes are "bm25", "vector" and "hybrid" (min-max normalized scores
+of both, weighted by alpha). Vector top-k uses NumPy when it is installed
+and otherwise a pure-Python scan of the mapped matrix, which only touches
+the non-zero dimensions of sparse (hashing) query embeddings. The default
+mode is "hybrid" only for indexes built with a semantic embedder (titan);
+otherwise it is "bm25", and the vector leg runs only when
+RETRIEVAL_SCORING asks for it.
+
+Embedders:
+  hashing  deterministic feature hashing of words; needs no
+           network or credentials, so it is the default and what local
+           checks use
+  titan    Amazon Titan Text Embeddings V2 through bedrock-runtime
+
+The default build (build.sh) uses the hashing embedder and does not
+package NumPy, so it searches with BM25 only. Hashed words are a second
+lexical scorer (no synonyms or paraphrase), not semantic search; hybrid
+search over them is an explicit opt-in. Semantic vectors need
+RETRIEVAL_EMBEDDER=titan at build time (and Bedrock access for query
+embeddings); the NumPy path needs a layer that provides it.
+
+Environment variables:
+  RETRIEVAL_INDEX_PATH    path of retrieval_index.json (default: package root)
+  RETRIEVAL_TOP_K         passages returned per query (default 5)
+  RETRIEVAL_SCORING       bm25, vector or hybrid (default hybrid with a
+                          semantic embedder, otherwise bm25)
+  RETRIEVAL_HYBRID_ALPHA  weight of the vector score in hybrid mode (default 0.5)
+"""
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import zlib
+from array import array
+from operator import add
+
+from common.city_index import COST_METRICS, build_city_index, get_city_index, normalize_name
+
+INDEX_FILENAME = 'retrieval_index.json'
+VECTORS_FILENAME = 'retrieval_vectors.f32'
+INDEX_VERSION = 1
+OVERVIEW_MD = 'world-cities-overview.md'
+
+DEFAULT_DIM = 512
+HASHES_PER_FEATURE = 2
+DEFAULT_TOP_K = 5
+CANDIDATE_POOL = 50
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITAN_MODEL_ID = 'amazon.titan-embed-text-v2:0'
+
+SCORING_MODES = ('bm25', 'vector', 'hybrid')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'the', 'to', 'was', 'what', 'which', 'with', 'me', 'about', 'tell',
+}
+
+COST_LABELS = {
+    'cost_of_living_index': 'Cost of living index',
+    'rent_index': 'Rent index',
+    'cost_of_living_plus_rent_index': 'Cost of living plus rent index',
+    'groceries_index': 'Groceries index',
+    'restaurant_price_index': 'Restaurant price index',
+    'local_purchasing_power_index': 'Local purchasing power index',
+}
+
+
+_numpy = None
+
+
+def load_numpy():
+    """
+    NumPy when it is installed (e.g. from a Lambda layer), else None.
+    Imported on first index load rather than at module import, so
+    containers that never search do not pay for it at cold start.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def tokenize(text):
+    """
+    Lookup-folded words without stopwords or bare numbers.
+    """
+    return [t for t in normalize_name(text).split() if t not in STOPWORDS and not t.isdigit()]
+
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in embeddings: words are hashed (crc32, stable
+    across processes) into two of dim signed buckets with log
+    term-frequency times IDF weights, then L2-normalized.
+    fit() learns IDF weights for features common in the corpus (the
+    template text every city passage shares); rarer features get
+    default_weight.
+    """
+
+    name = 'hashing'
+    semantic = False
+
+    def __init__(self, dim=DEFAULT_DIM, weights=None, default_weight=1.0):
+        self.dim = dim
+        self.weights = weights or {}
+        self.default_weight = default_weight
+
+    def fit(self, texts, min_df_ratio=0.01):
+        document_frequency = {}
+        for text in texts:
+            for feature in set(tokenize(text)):
+                document_frequency[feature] = document_frequency.get(feature, 0) + 1
+        total = len(texts)
+        self.default_weight = round(math.log((total + 1) / 2) + 1, 4)
+        self.weights = {
+            feature: round(math.log((total + 1) / (df + 1)) + 1, 4)
+            for feature, df in document_frequency.items() if df >= max(2, total * min_df_ratio)
+        }
+        return self
+
+    def sparse(self, text):
+        """
+        Return {dimension: weight} for a text; most dimensions are zero.
+        """
+        counts = {}
+        for feature in tokenize(text):
+            counts[feature] = counts.get(feature, 0) + 1
+        weights = {}
+        for feature, count in counts.items():
+            weight = (1.0 + math.log(count)) * self.weights.get(feature, self.default_weight)
+            digest = 0
+            # Two buckets per feature, so a single collision does not look like a match
+            for _ in range(HASHES_PER_FEATURE):
+                digest = zlib.crc32(feature.encode('utf-8'), digest)
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                dimension = digest % self.dim
+                weights[dimension] = weights.get(dimension, 0.0) + sign * weight
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {d: w / norm for d, w in weights.items() if w} if norm else {}
+
+    def embed(self, text):
+        vector = [0.0] * self.dim
+        for dimension, weight in self.sparse(text).items():
+            vector[dimension] = weight
+        return vector
+
+    def settings(self):
+        return {"name": self.name, "dim": self.dim, "weights": self.weights, "default_weight": self.default_weight}
+
+
+class TitanEmbedder:
+    """
+    Amazon Titan text embeddings via bedrock-runtime: V2 (256, 512 or 1024
+    dims, normalized) or V1 (amazon.titan-embed-text-v1, fixed 1536 dims).
+    """
+
+    name = 'titan'
+    semantic = True
+
+    def __init__(self, dim=DEFAULT_DIM, model_id=TITAN_MODEL_ID, client=None):
+        self.dim = dim
+        self.model_id = model_id
+        self._client = client
+
+    def embed(self, text):
+        from common.runtime import get_client
+
+        client = self._client or get_client('bedrock-runtime')
+        request = {"inputText": text}
+        if 'text-v1' not in self.model_id:
+            request.update(dimensions=self.dim, normalize=True)
+        response = client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps(request),
+            contentType='application/json'
+        )
+        return json.loads(response['body'].read())['embedding']
+
+    def settings(self):
+        return {"name": self.name, "dim": self.dim, "model_id": self.model_id}
+
+
+def make_embedder(settings):
+    """
+    Embedder for the settings stored with an index.
+    """
+    if settings.get("name") == 'titan':
+        return TitanEmbedder(settings.get("dim", DEFAULT_DIM), settings.get("model_id", TITAN_MODEL_ID))
+    if settings.get("name") == 'hashing':
+        return HashingEmbedder(settings.get("dim", DEFAULT_DIM), settings.get("weights"),
+                               settings.get("default_weight", 1.0))
+    raise ValueError(f"Unknown embedder: {settings.get('name')}")
+
+
+def _format_metric(value):
+    return f"{value:.2f}"
+
+
+def build_corpus(data_dir, city_index=None):
+    """
+    Passages for the retrieval index: one per city with its air-quality
+    and cost-of-living figures joined, and one per overview section.
+    Returns a list of {"title", "source", "text"} dicts.
+    """
+    index = city_index or build_city_index(data_dir)
+    passages = []
+    for row in range(len(index)):
+        city, region, country = index.cities[row], index.regions[row], index.countries[row]
+        metrics = index.row_metrics(row)
+        place = ', '.join(part for part in (city, region, country) if part)
+        sentences = [f"{place}."]
+        if metrics['air_quality'] is not None:
+            sentences.append(f"Air quality index {_format_metric(metrics['air_quality'])} and water pollution "
+                             f"index {_format_metric(metrics['water_pollution'])} (2021).")
+        costs = [f"{COST_LABELS[field].lower()} {_format_metric(metrics[field])}"
+                 for field, _ in COST_METRICS if metrics[field] is not None]
+        if costs:
+            sentences.append(f"Cost of living data (2018): {', '.join(costs)}.")
+        passages.append({"title": place, "source": "city_metrics", "text": ' '.join(sentences)})
+
+    overview_path = os.path.join(data_dir, OVERVIEW_MD)
+    if os.path.exists(overview_path):
+        with open(overview_path, encoding='utf-8') as f:
+            sections = re.split(r'^#{2,3} ', f.read(), flags=re.MULTILINE)[1:]
+        for section in sections:
+            title, _, body = section.partition('\n')
+            body = ' '.join(body.split())
+            if body:
+                passages.append({"title": title.strip(), "source": OVERVIEW_MD, "text": f"{title.strip()}. {body}"})
+    return passages
+
+
+class RetrievalIndex:
+    """
+    Passages with a BM25 inverted index and a memory-mapped embedding matrix.
+    """
+
+    def __init__(self, passages, postings, doc_lengths, embedder, vectors, mapping=None):
+        self.passages = passages
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        # BM25 length normalization per passage, computed once instead of per posting
+        self.length_norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / avg_doc_length) for length in doc_lengths]
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self._mapping = mapping
+        # vectors is a flat float32 memoryview (or array); matrix is its NumPy view
+        self.vectors = vectors
+        self.matrix = None
+        numpy = load_numpy()
+        if numpy is not None and len(passages):
+            self.matrix = numpy.frombuffer(vectors, dtype='<f4').reshape(len(passages), self.dim)
+
+    def __len__(self):
+        return len(self.passages)
+
+    @property
+    def default_mode(self):
+        """
+        hybrid when the embeddings are semantic; lexical hashes only add
+        a second term-overlap score, so those indexes default to bm25.
+        """
+        return 'hybrid' if self.embedder.semantic else 'bm25'
+
+    def bm25_scores(self, query_tokens):
+        """
+        {passage: BM25 score} for passages containing any query term.
+        """
+        scores = {}
+        total = len(self.passages)
+        for term in set(query_tokens):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings) // 2
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            weight = idf * (BM25_K1 + 1)
+            norms = self.length_norms
+            for doc, tf in zip(postings[::2], postings[1::2]):
+                scores[doc] = scores.get(doc, 0.0) + weight * tf / (tf + norms[doc])
+        return scores
+
+    def vector_scores(self, query, k):
+        """
+        Top-k [(score, passage)] by cosine similarity to the query embedding.
+        """
+        if not len(self.passages):
+            return []
+        if self.matrix is not None:
+            numpy = load_numpy()
+            scores = self.matrix @ numpy.asarray(self.embedder.embed(query), dtype='<f4')
+            k = min(k, len(scores))
+            top = numpy.argpartition(-scores, k - 1)[:k]
+            return sorted(((float(scores[i]), int(i)) for i in top), reverse=True)
+
+        if isinstance(self.embedder, HashingEmbedder):
+            weights = self.embedder.sparse(query).items()
+        else:
+            weights = [(d, w) for d, w in enumerate(self.embedder.embed(query)) if w]
+        scores = [0.0] * len(self.passages)
+        for dimension, weight in weights:
+            # Strided column view: one value per passage, no copy of the matrix
+            scores = list(map(add, scores, map(weight.__mul__, self.vectors[dimension::self.dim])))
+        return heapq.nlargest(k, zip(scores, range(len(scores))))
+
+    def search(self, query, k=None, mode=None, alpha=None):
+        """
+        Return the top-k passages for a query as dicts with id, title,
+        source, text and score.
+        """
+        k = k or int(os.environ.get('RETRIEVAL_TOP_K', DEFAULT_TOP_K))
+        mode = mode or os.environ.get('RETRIEVAL_SCORING', self.default_mode)
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown retrieval scoring mode: {mode}")
+        if alpha is None:
+            alpha = float(os.environ.get('RETRIEVAL_HYBRID_ALPHA', 0.5))
+
+        if mode == 'bm25':
+            ranked = heapq.nlargest(k, ((s, d) for d, s in self.bm25_scores(tokenize(query)).items()))
+        elif mode == 'vector':
+            ranked = self.vector_scores(query, k)
+        else:
+            pool = max(k, CANDIDATE_POOL)
+            lexical = dict((d, s) for s, d in
+                           heapq.nlargest(pool, ((s, d) for d, s in self.bm25_scores(tokenize(query)).items())))
+            semantic = dict((d, s) for s, d in self.vector_scores(query, pool))
+            lexical, semantic = _min_max(lexical), _min_max(semantic)
+            fused = ((alpha * semantic.get(d, 0.0) + (1 - alpha) * lexical.get(d, 0.0), d)
+                     for d in set(lexical) | set(semantic))
+            ranked = heapq.nlargest(k, fused)
+
+        return [dict(self.passages[doc], id=doc, score=round(score, 4)) for score, doc in ranked]
+
+    def save(self, path):
+        """
+        Write retrieval_index.json to path and the vectors next to it.
+        """
+        vectors = array('f', self.vectors)
+        if sys.byteorder != 'little':
+            vectors.byteswap()
+        with open(os.path.join(os.path.dirname(path) or '.', VECTORS_FILENAME), 'wb') as f:
+            f.write(vectors.tobytes())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "embedder": self.embedder.settings(),
+                "passages": self.passages,
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings
+            }, f, separators=(',', ':'), ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the JSON part and memory-map the vector matrix read-only.
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported retrieval index version: {data.get('version')}")
+        embedder = make_embedder(data["embedder"])
+        with open(os.path.join(os.path.dirname(path) or '.', VECTORS_FILENAME), 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+        if mapping is None:
+            vectors = array('f')
+        elif sys.byteorder == 'little':
+            vectors = memoryview(mapping).cast('f')
+        else:
+            vectors = array('f', mapping)
+            vectors.byteswap()
+        if len(vectors) != len(data["passages"]) * embedder.dim:
+            raise ValueError("Retrieval vectors do not match the passage count")
+        return cls(data["passages"], data["postings"], data["doc_lengths"], embedder, vectors, mapping)
+
+
+def _min_max(scores):
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    span = high - low
+    return {d: (s - low) / span if span else 1.0 for d, s in scores.items()}
+
+
+def build_retrieval_index(data_dir, embedder=None, city_index=None):
+    """
+    Build passages, BM25 postings and embeddings from the knowledge-base data.
+    """
+    passages = build_corpus(data_dir, city_index)
+    if embedder is None:
+        embedder = HashingEmbedder().fit([passage["text"] for passage in passages])
+    postings = {}
+    doc_lengths = []
+    vectors = array('f')
+    for doc, passage in enumerate(passages):
+        tokens = tokenize(passage["text"])
+        doc_lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).extend((doc, count))
+        vector = embedder.embed(passage["text"])
+        if len(vector) != embedder.dim:
+            raise ValueError(f"Embedder returned {len(vector)} dimensions, expected {embedder.dim}")
+        vectors.extend(vector)
+    return RetrievalIndex(passages, postings, doc_lengths, embedder, vectors)
+
+
+def default_index_path():
+    here = os.path.dirname(os.path.abspath(__file__))
+    task_root = os.environ.get('LAMBDA_TASK_ROOT', os.path.dirname(here))
+    return os.environ.get('RETRIEVAL_INDEX_PATH', os.path.join(task_root, INDEX_FILENAME))
+
+
+_retrieval_index = None
+_retrieval_index_loaded = False
+
+
+def get_retrieval_index():
+    """
+    Load the retrieval index once per container. Falls back to building it
+    from the repository's knowledge-base directory (local development), and
+    returns None when neither is available.
+    """
+    global _retrieval_index, _retrieval_index_loaded
+    if _retrieval_index_loaded:
+        return _retrieval_index
+    _retrieval_index_loaded = True
+
+    path = default_index_path()
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'knowledge-base')
+    try:
+        if os.path.exists(path):
+            _retrieval_index = RetrievalIndex.load(path)
+        elif os.path.exists(os.path.join(data_dir, OVERVIEW_MD)):
+            _retrieval_index = build_retrieval_index(data_dir, city_index=get_city_index())
+        else:
+            print("Retrieval index not available; local retrieval disabled")
+    except Exception as e:
+        print(f"Error loading retrieval index: {e}")
+        _retrieval_index = None
+    return _retrieval_index
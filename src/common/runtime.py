@@ -0,0 +1,144 @@
+"""
+Shared AWS client setup and cold-start timing for both Lambda functions.
+
+Clients are created once per container with a tuned botocore config
+(keep-alive, pool size, timeouts, adaptive retries). bedrock-runtime is the
+exception for retries: common.bedrock_invoke.ResilientInvoker already retries,
+hedges and falls back around it, so botocore makes a single attempt there. CLIENT_INIT_MODE
+chooses when: "eager" builds them during the Lambda init phase, "lazy"
+defers both the boto3 import and client construction to first use.
+"""
+import json
+import os
+import threading
+import time
+
+# Taken when the handler module first imports this module, i.e. at container init
+INIT_STARTED = time.perf_counter()
+
+DEFAULT_REGION = 'us-east-1'
+
+# Services whose calls go through ResilientInvoker: one retry layer, not botocore's on top of it
+INVOKER_RETRIED_SERVICES = ('bedrock-runtime',)
+
+_clients = {}
+_client_init_ms = {}
+_lock = threading.Lock()
+_invocations = 0
+_init_ms = None
+_last_request_id = None
+
+
+def get_region():
+    """
+    Region from the Lambda environment, falling back to us-east-1.
+    """
+    return os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or DEFAULT_REGION
+
+
+def get_init_mode():
+    mode = os.environ.get('CLIENT_INIT_MODE', 'eager').lower()
+    return mode if mode in ('eager', 'lazy') else 'eager'
+
+
+def client_config(service_name=None):
+    """
+    Botocore config for a service's client. Timeouts default to values
+    that leave room inside the 30 second Lambda timeout. Services in
+    INVOKER_RETRIED_SERVICES get a single attempt, otherwise 3 botocore
+    attempts inside each of the invoker's 3 would make up to 9 calls per
+    model during a throttling storm.
+    """
+    from botocore.config import Config
+
+    if service_name in INVOKER_RETRIED_SERVICES:
+        retries = {'mode': 'standard', 'total_max_attempts': 1}
+    else:
+        retries = {
+            'mode': os.environ.get('AWS_RETRY_MODE', 'adaptive'),
+            'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', 3))
+        }
+    read_timeout = os.environ.get('AWS_READ_TIMEOUT', 25)
+    if service_name == 'bedrock-agent-runtime':
+        # Bounds how long a stalled agent stream can outlive the request deadline
+        read_timeout = os.environ.get('AGENT_READ_TIMEOUT', read_timeout)
+    return Config(
+        region_name=get_region(),
+        connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', 3)),
+        read_timeout=float(read_timeout),
+        max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 16)),
+        tcp_keepalive=True,
+        retries=retries
+    )
+
+
+def get_client(service_name):
+    """
+    Return the shared client for a service, creating it on first use.
+    Clients are thread-safe, so batch workers share one connection pool.
+    """
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(service_name)
+        if client is None:
+            started = time.perf_counter()
+            import boto3
+            client = boto3.client(service_name, config=client_config(service_name))
+            _client_init_ms[service_name] = round((time.perf_counter() - started) * 1000, 1)
+            _clients[service_name] = client
+    return client
+
+
+def set_client(service_name, client):
+    """
+    Install a client for a service, e.g. a local stub for benchmarks.
+    """
+    with _lock:
+        _clients[service_name] = client
+
+
+def init_clients(*service_names):
+    """
+    Create clients during the init phase when CLIENT_INIT_MODE is "eager".
+    """
+    if get_init_mode() == 'eager':
+        for service_name in service_names:
+            get_client(service_name)
+
+
+def mark_invocation(context=None):
+    """
+    Record the start of an invocation and return True if it is the cold start.
+    Calls with the same request ID count once, so nested entry points
+    (handler -> stream_handler) are safe. The first invocation also logs
+    how long the container spent initializing.
+    """
+    global _invocations, _init_ms, _last_request_id
+    request_id = getattr(context, 'aws_request_id', None)
+    with _lock:
+        if request_id is not None and request_id == _last_request_id:
+            return _invocations == 1
+        _last_request_id = request_id
+        _invocations += 1
+        cold_start = _invocations == 1
+        if cold_start:
+            _init_ms = round((time.perf_counter() - INIT_STARTED) * 1000, 1)
+    if cold_start:
+        print(f"Cold start: {json.dumps(cold_start_report())}")
+    return cold_start
+
+
+def cold_start_report():
+    """
+    Init timing for this container: time from module import to the first
+    invocation, plus per-client construction time.
+    """
+    return {
+        "init_ms": _init_ms,
+        "init_mode": get_init_mode(),
+        "region": get_region(),
+        "client_init_ms": dict(_client_init_ms),
+        "invocations": _invocations
+    }
@@ -1,164 +1,693 @@
+import codecs
 import json
 import os
-import boto3
-from botocore.exceptions import ClientError
+import re
+import time
 
-# Initialize Bedrock Agent Runtime client
-bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name='us-east-1')
+# Imported first so cold-start timing covers the rest of module init
+from common.runtime import get_client, init_clients
+from common.admission import agent_estimate, estimate_tokens, get_admission_controller, usage_tokens
+from common.batch import get_batch_limits, remaining_budget_ms, run_batch
+from common.bedrock_invoke import (Deadline, DeadlineExceeded, ResilientInvoker, error_response_headers,
+                                   error_response_status)
+from common.city_index import canonicalize_city, get_city_index
+from common.agent_jobs import JobProgress, dispatcher_from_env, job_status, job_store_from_spec, new_job
+from common.agent_trace import AgentTrace
+from common.events import is_truthy, normalize_event
+from common.fact_stream import format_ndjson, format_sse
+from common.http_response import NDJSON_HEADERS, SSE_HEADERS, http_response, json_response
+from common.metrics import current_metrics, instrument_handler
+from common.retrieval import get_retrieval_index
 
-def get_city_from_event(event):
+# Model used to answer from locally retrieved passages (RETRIEVAL_MODE=local)
+LOCAL_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+# The agent's foundation model (terraform/bedrock_agent.tf); agent runs draw on its quota
+AGENT_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+RETRIEVAL_MODES = ('agent', 'local')
+
+# Create the Bedrock Agent Runtime client during init unless CLIENT_INIT_MODE=lazy
+init_clients('bedrock-agent-runtime')
+
+# Load the city metrics index once per container, during cold start
+get_city_index()
+
+# With local retrieval as the default, load its index and model client during init too
+if os.environ.get('RETRIEVAL_MODE', 'agent') == 'local':
+    init_clients('bedrock-runtime')
+    get_retrieval_index()
+
+local_invoker = ResilientInvoker()
+
+# Token buckets sized to the Bedrock quotas (ADMISSION_*); an agent run takes a fixed multi-call estimate
+admission = get_admission_controller()
+AGENT_ESTIMATED_TOKENS, AGENT_ESTIMATED_REQUESTS = agent_estimate()
+
+# Async job mode: submit returns a job ID, a self-invocation runs the agent (AGENT_JOB_STORE)
+try:
+    job_store = job_store_from_spec(os.environ.get('AGENT_JOB_STORE', ''))
+    job_dispatcher = dispatcher_from_env()
+except ValueError as e:
+    print(f"Agent jobs disabled: {e}")
+    job_store = job_dispatcher = None
+
+# Questions about these topics can be answered from the packaged city index
+METRIC_TOPICS = re.compile(
+    r'air quality|water pollution|pollution|cost of living|rent|grocer|restaurant price|'
+    r'purchasing power|metrics?|index', re.IGNORECASE)
+GENERAL_TOPICS = re.compile(r'facts?|histor|cultur|famous|landmark|tell me about', re.IGNORECASE)
+
+def is_metrics_question(question):
     """
-    Extract city name from the Lambda event.
-    Supports multiple input formats.
+    True when a question only asks about metrics the city index holds,
+    e.g. "What is the air quality and rent index?".
+    """
+    if not question:
+        return False
+    return bool(METRIC_TOPICS.search(question)) and not GENERAL_TOPICS.search(question)
+
+def get_retrieval_mode(request):
+    """
+    "agent" (Bedrock agent + OpenSearch knowledge base) or "local"
+    (in-process retrieval + direct model call). Requests may choose with
+    "retrieval"; the default comes from RETRIEVAL_MODE.
+    """
+    mode = request.option('retrieval')
+    if mode not in RETRIEVAL_MODES:
+        mode = os.environ.get('RETRIEVAL_MODE', 'agent')
+    return mode if mode in RETRIEVAL_MODES else 'agent'
+
+def resolve_city(city_name):
+    """
+    Canonical form of a requested city (see common.city_index), recorded in
+    the request metrics so spellings of one city aggregate together.
+    """
+    city = canonicalize_city(city_name)
+    metrics = current_metrics()
+    metrics.set_property('city_id', city.id)
+    metrics.set_property('city_match', city.match or 'unknown')
+    if city.suggestion is not None:
+        # Fuzzy hits are only a hint: the prompt and cache keep the requested name
+        metrics.set_property('city_suggestion', city.suggestion.id)
+    return city
+
+def build_local_prompt(city_display, passages, question=None):
     """
-    city_name = None
+    Same request as build_agent_input(), with the retrieved passages
+    standing in for the agent's knowledge base lookups.
+    """
+    excerpts = '\n'.join(f"[{n}] {passage['title']}: {passage['text']}" for n, passage in enumerate(passages, 1))
+    prompt = f"""Please provide exactly 10 interesting facts about {city_display}. 
+
+Format your response as a numbered list (1. 2. 3. etc.) with each fact on a new line.
+
+Include a mix of:
+- General historical, cultural, and geographical facts
+- Specific data from the knowledge base excerpts below about air quality, water pollution, and cost of living if available
+- Modern facts about the city
+
+If the excerpts contain data for this city, make sure to include those specific metrics in your facts. Ignore excerpts about other cities."""
+    if question:
+        prompt += f"\n\nAlso answer this question: {question}"
+    return f"{prompt}\n\n<knowledge_base>\n{excerpts}\n</knowledge_base>"
+
+def answer_with_local_retrieval(city, question=None, deadline=None, info=None):
+    """
+    Retrieve passages from the packaged index and ask the model directly
+    about a CanonicalCity.
+    Returns (answer_text, passages). Retrying, hedging and fallback models
+    follow the BEDROCK_* settings, as in lambda_direct.
+    """
+    metrics = current_metrics()
+    index = get_retrieval_index()
+    with metrics.stage('retrieval'):
+        query = f"{city.display} {question}" if question else city.display
+        passages = index.search(query)
     
-    # Check if it's from API Gateway
-    if 'body' in event:
-        try:
-            if isinstance(event['body'], str):
-                body = json.loads(event['body'])
-            else:
-                body = event['body']
-            city_name = body.get('city')
-        except (json.JSONDecodeError, AttributeError):
-            pass
+    body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 1000,
+        "messages": [{"role": "user", "content": build_local_prompt(city.display, passages, question)}]
+    })
     
-    # Check if it's direct invocation with city parameter
-    if not city_name and 'city' in event:
-        city_name = event['city']
+    def call(model_id):
+        response = get_client('bedrock-runtime').invoke_model(
+            modelId=model_id,
+            body=body,
+            contentType='application/json'
+        )
+        return json.loads(response['body'].read())
     
-    # Check query string parameters (for API Gateway)
-    if not city_name and 'queryStringParameters' in event and event['queryStringParameters']:
-        city_name = event['queryStringParameters'].get('city')
+    info = {} if info is None else info
+    ticket = admission.acquire(LOCAL_MODEL_ID, estimate_tokens(body, 1000), deadline=deadline)
+    try:
+        with metrics.stage('bedrock_invoke'):
+            response_body = local_invoker.invoke(call, LOCAL_MODEL_ID, deadline, info)
+    except Exception as e:
+        print(f"Error invoking Bedrock: {e}")
+        raise e
+    finally:
+        metrics.count('BedrockCalls', info.get('attempts', 0) + info.get('hedged', 0))
+        # The ticket covered one call; retries, hedges and fallbacks each reached Bedrock too
+        admission.charge_extra(ticket, info.get('attempts', 0) + info.get('hedged', 0) - 1)
+        metrics.count('Retries', info.get('retries'))
+        metrics.count('HedgedRequests', info.get('hedged'))
+        metrics.count('ModelFallbacks', 1 if info.get('fallback_used') else 0)
     
-    return city_name
+    metrics.add_usage(response_body.get('usage'))
+    admission.settle(ticket, usage_tokens(response_body.get('usage')))
+    answer = ''.join(block.get('text', '') for block in response_body.get('content', []) if block.get('type') == 'text')
+    return answer, passages
 
-def invoke_bedrock_agent(agent_id, agent_alias_id, session_id, input_text):
+def summarize_passages(passages):
     """
-    Invoke the Bedrock agent with the given input text.
+    Passage references returned to the caller (the text is in the answer).
+    """
+    return [{"id": p["id"], "title": p["title"], "source": p["source"], "score": p["score"]} for p in passages]
+
+def stream_bedrock_agent(agent_id, agent_alias_id, session_id, input_text, timings=None, trace=None,
+                         on_trace=None, deadline=None):
     """
+    Invoke the Bedrock agent and yield completion text as chunks arrive.
+    Bytes are decoded incrementally so multi-byte UTF-8 characters split
+    across chunks are reassembled. When a timings dict is passed it receives
+    time_to_first_chunk_ms, total_stream_ms and chunk_count. Time spent
+    waiting on the agent is also recorded as the bedrock_invoke stage.
+    When an AgentTrace is passed, tracing is enabled and the trace events
+    are collected into it (calling on_trace(trace) after each one) and
+    recorded as metrics. Admission waits never pass the deadline, and
+    reading stops with DeadlineExceeded once it has passed.
+    The admission estimate is settled however the stream ends (error,
+    deadline, or a caller that stops iterating): against the traced token
+    usage, nothing when the agent was never reached, or else kept as the
+    best known cost.
+    """
+    from botocore.exceptions import ClientError
+
+    metrics = current_metrics()
+    ticket = admission.acquire(AGENT_MODEL_ID, AGENT_ESTIMATED_TOKENS, AGENT_ESTIMATED_REQUESTS, deadline=deadline)
+    started = time.perf_counter()
+    reached = False
     try:
-        response = bedrock_agent_runtime.invoke_agent(
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("No time left to invoke the Bedrock agent")
+        options = {"enableTrace": True} if trace is not None else {}
+        response = get_client('bedrock-agent-runtime').invoke_agent(
             agentId=agent_id,
             agentAliasId=agent_alias_id,
             sessionId=session_id,
-            inputText=input_text
+            inputText=input_text,
+            **options
         )
+        metrics.count('BedrockCalls')
+        reached = True
         
         # Process the streaming response
-        completion = ""
-        for event in response['completion']:
-            if 'chunk' in event:
-                chunk = event['chunk']
-                if 'bytes' in chunk:
-                    completion += chunk['bytes'].decode('utf-8')
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        chunk_count = 0
+        events = iter(response['completion'])
+        waited_ms = (time.perf_counter() - started) * 1000
+        while True:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Bedrock agent did not finish within the deadline")
+            wait_started = time.perf_counter()
+            event = next(events, None)
+            waited_ms += (time.perf_counter() - wait_started) * 1000
+            if event is None:
+                break
+            if trace is not None and 'trace' in event:
+                trace.add(event['trace'])
+                if on_trace is not None:
+                    on_trace(trace)
+                continue
+            chunk = event.get('chunk')
+            if not chunk or 'bytes' not in chunk:
+                continue
+            chunk_count += 1
+            if chunk_count == 1:
+                first_chunk_ms = (time.perf_counter() - started) * 1000
+                metrics.record_once('time_to_first_token', first_chunk_ms)
+                if timings is not None:
+                    timings['time_to_first_chunk_ms'] = round(first_chunk_ms, 1)
+            text = decoder.decode(chunk['bytes'])
+            if text:
+                yield text
         
-        return completion
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+        
+        metrics.record('bedrock_invoke', waited_ms)
+        if trace is not None:
+            trace.finish().record_metrics(metrics)
+        if timings is not None:
+            timings.setdefault('time_to_first_chunk_ms', None)
+            timings['total_stream_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            timings['chunk_count'] = chunk_count
         
     except ClientError as e:
         print(f"Error invoking Bedrock agent: {e}")
         raise e
+    finally:
+        used_tokens = 0
+        if reached:
+            used_tokens = ticket.tokens if ticket is not None else None
+            if trace is not None:
+                used_tokens = usage_tokens(trace.totals()) or used_tokens
+        admission.settle(ticket, used_tokens)
+
+def invoke_bedrock_agent(agent_id, agent_alias_id, session_id, input_text, timings=None, trace=None, deadline=None):
+    """
+    Invoke the Bedrock agent with the given input text.
+    Collects the streamed parts and joins them once at the end.
+    """
+    parts = []
+    for text in stream_bedrock_agent(agent_id, agent_alias_id, session_id, input_text, timings, trace,
+                                     deadline=deadline):
+        parts.append(text)
+    return ''.join(parts)
+
+def get_agent_trace(request):
+    """
+    A new AgentTrace when the request sets "trace" (or AGENT_TRACE is on),
+    otherwise None. Tracing adds trace events to the agent stream, so it is opt-in.
+    """
+    if request.flag('trace') or is_truthy(os.environ.get('AGENT_TRACE', 'false')):
+        return AgentTrace()
+    return None
+
+def build_agent_response(city, city_name, agent_response, agent_id, session_id, timings):
+    """
+    Response body for an agent answer about a CanonicalCity (single-city
+    requests and async jobs).
+    """
+    return {
+        "city": city.name,
+        "city_id": city.id,
+        "agent_response": agent_response,
+        "message": f"City facts for {city.name} generated via Bedrock Agent",
+        "agent_id": agent_id,
+        "session_id": session_id,
+        "requested_city": city_name,
+        "source": "bedrock_agent",
+        "timings": timings
+    }
+
+def build_agent_input(city_display):
+    """
+    Create input text for the agent that requests structured output with KB data.
+    """
+    return f"""Please provide exactly 10 interesting facts about {city_display}. 
+
+Format your response as a numbered list (1. 2. 3. etc.) with each fact on a new line.
 
+Include a mix of:
+- General historical, cultural, and geographical facts
+- Specific data from your knowledge base about air quality, water pollution, and cost of living if available
+- Modern facts about the city
+
+If you have knowledge base data for this city, make sure to include those specific metrics in your facts."""
+
+def stream_agent_events(city_name, agent_id, agent_alias_id, session_id, trace=None, deadline=None):
+    """
+    Generator API for streaming an agent answer.
+    Yields a "start" event, "text" events with partial completion text
+    and a final "done" event with stream timings (and the trace timeline
+    when an AgentTrace is passed). The agent stream stops at the deadline.
+    """
+    timings = {}
+    city = resolve_city(city_name)
+    yield {
+        "type": "start",
+        "city": city.name,
+        "city_id": city.id,
+        "requested_city": city_name,
+        "agent_id": agent_id,
+        "session_id": session_id
+    }
+    for text in stream_bedrock_agent(agent_id, agent_alias_id, session_id, build_agent_input(city.display), timings,
+                                     trace, deadline=deadline):
+        yield {"type": "text", "text": text}
+    done = {"type": "done", "timings": timings}
+    if trace is not None:
+        done["trace"] = trace.summary()
+    yield done
+
+@instrument_handler('lambda_agent')
+def stream_handler(event, context):
+    """
+    Streaming variant of the handler.
+    Emits NDJSON lines, or Server-Sent Events when the client sends
+    Accept: text/event-stream. The Python managed runtime buffers the
+    payload, so stream_agent_events() is the API for true incremental delivery.
+    """
+    metrics = current_metrics()
+    metrics.set_property('mode', 'stream')
+    with metrics.stage('event_parsing'):
+        request = normalize_event(event)
+        use_sse = request.wants_event_stream
+        city_name = request.city
+        trace = get_agent_trace(request)
+    formatter = format_sse if use_sse else format_ndjson
+    agent_id = os.environ.get('BEDROCK_AGENT_ID')
+    agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
+    headers = SSE_HEADERS if use_sse else NDJSON_HEADERS
+    
+    lines = []
+    status_code = 200
+    if not city_name:
+        status_code = 400
+        lines.append(formatter({"type": "error", "error": "Missing city parameter",
+                                "message": "Please provide a city name in the request"}))
+    elif not agent_id:
+        status_code = 500
+        lines.append(formatter({"type": "error", "error": "Configuration error",
+                                "message": "BEDROCK_AGENT_ID environment variable not set"}))
+    else:
+        text_sent = False
+        serialize_s = 0.0
+        deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+        try:
+            for stream_event in stream_agent_events(city_name, agent_id, agent_alias_id, context.aws_request_id,
+                                                    trace, deadline):
+                if stream_event["type"] == "text":
+                    text_sent = True
+                serialize_started = time.perf_counter()
+                lines.append(formatter(stream_event))
+                serialize_s += time.perf_counter() - serialize_started
+        except Exception as e:
+            print(f"Error in stream handler: {str(e)}")
+            error_status, error_label = error_response_status(e)
+            lines.append(formatter({"type": "error", "error": error_label, "message": str(e)}))
+            if not text_sent:
+                status_code = error_status
+                headers = {**headers, **error_response_headers(e)}
+        metrics.record('serialization', serialize_s * 1000)
+    
+    return http_response(status_code, ''.join(lines), request, headers)
+
+def batch_handler(request, context, cities):
+    """
+    Run the agent for a list of cities in one invocation.
+    Duplicate names are run once and each city gets its own agent session.
+    Agent calls are heavier than direct model calls, so the default
+    concurrency is lower than in lambda_direct.
+    """
+    max_cities, max_concurrency = get_batch_limits(default_concurrency=4)
+    agent_id = os.environ.get('BEDROCK_AGENT_ID')
+    agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
+    use_local = get_retrieval_mode(request) == 'local' and get_retrieval_index() is not None
+    
+    if not agent_id and not use_local:
+        return json_response(500, {
+            "error": "Configuration error",
+            "message": "BEDROCK_AGENT_ID environment variable not set"
+        }, request)
+    
+    if not cities or len(cities) > max_cities:
+        return json_response(400, {
+            "error": "Invalid cities parameter",
+            "message": f"Please provide between 1 and {max_cities} city names",
+            "example_usage": {"api_gateway_body": {"body": "{\"cities\": [\"Tokyo\", \"Paris\"]}"}}
+        }, request)
+    
+    deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+    trace_enabled = get_agent_trace(request) is not None
+    
+    def run_local(city_name):
+        info = {}
+        city = canonicalize_city(city_name)
+        answer, passages = answer_with_local_retrieval(city, deadline=deadline, info=info)
+        return {"city": city.name, "city_id": city.id, "agent_response": answer,
+                "retrieved": summarize_passages(passages), "model_used": info.get("model_id", LOCAL_MODEL_ID)}
+    
+    def run_agent(city_name):
+        city = canonicalize_city(city_name)
+        # Agent session IDs only allow [0-9a-zA-Z._:-] and at most 100 characters
+        session_id = re.sub(r'[^0-9a-zA-Z._:-]', '-', f"{context.aws_request_id}-{city.id}")[:100]
+        timings = {}
+        trace = AgentTrace() if trace_enabled else None
+        agent_response = invoke_bedrock_agent(agent_id, agent_alias_id, session_id, build_agent_input(city.display),
+                                              timings, trace, deadline)
+        result = {"city": city.name, "city_id": city.id, "agent_response": agent_response,
+                  "session_id": session_id, "timings": timings}
+        if trace is not None:
+            result["trace"] = trace.summary()
+        return result
+    
+    metrics = current_metrics()
+    metrics.set_property('mode', 'batch')
+    metrics.set_property('retrieval', 'local' if use_local else 'agent')
+    batch = run_batch(cities, run_local if use_local else run_agent, max_concurrency,
+                      remaining_budget_ms(context, limit_ms=request.gateway_remaining_ms()))
+    if use_local:
+        batch["source"] = "local_retrieval"
+    else:
+        batch["agent_id"] = agent_id
+        batch["source"] = "bedrock_agent"
+    metrics.set_property('batch_cities', batch['unique_cities'])
+    print(f"Agent batch of {batch['unique_cities']} cities finished in {batch['total_ms']} ms ({batch['failed']} failed)")
+    
+    with metrics.stage('serialization'):
+        return json_response(200, batch, request)
+
+def local_retrieval_response(request, context, city, city_name):
+    """
+    Answer a single-city request from the local retrieval index.
+    The body keeps the agent response fields so clients can switch modes.
+    """
+    metrics = current_metrics()
+    metrics.set_property('retrieval', 'local')
+    info = {}
+    deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+    answer, passages = answer_with_local_retrieval(city, request.question, deadline, info)
+    with metrics.stage('serialization'):
+        return json_response(200, {
+            "city": city.name,
+            "city_id": city.id,
+            "agent_response": answer,
+            "message": f"City facts for {city.name} generated from the local knowledge-base index",
+            "model_used": info.get("model_id", LOCAL_MODEL_ID),
+            "requested_city": city_name,
+            "source": "local_retrieval",
+            "retrieved": summarize_passages(passages)
+        }, request)
+
+def jobs_not_configured(request):
+    return json_response(500, {
+        "error": "Configuration error",
+        "message": "Async jobs need AGENT_JOB_STORE (memory, sqlite:<path> or dynamodb:<table>)"
+    }, request)
+
+def submit_agent_job(request, context, city_name):
+    """
+    Store a queued job for the agent run, dispatch it and return 202 with
+    the job ID right away. The client polls with {"job_id": ...}.
+    """
+    if job_store is None:
+        return jobs_not_configured(request)
+    metrics = current_metrics()
+    metrics.set_property('mode', 'async_submit')
+    options = {"city": city_name, "trace": request.flag('trace')}
+    job = new_job(options, int(os.environ.get('AGENT_JOB_TTL_SECONDS', 24 * 60 * 60)))
+    job_store.create(job)
+    try:
+        job_dispatcher.dispatch(job["job_id"], context, run_agent_job)
+    except Exception as e:
+        print(f"Dispatching agent job {job['job_id']} failed: {str(e)}")
+        error = {"error": "Dispatch failed", "message": str(e)}
+        JobProgress(job_store, job).fail(error)
+        return json_response(500, {**error, "job_id": job["job_id"], "status": job["status"]}, request)
+    metrics.set_property('job_id', job["job_id"])
+    print(f"Submitted agent job {job['job_id']} for {city_name}")
+    city = resolve_city(city_name)
+    return json_response(202, {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "city": city.name,
+        "city_id": city.id,
+        "requested_city": city_name,
+        "message": "Agent run started; poll with the job_id for progress and the result",
+        "poll": {"job_id": job["job_id"]},
+        "poll_interval_ms": int(os.environ.get('AGENT_JOB_POLL_INTERVAL_MS', 2000))
+    }, request)
+
+def run_agent_job(job_id, context):
+    """
+    Worker for one async job (self-invocation or local thread). Streams the
+    agent answer into the job and stores the result or the error. Jobs that
+    are no longer queued, or that a concurrent duplicate delivery claims
+    first, are left alone.
+    """
+    job = job_store.get(job_id) if job_store is not None else None
+    if job is None or job["status"] != "queued":
+        print(f"Agent job {job_id} not runnable: {job['status'] if job else 'not found'}")
+        return {"job_id": job_id, "status": job["status"] if job else "not_found"}
+    metrics = current_metrics()
+    metrics.set_property('mode', 'async_worker')
+    metrics.set_property('job_id', job_id)
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    progress = JobProgress(job_store, job, int(os.environ.get('AGENT_JOB_PROGRESS_INTERVAL_MS', 500)))
+    # The read above is only a shortcut; the conditional claim decides between concurrent deliveries
+    if not progress.start(time.time() + get_remaining() / 1000 if get_remaining else None):
+        print(f"Agent job {job_id} already claimed by another worker")
+        return {"job_id": job_id, "status": "running"}
+    
+    city_name = job["options"]["city"]
+    city = resolve_city(city_name)
+    agent_id = os.environ.get('BEDROCK_AGENT_ID')
+    agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
+    session_id = f"job-{job_id}"
+    # Always traced: the trace steps are the job's progress
+    trace = AgentTrace()
+    
+    def report_steps(current):
+        progress.steps(len(current.steps), current.steps[-1]["type"] if current.steps else None)
+    
+    try:
+        if not agent_id:
+            raise ValueError("BEDROCK_AGENT_ID environment variable not set")
+        timings = {}
+        parts = []
+        for text in stream_bedrock_agent(agent_id, agent_alias_id, session_id, build_agent_input(city.display),
+                                         timings, trace, report_steps, Deadline.from_context(context)):
+            parts.append(text)
+            progress.add_text(text)
+        result = build_agent_response(city, city_name, ''.join(parts), agent_id, session_id, timings)
+        if job["options"].get("trace"):
+            result["trace"] = trace.summary()
+        progress.succeed(result)
+    except Exception as e:
+        print(f"Agent job {job_id} failed: {str(e)}")
+        status_code, error_label = error_response_status(e)
+        progress.fail({"error": error_label, "message": str(e), "status_code": status_code})
+    print(f"Agent job {job_id} {job['status']} after {progress.writes} store writes")
+    return {"job_id": job_id, "status": job["status"]}
+
+def agent_job_status_response(request, job_id):
+    """
+    Status, progress, partial text and (once finished) the result of a job.
+    Unchanged jobs answer If-None-Match with 304, so polling is cheap.
+    """
+    if job_store is None:
+        return jobs_not_configured(request)
+    current_metrics().set_property('mode', 'async_status')
+    job = job_store.get(str(job_id))
+    if job is None:
+        return json_response(404, {"error": "Job not found", "message": f"No agent job {job_id}", "job_id": job_id},
+                             request)
+    return json_response(200, job_status(job), request, cacheable=True)
+
+@instrument_handler('lambda_agent')
 def handler(event, context):
     """
     Lambda function handler that uses a Bedrock agent to generate city facts.
     """
+    metrics = current_metrics()
     try:
-        # Extract city name from event
-        city_name = get_city_from_event(event)
+        with metrics.stage('event_parsing'):
+            # Classify the event and decode it once
+            request = normalize_event(event)
+            cities = request.cities
+            city_name = None if cities is not None else request.city
+            metrics_only = cities is None and bool(city_name) and (
+                request.flag('metrics_only') or is_metrics_question(request.question))
+        metrics.set_property('event_source', request.source)
+        
+        # Async job worker (self-invocation); never accepted from API Gateway
+        if request.source == 'direct' and request.option('agent_job'):
+            return run_agent_job(str(request.option('agent_job')), context)
+        
+        if request.option('job_id'):
+            return agent_job_status_response(request, request.option('job_id'))
+        
+        if request.flag('stream'):
+            return stream_handler(request, context)
+        
+        if cities is not None:
+            return batch_handler(request, context, cities)
         
         # Validate input
         if not city_name:
-            return {
-                "statusCode": 400,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                    "Access-Control-Allow-Methods": "POST,OPTIONS"
-                },
-                "body": json.dumps({
-                    "error": "Missing city parameter",
-                    "message": "Please provide a city name in the request",
-                    "example_usage": {
-                        "direct_invocation": {"city": "Tokyo"},
-                        "api_gateway_body": {"body": "{\"city\": \"Tokyo\"}"},
-                        "api_gateway_query": "?city=Tokyo"
-                    }
-                })
-            }
+            return json_response(400, {
+                "error": "Missing city parameter",
+                "message": "Please provide a city name in the request",
+                "example_usage": {
+                    "direct_invocation": {"city": "Tokyo"},
+                    "api_gateway_body": {"body": "{\"city\": \"Tokyo\"}"},
+                    "api_gateway_query": "?city=Tokyo"
+                }
+            }, request)
+        
+        # Canonicalize the city so every spelling shares one prompt and metrics lookup
+        city = resolve_city(city_name)
+        
+        # Pure metrics questions are answered from the packaged index without the agent
+        if metrics_only:
+            city_metrics = city.metrics()
+            if city_metrics is not None:
+                metrics.set_property('mode', 'metrics_only')
+                return json_response(200, {
+                    "city": city.name,
+                    "city_id": city.id,
+                    "metrics": city_metrics,
+                    "message": f"Metrics for {city_metrics['city']} from the packaged knowledge-base index",
+                    "requested_city": city_name,
+                    "source": "city_index"
+                }, request, cacheable=True)
+            print(f"No index metrics for {city_name}; falling back to the agent")
+        
+        # Local retrieval: search the packaged index and call the model directly
+        if get_retrieval_mode(request) == 'local':
+            if get_retrieval_index() is not None:
+                return local_retrieval_response(request, context, city, city_name)
+            print("Retrieval index not available; falling back to the agent")
         
         # Get agent configuration from environment variables
         agent_id = os.environ.get('BEDROCK_AGENT_ID')
         agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
         
         if not agent_id:
-            return {
-                "statusCode": 500,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                    "Access-Control-Allow-Methods": "POST,OPTIONS"
-                },
-                "body": json.dumps({
-                    "error": "Configuration error",
-                    "message": "BEDROCK_AGENT_ID environment variable not set"
-                })
-            }
+            return json_response(500, {
+                "error": "Configuration error",
+                "message": "BEDROCK_AGENT_ID environment variable not set"
+            }, request)
+        
+        # Slow agent runs: return a job ID now and run the agent in the background
+        if request.flag('async'):
+            return submit_agent_job(request, context, city_name)
+        
         session_id = context.aws_request_id  # Use request ID as session ID
         
         # Create input text for the agent that requests structured output with KB data
-        input_text = f"""Please provide exactly 10 interesting facts about {city_name.strip()}. 
-
-Format your response as a numbered list (1. 2. 3. etc.) with each fact on a new line.
-
-Include a mix of:
-- General historical, cultural, and geographical facts
-- Specific data from your knowledge base about air quality, water pollution, and cost of living if available
-- Modern facts about the city
-
-If you have knowledge base data for this city, make sure to include those specific metrics in your facts."""
+        input_text = build_agent_input(city.display)
         
-        # Invoke the Bedrock agent
-        agent_response = invoke_bedrock_agent(agent_id, agent_alias_id, session_id, input_text)
+        # Invoke the Bedrock agent, with a step timeline when tracing was requested
+        timings = {}
+        trace = get_agent_trace(request)
+        deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+        agent_response = invoke_bedrock_agent(agent_id, agent_alias_id, session_id, input_text, timings, trace, deadline)
+        print(f"Agent stream timings: {json.dumps(timings)}")
         
         # Parse the agent response (it should contain the city facts)
-        response = {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Access-Control-Allow-Methods": "POST,OPTIONS"
-            },
-            "body": json.dumps({
-                "city": city_name.strip().title(),
-                "agent_response": agent_response,
-                "message": f"City facts for {city_name} generated via Bedrock Agent",
-                "agent_id": agent_id,
-                "session_id": session_id,
-                "requested_city": city_name,
-                "source": "bedrock_agent"
-            })
-        }
-        
-        return response
+        response_body = build_agent_response(city, city_name, agent_response, agent_id, session_id, timings)
+        if trace is not None:
+            response_body["trace"] = trace.summary()
+            metrics.set_property('agent_trace', response_body["trace"]["totals"])
+            print(f"Agent trace: {json.dumps(response_body['trace']['totals'])}")
+        # The answer is regenerated on every call, so it gets no ETag
+        with metrics.stage('serialization'):
+            return json_response(200, response_body, request)
         
     except Exception as e:
         print(f"Error in handler: {str(e)}")
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Access-Control-Allow-Methods": "POST,OPTIONS"
-            },
-            "body": json.dumps({
-                "error": "Internal server error",
-                "message": str(e),
-                "requested_city": city_name if 'city_name' in locals() else "Unknown"
-            })
-        }
\ No newline at end of file
+        # An exhausted quota budget maps to 429 with Retry-After instead of a generic 500
+        status_code, error_label = error_response_status(e)
+        retry_headers = error_response_headers(e)
+        error_response = {
+            "error": error_label,
+            "message": str(e),
+            "requested_city": city_name if 'city_name' in locals() else "Unknown"
+        }
+        if retry_headers:
+            error_response["retry_after_seconds"] = int(retry_headers["Retry-After"])
+        return json_response(status_code, error_response, extra_headers=retry_headers)
\ No newline at end of file
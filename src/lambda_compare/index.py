@@ -0,0 +1,254 @@
+import contextvars
+import os
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Imported first so cold-start timing covers the rest of module init
+import common.runtime  # noqa: F401
+from common.agent_trace import AgentTrace
+from common.bedrock_invoke import Deadline, error_response_headers, error_response_status
+from common.events import normalize_event
+from common.fact_stream import format_ndjson, format_sse
+from common.http_response import NDJSON_HEADERS, SSE_HEADERS, http_response, json_response
+from common.metrics import current_metrics, instrument_handler
+
+# Both paths are packaged with this function (see scripts/build.sh); their module init
+# creates the Bedrock clients, the fact cache and the city index as usual
+import lambda_agent.index as agent
+import lambda_direct.index as direct
+
+PATHS = ('direct', 'agent')
+
+def run_direct_path(city, city_name, bypass_cache, options, deadline):
+    """
+    The lambda_direct answer for a city: facts from the cache or Claude.
+    """
+    info = {}
+    facts, cache_status = direct.get_city_facts(city, bypass_cache, deadline, info, options)
+    result = direct.build_facts_response(city, city_name, facts, cache_status, info, options)
+    result["usage"] = info.get("usage")
+    return result
+
+def run_agent_path(city, city_name, session_id, deadline):
+    """
+    The lambda_agent answer for a city. The run is traced so the comparison
+    can report the agent's token usage and where its time went. Reading the
+    agent stream stops once the request deadline has passed, and a stalled
+    read ends at the agent client's read timeout (AGENT_READ_TIMEOUT); the
+    stream is closed either way so its admission ticket is settled.
+    """
+    agent_id = os.environ.get('BEDROCK_AGENT_ID')
+    if not agent_id:
+        raise ValueError("BEDROCK_AGENT_ID environment variable not set")
+    agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
+    timings = {}
+    trace = AgentTrace()
+    parts = []
+    stream = agent.stream_bedrock_agent(agent_id, agent_alias_id, session_id, agent.build_agent_input(city.display),
+                                        timings, trace, deadline=deadline)
+    try:
+        for text in stream:
+            parts.append(text)
+    finally:
+        stream.close()
+    agent_response = ''.join(parts)
+    result = agent.build_agent_response(city, city_name, agent_response, agent_id, session_id, timings)
+    totals = trace.totals()
+    result["usage"] = {"input_tokens": totals["input_tokens"], "output_tokens": totals["output_tokens"]}
+    result["trace_totals"] = totals
+    return result
+
+def compare_city(city_name, session_id, bypass_cache=False, options=None, deadline=None):
+    """
+    Generator API for a comparison. Starts the direct and agent paths
+    concurrently for the same canonical city and yields a "start" event,
+    one "result" event per path in the order they finish (each with status,
+    total_ms and usage) and a "done" event with the overall timings.
+    Both paths share the request deadline; a path still running when it
+    passes is reported as timed_out so the finished path is not lost.
+    """
+    deadline = deadline or Deadline()
+    city = direct.resolve_city(city_name)
+    metrics = current_metrics()
+    started = time.perf_counter()
+    finished = queue.Queue()
+    runners = {
+        'direct': lambda: run_direct_path(city, city_name, bypass_cache, options, deadline),
+        'agent': lambda: run_agent_path(city, city_name, session_id, deadline),
+    }
+
+    def run(path):
+        path_started = time.perf_counter()
+        try:
+            result = dict(runners[path](), status="ok")
+        except Exception as e:
+            print(f"Error in {path} path: {str(e)}")
+            status_code, error_label = error_response_status(e)
+            result = {"status": "error", "error": error_label, "message": str(e), "status_code": status_code}
+            retry_after = error_response_headers(e).get("Retry-After")
+            if retry_after is not None:
+                result["retry_after_seconds"] = int(retry_after)
+        result["total_ms"] = round((time.perf_counter() - path_started) * 1000, 1)
+        metrics.record(f"compare_{path}", result["total_ms"])
+        finished.put((path, result))
+
+    yield {"type": "start", "city": city.name, "city_id": city.id, "requested_city": city_name,
+           "paths": list(PATHS)}
+
+    # Both paths run in the caller's context so their stages and token counts reach the request metrics
+    request_context = contextvars.copy_context()
+    pool = ThreadPoolExecutor(max_workers=len(PATHS), thread_name_prefix='compare')
+    try:
+        for path in PATHS:
+            pool.submit(request_context.copy().run, run, path)
+        order = []
+        path_ms = {}
+        for _ in PATHS:
+            remaining_ms = deadline.remaining_ms()
+            try:
+                path, result = finished.get(timeout=None if remaining_ms is None else remaining_ms / 1000)
+            except queue.Empty:
+                break
+            order.append(path)
+            path_ms[path] = result["total_ms"]
+            yield {"type": "result", "path": path, "result": result}
+    finally:
+        pool.shutdown(wait=False)
+
+    # The slower path is abandoned at the deadline (its thread finishes unobserved)
+    for path in PATHS:
+        if path not in path_ms:
+            result = {"status": "timed_out", "error": "Deadline exceeded", "status_code": 504,
+                      "message": f"The {path} path did not finish within the request deadline",
+                      "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+            metrics.count('CompareTimeouts')
+            order.append(path)
+            path_ms[path] = result["total_ms"]
+            yield {"type": "result", "path": path, "result": result}
+
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    sequential_ms = round(sum(path_ms.values()), 1)
+    yield {
+        "type": "done",
+        "city": city.name,
+        "city_id": city.id,
+        "timings": {
+            "direct_ms": path_ms["direct"],
+            "agent_ms": path_ms["agent"],
+            "total_ms": total_ms,
+            "sequential_ms": sequential_ms,
+            "saved_ms": round(sequential_ms - total_ms, 1),
+            "first_path": order[0]
+        }
+    }
+
+def get_comparison_inputs(request):
+    """
+    City, cache bypass flag and generation options, read the way the
+    direct Lambda reads them.
+    """
+    return request.city, direct.get_cache_bypass(request), direct.get_generation_options(request)
+
+def comparison_session_id(context):
+    # Agent session IDs only allow [0-9a-zA-Z._:-] and at most 100 characters
+    return re.sub(r'[^0-9a-zA-Z._:-]', '-', f"compare-{context.aws_request_id}")[:100]
+
+def missing_city_response(request):
+    return json_response(400, {
+        "error": "Missing city parameter",
+        "message": "Please provide a city name in the request",
+        "example_usage": {
+            "direct_invocation": {"city": "Tokyo"},
+            "api_gateway_body": {"body": "{\"city\": \"Tokyo\"}"},
+            "api_gateway_query": "?city=Tokyo"
+        }
+    }, request)
+
+@instrument_handler('lambda_compare')
+def stream_handler(event, context):
+    """
+    Streaming variant of the handler.
+    Emits each path's result as soon as it finishes, as NDJSON lines or
+    Server-Sent Events when the client sends Accept: text/event-stream.
+    The Python managed runtime buffers the payload, so compare_city() is the
+    API for true incremental delivery.
+    """
+    metrics = current_metrics()
+    metrics.set_property('mode', 'compare_stream')
+    with metrics.stage('event_parsing'):
+        request = normalize_event(event)
+        use_sse = request.wants_event_stream
+        city_name, bypass_cache, options = get_comparison_inputs(request)
+    formatter = format_sse if use_sse else format_ndjson
+
+    if not city_name or not city_name.strip():
+        return http_response(400, formatter({"type": "error", "error": "Missing city parameter",
+                                             "message": "Please provide a city name in the request"}),
+                             request, SSE_HEADERS if use_sse else NDJSON_HEADERS)
+
+    lines = []
+    serialize_s = 0.0
+    deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+    for compare_event in compare_city(city_name, comparison_session_id(context), bypass_cache, options, deadline):
+        serialize_started = time.perf_counter()
+        lines.append(formatter(compare_event))
+        serialize_s += time.perf_counter() - serialize_started
+    metrics.record('serialization', serialize_s * 1000)
+    return http_response(200, ''.join(lines), request, SSE_HEADERS if use_sse else NDJSON_HEADERS)
+
+@instrument_handler('lambda_compare')
+def handler(event, context):
+    """
+    Lambda function handler that answers one city through both the direct
+    model path and the Bedrock agent path, concurrently, in one invocation.
+    Latency is the slower of the two paths instead of their sum.
+    """
+    metrics = current_metrics()
+    try:
+        with metrics.stage('event_parsing'):
+            request = normalize_event(event)
+            city_name, bypass_cache, options = get_comparison_inputs(request)
+        metrics.set_property('event_source', request.source)
+
+        if request.flag('stream'):
+            return stream_handler(request, context)
+
+        if not city_name or not city_name.strip():
+            return missing_city_response(request)
+
+        metrics.set_property('mode', 'compare')
+        response_body = {}
+        deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+        for compare_event in compare_city(city_name, comparison_session_id(context), bypass_cache, options, deadline):
+            if compare_event["type"] == "start":
+                response_body.update(city=compare_event["city"], city_id=compare_event["city_id"],
+                                     requested_city=city_name)
+            elif compare_event["type"] == "result":
+                response_body[compare_event["path"]] = compare_event["result"]
+            else:
+                response_body["timings"] = compare_event["timings"]
+
+        metrics.set_dimension('CacheStatus', response_body["direct"].get("cache_status", "error"))
+        print(f"Comparison for {response_body['city']}: {response_body['timings']}")
+        failed = [response_body[path] for path in PATHS if response_body[path]["status"] != "ok"]
+        status_code = 200
+        extra_headers = None
+        if len(failed) == len(PATHS):
+            # Both paths out of quota is backpressure, not a gateway failure
+            throttled = [result for result in failed if result["status_code"] == 429]
+            status_code = 429 if len(throttled) == len(PATHS) else 502
+            if status_code == 429:
+                extra_headers = {"Retry-After": str(max(result.get("retry_after_seconds", 1) for result in throttled))}
+        # The agent half is regenerated on every call, so the comparison gets no ETag
+        with metrics.stage('serialization'):
+            return json_response(status_code, response_body, request, extra_headers=extra_headers)
+
+    except Exception as e:
+        print(f"Error in handler: {str(e)}")
+        return json_response(500, {
+            "error": "Internal server error",
+            "message": str(e),
+            "requested_city": city_name if 'city_name' in locals() else "Unknown"
+        })
@@ -1,126 +1,629 @@
 import json
-import boto3
-from botocore.exceptions import ClientError
+import math
+import os
+import time
 
-# Initialize Bedrock client
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+# Imported first so cold-start timing covers the rest of module init
+from common.runtime import get_client, init_clients
+from common.admission import CHARS_PER_TOKEN, estimate_tokens, get_admission_controller, usage_tokens
+from common.batch import get_batch_limits, remaining_budget_ms, run_batch
+from common.bedrock_invoke import (Deadline, DeadlineExceeded, ResilientInvoker, error_response_headers,
+                                   error_response_status, policy_from_env)
+from common.events import is_truthy, normalize_event
+from common.city_index import canonicalize_city, get_city_index
+from common.fact_cache import cache_from_env, make_cache_key
+from common.fact_stream import FactStreamParser, format_ndjson, format_sse, parse_facts
+from common.http_response import NDJSON_HEADERS, SSE_HEADERS, http_response, json_response
+from common.metrics import current_metrics, instrument_handler
+
+# Create the Bedrock client during init unless CLIENT_INIT_MODE=lazy
+init_clients('bedrock-runtime')
 
 # Model ID for Claude 3 Haiku (supports ON_DEMAND)
 MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
 
-def get_city_from_event(event):
+# Bump whenever the prompt or fact parsing changes so cached facts are regenerated
+PROMPT_VERSION = "v3"
+
+# Compact mode: forced tool-use output, a tighter prompt and max_tokens sized to the request
+COMPACT_PROMPT_VERSION = "compact-v2"
+FACTS_TOOL_NAME = "record_city_facts"
+DEFAULT_FACT_COUNT = 10
+MAX_FACT_COUNT = 20
+DEFAULT_MAX_FACT_CHARS = 160
+MIN_FACT_CHARS = 40
+MAX_FACT_CHARS = 400
+
+# Fact cache lives at module scope so it survives warm invocations
+fact_cache = cache_from_env()
+
+# Retries, hedging and model fallback for invoke_claude; tracks latency across warm invocations
+claude_invoker = ResilientInvoker()
+
+# Opens response streams with the same retries and fallback; a hedge would open a second stream
+stream_policy = policy_from_env()
+stream_policy.hedge_enabled = False
+stream_invoker = ResilientInvoker(stream_policy)
+
+# Token buckets sized to the Bedrock quotas (ADMISSION_*), shared with the other functions through ADMISSION_STORE
+admission = get_admission_controller()
+
+# Load the city metrics index once per container, during cold start
+get_city_index()
+
+def get_cache_bypass(request):
     """
-    Extract city name from the Lambda event.
-    Supports multiple input formats including Bedrock agent format.
+    Check whether the caller asked to skip the fact cache.
+    Accepts a bypass_cache flag or a Cache-Control: no-cache header.
     """
-    city_name = None
-    
-    # Check if it's a Bedrock agent call
-    if 'requestBody' in event and 'content' in event['requestBody']:
-        try:
-            content = event['requestBody']['content']
-            if 'application/json' in content:
-                properties = content['application/json'].get('properties', [])
-                for prop in properties:
-                    if prop.get('name') == 'city':
-                        city_name = prop.get('value')
-                        break
-        except (KeyError, TypeError):
-            pass
-    
-    # Check if it's from API Gateway
-    if not city_name and 'body' in event:
-        try:
-            if isinstance(event['body'], str):
-                body = json.loads(event['body'])
-            else:
-                body = event['body']
-            city_name = body.get('city')
-        except (json.JSONDecodeError, AttributeError):
-            pass
+    return request.flag('bypass_cache') or 'no-cache' in str(request.header('cache-control', '')).lower()
+
+def get_generation_options(request):
+    """
+    Read the generation options from a normalized request.
+    compact=true selects compact mode (default from COMPACT_MODE_DEFAULT);
+    fact_count and max_fact_chars size the answer and imply compact mode
+    unless compact is explicitly false.
+    """
+    compact = request.option('compact')
+    sized = request.option('fact_count') is not None or request.option('max_fact_chars') is not None
+    if compact is None:
+        compact = sized or is_truthy(os.environ.get('COMPACT_MODE_DEFAULT', 'false'))
+    else:
+        compact = is_truthy(compact)
     
-    # Check if it's direct invocation with city parameter
-    if not city_name and 'city' in event:
-        city_name = event['city']
+    if not compact:
+        return {"mode": "classic", "fact_count": DEFAULT_FACT_COUNT, "max_fact_chars": None}
+    return {
+        "mode": "compact",
+        "fact_count": request.int_option('fact_count', DEFAULT_FACT_COUNT, 1, MAX_FACT_COUNT),
+        "max_fact_chars": request.int_option(
+            'max_fact_chars', DEFAULT_MAX_FACT_CHARS, MIN_FACT_CHARS, MAX_FACT_CHARS)
+    }
+
+def build_claude_request(prompt, max_tokens=1000, tool=None):
+    """
+    Build the Messages API request body shared by the blocking and streaming calls.
+    When a tool is given, Claude is forced to answer by calling it, so the
+    output is the tool's JSON input and nothing else.
+    """
+    request = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+    if tool is not None:
+        request["tools"] = [tool]
+        request["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    return request
+
+def invoke_claude(prompt, deadline=None, info=None):
+    """
+    Invoke Claude 3 Haiku via Bedrock and return the answer text.
+    """
+    response_body = invoke_claude_request(build_claude_request(prompt), deadline, info)
+    return response_body['content'][0]['text']
+
+def invoke_claude_request(request, deadline=None, info=None):
+    """
+    Send a Messages API request to Bedrock and return the parsed response body.
+    Each attempt is bounded by the request deadline, throttling is retried
+    with jittered backoff, slow calls may be hedged and the models in
+    BEDROCK_FALLBACK_MODEL_IDS are tried if Claude 3 Haiku keeps failing.
+    When an info dict is passed it receives model_id, attempt counts and usage.
+    Raises AdmissionRejected without calling Bedrock when the quota budget
+    is exhausted.
+    """
+    body = json.dumps(request)
+    ticket = admission.acquire(MODEL_ID, estimate_tokens(body, request.get('max_tokens')), deadline=deadline)
     
-    # Check query string parameters (for API Gateway)
-    if not city_name and 'queryStringParameters' in event and event['queryStringParameters']:
-        city_name = event['queryStringParameters'].get('city')
+    def call(model_id):
+        response = get_client('bedrock-runtime').invoke_model(
+            modelId=model_id,
+            body=body,
+            contentType='application/json'
+        )
+        return json.loads(response['body'].read())
     
-    # For agent calls, also check the inputText
-    if not city_name and 'inputText' in event:
-        # Extract city name from natural language input
-        input_text = event['inputText']
-        # Simple extraction - look for common patterns
-        words = input_text.split()
-        for i, word in enumerate(words):
-            if word.lower() in ['about', 'for', 'in'] and i + 1 < len(words):
-                city_name = words[i + 1]
-                break
-        # If no pattern found, use the whole input as potential city name
-        if not city_name:
-            city_name = input_text.strip()
+    metrics = current_metrics()
+    info = {} if info is None else info
+    try:
+        with metrics.stage('bedrock_invoke'):
+            response_body = claude_invoker.invoke(call, MODEL_ID, deadline, info)
+    except Exception as e:
+        print(f"Error invoking Bedrock: {e}")
+        raise e
+    finally:
+        metrics.count('BedrockCalls', info.get('attempts', 0) + info.get('hedged', 0))
+        # The ticket covered one call; retries, hedges and fallbacks each reached Bedrock too
+        admission.charge_extra(ticket, info.get('attempts', 0) + info.get('hedged', 0) - 1)
+        metrics.count('Retries', info.get('retries'))
+        metrics.count('HedgedRequests', info.get('hedged'))
+        metrics.count('HedgeWins', 1 if info.get('hedge_won') else 0)
+        metrics.count('ModelFallbacks', 1 if info.get('fallback_used') else 0)
     
-    return city_name
+    metrics.add_usage(response_body.get('usage'))
+    info["usage"] = response_body.get('usage')
+    admission.settle(ticket, usage_tokens(info["usage"]))
+    return response_body
 
-def invoke_claude(prompt):
+def invoke_claude_stream(request, deadline=None, info=None):
     """
-    Invoke Claude 3 Haiku via Bedrock
+    Invoke Claude 3 Haiku with the response-stream API for a request body
+    from build_claude_request(). Yields text deltas, or the partial tool
+    input JSON in compact mode, as soon as Bedrock sends them. Only the
+    time spent waiting on Bedrock counts as bedrock_invoke, not the
+    caller's work between deltas.
+    Opening the stream is retried and falls back like invoke_claude_request;
+    reading stops with DeadlineExceeded once the deadline has passed. When
+    an info dict is passed it receives model_id and attempt counts. The
+    admission ticket is settled however the stream ends (error, deadline,
+    or a caller that stops iterating) with the tokens seen so far.
     """
-    try:
-        # Prepare the request body for Claude
-        body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        }
-        
-        # Invoke the model
-        response = bedrock_runtime.invoke_model(
-            modelId=MODEL_ID,
-            body=json.dumps(body),
+    from botocore.exceptions import ClientError
+
+    metrics = current_metrics()
+    body = json.dumps(request)
+    ticket = admission.acquire(MODEL_ID, estimate_tokens(body, request.get('max_tokens')), deadline=deadline)
+    info = {} if info is None else info
+    started = time.perf_counter()
+    usage = {}
+    output_chars = 0
+    stream = None
+    
+    def call(model_id):
+        return get_client('bedrock-runtime').invoke_model_with_response_stream(
+            modelId=model_id,
+            body=body,
             contentType='application/json'
         )
+    
+    try:
+        try:
+            response = stream_invoker.invoke(call, MODEL_ID, deadline, info)
+        finally:
+            metrics.count('BedrockCalls', info.get('attempts', 0))
+            admission.charge_extra(ticket, info.get('attempts', 0) - 1)
+            metrics.count('Retries', info.get('retries'))
+            metrics.count('ModelFallbacks', 1 if info.get('fallback_used') else 0)
+        
+        stream = response['body']
+        events = iter(stream)
+        waited_ms = (time.perf_counter() - started) * 1000
+        first_token = True
+        while True:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Bedrock stream did not finish within the deadline")
+            wait_started = time.perf_counter()
+            event = next(events, None)
+            waited_ms += (time.perf_counter() - wait_started) * 1000
+            if event is None:
+                break
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            message = json.loads(chunk['bytes'])
+            message_type = message.get('type')
+            if message_type == 'content_block_delta':
+                delta = message.get('delta', {})
+                text = delta.get('text') or delta.get('partial_json')
+                if text:
+                    if first_token:
+                        metrics.record_once('time_to_first_token', (time.perf_counter() - started) * 1000)
+                        first_token = False
+                    output_chars += len(text)
+                    yield text
+            elif message_type == 'message_start':
+                usage['input_tokens'] = message.get('message', {}).get('usage', {}).get('input_tokens')
+                metrics.count('InputTokens', usage['input_tokens'])
+            elif message_type == 'message_delta':
+                usage['output_tokens'] = message.get('usage', {}).get('output_tokens')
+                metrics.count('OutputTokens', usage['output_tokens'])
         
-        # Parse the response
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
+        metrics.record('bedrock_invoke', waited_ms)
         
     except ClientError as e:
-        print(f"Error invoking Bedrock: {e}")
+        print(f"Error invoking Bedrock stream: {e}")
         raise e
+    finally:
+        # Output usage only arrives at the end; a stream cut short is charged for the text it produced
+        if usage.get('output_tokens') is None and output_chars:
+            usage['output_tokens'] = math.ceil(output_chars / CHARS_PER_TOKEN)
+        admission.settle(ticket, usage_tokens(usage) or 0)
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+
+def resolve_city(city_name):
+    """
+    Canonical form of a requested city (see common.city_index), recorded in
+    the request metrics so spellings of one city aggregate together.
+    """
+    city = canonicalize_city(city_name)
+    metrics = current_metrics()
+    metrics.set_property('city_id', city.id)
+    metrics.set_property('city_match', city.match or 'unknown')
+    if city.suggestion is not None:
+        # Fuzzy hits are only a hint: the prompt and cache keep the requested name
+        metrics.set_property('city_suggestion', city.suggestion.id)
+    return city
+
+def build_city_prompt(city_display):
+    """
+    Build the Claude prompt that asks for 10 facts about a city as JSON.
+    Update PROMPT_VERSION whenever this template changes.
+    """
+    prompt = f"""Please provide exactly 10 interesting and factual information points about {city_display}. 
+        Format your response as a JSON object with the following structure:
+        {{
+            "city": "{city_display}",
+            "facts": [
+                "fact 1",
+                "fact 2",
+                ...
+            ]
+        }}
+        
+        Make sure each fact is unique, interesting, and accurate. Include a mix of historical, cultural, geographical, and modern facts about the city. If this is not a real city or you don't have information about it, please indicate that in your response."""
+    return prompt
+
+def build_compact_prompt(city_display, fact_count, max_fact_chars):
+    """
+    Tighter prompt for compact mode. The JSON shape comes from the tool
+    schema, so the prompt only describes the content.
+    Update COMPACT_PROMPT_VERSION whenever this template changes.
+    """
+    return (f"List {fact_count} distinct, accurate facts about {city_display}: a mix of history, "
+            f"culture, geography and modern life. Each fact is one sentence under {max_fact_chars} "
+            f"characters. If {city_display} is not a real city, return an empty facts list.")
+
+def build_facts_tool(fact_count, max_fact_chars):
+    """
+    Tool whose input schema is the compact answer format.
+    """
+    return {
+        "name": FACTS_TOOL_NAME,
+        "description": "Record facts about a city.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "city": {"type": "string"},
+                "facts": {
+                    "type": "array",
+                    "items": {"type": "string", "maxLength": max_fact_chars},
+                    "maxItems": fact_count
+                }
+            },
+            "required": ["city", "facts"]
+        }
+    }
+
+def compact_max_tokens(fact_count, max_fact_chars):
+    """
+    Output token budget for a compact answer: about 3.5 characters per
+    token for each fact plus JSON quoting, and a small allowance for the
+    tool-call envelope.
+    """
+    return min(4096, 40 + fact_count * (math.ceil(max_fact_chars / 3.5) + 4))
+
+def build_compact_request(city_display, options):
+    return build_claude_request(
+        build_compact_prompt(city_display, options["fact_count"], options["max_fact_chars"]),
+        compact_max_tokens(options["fact_count"], options["max_fact_chars"]),
+        build_facts_tool(options["fact_count"], options["max_fact_chars"])
+    )
+
+def clip_fact(fact, max_chars):
+    """
+    Enforce the length limit, cutting at a word boundary.
+    """
+    if max_chars is None or len(fact) <= max_chars:
+        return fact
+    cut = fact[:max_chars - 1].rsplit(' ', 1)[0].rstrip(' ,;:')
+    return cut + "…"
+
+def extract_tool_facts(response_body, options):
+    """
+    Extract facts from a compact-mode response: the input of the forced
+    tool call. Falls back to the tolerant text parser if Claude answered
+    in text anyway.
+    """
+    facts = None
+    text_parts = []
+    for block in response_body.get('content', []):
+        if block.get('type') == 'tool_use' and block.get('name') == FACTS_TOOL_NAME:
+            facts = (block.get('input') or {}).get('facts')
+        elif block.get('type') == 'text':
+            text_parts.append(block.get('text', ''))
+    if not isinstance(facts, list):
+        facts = parse_facts(''.join(text_parts))
+    facts = [str(fact).strip() for fact in facts if str(fact).strip()]
+    return [clip_fact(fact, options["max_fact_chars"]) for fact in facts[:options["fact_count"]]]
+
+def get_cache_version(options):
+    """
+    Prompt version part of the cache key. Compact answers also depend on
+    the requested size.
+    """
+    if options is None or options["mode"] == "classic":
+        return PROMPT_VERSION
+    return f"{COMPACT_PROMPT_VERSION}/{options['fact_count']}/{options['max_fact_chars']}"
+
+def extract_facts(claude_response):
+    """
+    Extract the list of facts from Claude's response text.
+    A single tolerant pass handles leading prose, code fences, trailing
+    commas, truncated output and plain numbered lists.
+    """
+    return parse_facts(claude_response)
+
+def get_city_facts(city, bypass_cache=False, deadline=None, info=None, options=None):
+    """
+    Return (facts, cache_status) for a CanonicalCity.
+    Serves from the fact cache (keyed by the canonical city ID) when possible,
+    otherwise asks Claude about the city's display name and caches any usable
+    answer; a bypass still refreshes the entry.
+    options come from get_generation_options() (classic mode when None).
+    When an info dict is passed it receives the model that produced the facts.
+    """
+    cache_key = make_cache_key(city.id, MODEL_ID, get_cache_version(options))
+    cached, cache_tier = (None, None) if bypass_cache else fact_cache.lookup(cache_key)
+    metrics = current_metrics()
+    metrics.set_property('generation_mode', options["mode"] if options else "classic")
+    info = {} if info is None else info
+    
+    if cached is not None:
+        metrics.count('CacheHits')
+        info["model_id"] = cached.get("model_used", MODEL_ID)
+        return cached["facts"], f"{cache_tier}_hit"
+    
+    # Get response from Claude
+    metrics.count('CacheMisses')
+    if options is not None and options["mode"] == "compact":
+        response_body = invoke_claude_request(build_compact_request(city.display, options), deadline, info)
+        with metrics.stage('response_parsing'):
+            facts = extract_tool_facts(response_body, options)
+    else:
+        claude_response = invoke_claude(build_city_prompt(city.display), deadline, info)
+        with metrics.stage('response_parsing'):
+            facts = extract_facts(claude_response)
+    if facts:
+        fact_cache.put(cache_key, {"facts": facts, "model_used": info.get("model_id", MODEL_ID)})
+    return facts, "bypass" if bypass_cache else "miss"
+
+def build_facts_response(city, city_name, facts, cache_status, info, options):
+    """
+    Response body for generated facts (single-city requests and comparisons).
+    """
+    return {
+        "city": city.name,
+        "city_id": city.id,
+        "facts": facts,
+        "total_facts": len(facts),
+        "message": f"Here are facts about {city.name} generated by Claude 3 Haiku!",
+        "model_used": info.get("model_id", MODEL_ID),
+        "requested_city": city_name,
+        "cache_status": cache_status,
+        "generation": options,
+        "metrics": city.metrics()
+    }
+
+def batch_handler(request, context, cities):
+    """
+    Generate facts for a list of cities in one invocation.
+    Duplicate names are generated once and cities run concurrently
+    up to BATCH_MAX_CONCURRENCY.
+    """
+    max_cities, max_concurrency = get_batch_limits(default_concurrency=8)
+    
+    if not cities or len(cities) > max_cities:
+        return json_response(400, {
+            "error": "Invalid cities parameter",
+            "message": f"Please provide between 1 and {max_cities} city names",
+            "example_usage": {"api_gateway_body": {"body": "{\"cities\": [\"Tokyo\", \"Paris\"]}"}}
+        }, request)
+    
+    bypass_cache = get_cache_bypass(request)
+    options = get_generation_options(request)
+    deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+    
+    def generate(city_name):
+        info = {}
+        city = canonicalize_city(city_name)
+        facts, cache_status = get_city_facts(city, bypass_cache, deadline, info, options)
+        return {
+            "city": city.name,
+            "city_id": city.id,
+            "facts": facts,
+            "total_facts": len(facts),
+            "cache_status": cache_status,
+            "model_used": info.get("model_id", MODEL_ID),
+            "metrics": city.metrics()
+        }
+    
+    metrics = current_metrics()
+    metrics.set_dimension('CacheStatus', 'batch')
+    metrics.set_property('mode', 'batch')
+    batch = run_batch(cities, generate, max_concurrency,
+                      remaining_budget_ms(context, limit_ms=request.gateway_remaining_ms()))
+    batch["model_used"] = MODEL_ID
+    batch["generation"] = options
+    metrics.set_property('batch_cities', batch['unique_cities'])
+    print(f"Batch of {batch['unique_cities']} cities finished in {batch['total_ms']} ms "
+          f"({batch['failed']} failed): {json.dumps(fact_cache.stats())}")
+    
+    with metrics.stage('serialization'):
+        return json_response(200, batch, request)
 
+def stream_city_facts(city_name, bypass_cache=False, options=None, deadline=None):
+    """
+    Generator API for streaming city facts.
+    Yields a "start" event, one "fact" event per fact as soon as it is
+    complete, and a final "done" event with timings, cache status and the
+    model that produced the facts (a cache hit or a fallback may differ
+    from "start"). In compact mode the streamed tool input goes through the
+    same parser. The Bedrock stream stops at the deadline.
+    """
+    started = time.perf_counter()
+    city = resolve_city(city_name)
+    compact = options is not None and options["mode"] == "compact"
+    max_chars = options["max_fact_chars"] if compact else None
+    fact_limit = options["fact_count"] if compact else None
+    yield {
+        "type": "start",
+        "city": city.name,
+        "city_id": city.id,
+        "requested_city": city_name,
+        "model_used": MODEL_ID,
+        "generation": options,
+        "metrics": city.metrics()
+    }
+    
+    cache_key = make_cache_key(city.id, MODEL_ID, get_cache_version(options))
+    cached, cache_tier = (None, None) if bypass_cache else fact_cache.lookup(cache_key)
+    first_fact_ms = None
+    metrics = current_metrics()
+    metrics.set_property('generation_mode', "compact" if compact else "classic")
+    
+    model_used = MODEL_ID
+    if cached is not None:
+        metrics.count('CacheHits')
+        facts = cached["facts"]
+        model_used = cached.get("model_used", MODEL_ID)
+        cache_status = f"{cache_tier}_hit"
+        for index, fact in enumerate(facts):
+            if first_fact_ms is None:
+                first_fact_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield {"type": "fact", "index": index, "fact": fact}
+    else:
+        metrics.count('CacheMisses')
+        cache_status = "bypass" if bypass_cache else "miss"
+        parser = FactStreamParser()
+        emitted = 0
+        # Parse time is summed locally; a timed block per delta costs more than the parse
+        parse_s = 0.0
+        if compact:
+            request = build_compact_request(city.display, options)
+        else:
+            request = build_claude_request(build_city_prompt(city.display))
+        info = {}
+        for text in invoke_claude_stream(request, deadline, info):
+            parse_started = time.perf_counter()
+            completed = parser.feed(text)
+            parse_s += time.perf_counter() - parse_started
+            for fact in completed:
+                if fact_limit is not None and emitted >= fact_limit:
+                    break
+                if first_fact_ms is None:
+                    first_fact_ms = round((time.perf_counter() - started) * 1000, 1)
+                yield {"type": "fact", "index": emitted, "fact": clip_fact(fact, max_chars)}
+                emitted += 1
+        
+        # finish() flushes a trailing fact or, without a facts array, the numbered-list fallback
+        parse_started = time.perf_counter()
+        facts = [clip_fact(fact, max_chars) for fact in parser.finish()[:fact_limit]]
+        metrics.record('response_parsing', (parse_s + time.perf_counter() - parse_started) * 1000)
+        for index in range(emitted, len(facts)):
+            if first_fact_ms is None:
+                first_fact_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield {"type": "fact", "index": index, "fact": facts[index]}
+        
+        model_used = info.get("model_id", MODEL_ID)
+        if facts:
+            fact_cache.put(cache_key, {"facts": facts, "model_used": model_used})
+    
+    metrics.set_dimension('CacheStatus', cache_status)
+    yield {
+        "type": "done",
+        "city": city.name,
+        "total_facts": len(facts),
+        "model_used": model_used,
+        "cache_status": cache_status,
+        "time_to_first_fact_ms": first_fact_ms,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+@instrument_handler('lambda_direct')
+def stream_handler(event, context):
+    """
+    Streaming variant of the handler.
+    Emits NDJSON lines, or Server-Sent Events when the client sends
+    Accept: text/event-stream. The Python managed runtime buffers the
+    payload, so stream_city_facts() is the API for true incremental delivery.
+    """
+    metrics = current_metrics()
+    metrics.set_property('mode', 'stream')
+    with metrics.stage('event_parsing'):
+        request = normalize_event(event)
+        use_sse = request.wants_event_stream
+        city_name = request.city
+        bypass_cache = get_cache_bypass(request)
+        options = get_generation_options(request)
+    formatter = format_sse if use_sse else format_ndjson
+    
+    headers = SSE_HEADERS if use_sse else NDJSON_HEADERS
+    if not city_name or not city_name.strip():
+        lines = [formatter({"type": "error", "error": "Missing city parameter",
+                            "message": "Please provide a city name in the request"})]
+        status_code = 400
+    else:
+        lines = []
+        status_code = 200
+        facts_sent = 0
+        serialize_s = 0.0
+        deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+        try:
+            for stream_event in stream_city_facts(city_name, bypass_cache, options, deadline):
+                if stream_event["type"] == "fact":
+                    facts_sent += 1
+                serialize_started = time.perf_counter()
+                lines.append(formatter(stream_event))
+                serialize_s += time.perf_counter() - serialize_started
+        except Exception as e:
+            print(f"Error in stream handler: {str(e)}")
+            error_status, error_label = error_response_status(e)
+            lines.append(formatter({"type": "error", "error": error_label, "message": str(e)}))
+            if facts_sent == 0:
+                status_code = error_status
+                headers = {**headers, **error_response_headers(e)}
+        metrics.record('serialization', serialize_s * 1000)
+    
+    return http_response(status_code, ''.join(lines), request, headers)
+
+@instrument_handler('lambda_direct')
 def handler(event, context):
     """
     Lambda function handler that uses Claude 3 Haiku to generate city facts.
     Accepts any city name as input and generates facts using the model.
     Handles both direct invocation and Bedrock agent invocation.
+    Raw events are only logged for a DEBUG_EVENT_SAMPLE_RATE sample of requests.
     """
+    metrics = current_metrics()
+    is_agent_call = False
     try:
-        # Log the incoming event for debugging
-        print(f"Received event: {json.dumps(event)}")
-        
-        # Check if this is a Bedrock agent invocation
-        is_agent_call = False
-        if 'agent' in event or 'sessionId' in event or 'inputText' in event or 'messageVersion' in event:
-            is_agent_call = True
+        with metrics.stage('event_parsing'):
+            # Classify the event (agent action group, API Gateway, direct) and decode it once
+            request = normalize_event(event)
+            is_agent_call = request.is_agent_call
+            cities = request.cities
+            city_name = None if cities is not None else request.city
+            bypass_cache = get_cache_bypass(request)
+            options = get_generation_options(request)
+        metrics.set_property('event_source', request.source)
+        if is_agent_call:
             print(f"Detected agent call: {is_agent_call}")
         
-        # Extract city name from event
-        city_name = get_city_from_event(event)
+        # Streaming requests from API Gateway or direct invocation
+        if not is_agent_call and request.flag('stream'):
+            return stream_handler(request, context)
         
-        # For agent calls, also check the inputText
-        if not city_name and is_agent_call:
-            if 'inputText' in event:
-                # Use the input text directly as the city name if no specific city was extracted
-                city_name = event['inputText'].strip()
-            elif 'messageVersion' in event and 'inputText' in event:
-                city_name = event['inputText'].strip()
+        if cities is not None:
+            return batch_handler(request, context, cities)
         
         # Validate input - only check if city name is provided
         if not city_name or not city_name.strip():
@@ -151,95 +654,25 @@ def handler(event, context):
                     }
                 }
             else:
-                return {
-                    "statusCode": 400,
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*",
-                        "Access-Control-Allow-Headers": "Content-Type",
-                        "Access-Control-Allow-Methods": "POST,OPTIONS"
-                    },
-                    "body": json.dumps(error_response)
-                }
+                return json_response(400, error_response, request)
         
-        # Normalize city name for consistent output
-        normalized_city = city_name.strip().title()
+        # Canonicalize the city so every spelling shares one cache entry and prompt
+        city = resolve_city(city_name)
         
-        # Create prompt for Claude
-        prompt = f"""Please provide exactly 10 interesting and factual information points about {normalized_city}. 
-        Format your response as a JSON object with the following structure:
-        {{
-            "city": "{normalized_city}",
-            "facts": [
-                "fact 1",
-                "fact 2",
-                ...
-            ]
-        }}
+        # Serve from the fact cache unless the caller asked to bypass it
+        info = {}
+        deadline = Deadline.from_context(context, limit_ms=request.gateway_remaining_ms())
+        facts, cache_status = get_city_facts(city, bypass_cache, deadline, info, options)
+        metrics.set_dimension('CacheStatus', cache_status)
         
-        Make sure each fact is unique, interesting, and accurate. Include a mix of historical, cultural, geographical, and modern facts about the city. If this is not a real city or you don't have information about it, please indicate that in your response."""
+        print(f"Fact cache {cache_status} for {city.id}: {json.dumps(fact_cache.stats())}")
         
-        # Get response from Claude
-        claude_response = invoke_claude(prompt)
-        
-        # Try to parse Claude's JSON response
-        try:
-            # First try to parse the response directly
-            city_data = json.loads(claude_response)
-            facts = city_data.get("facts", [])
-        except json.JSONDecodeError:
-            # If that fails, try to extract JSON from the response
-            try:
-                # Look for JSON-like content in the response
-                start_idx = claude_response.find('{')
-                end_idx = claude_response.rfind('}') + 1
-                if start_idx != -1 and end_idx > start_idx:
-                    json_str = claude_response[start_idx:end_idx]
-                    city_data = json.loads(json_str)
-                    facts = city_data.get("facts", [])
-                else:
-                    raise ValueError("No JSON found")
-            except (json.JSONDecodeError, ValueError):
-                # Final fallback - extract numbered facts from text
-                facts = []
-                lines = claude_response.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    # Skip empty lines, JSON formatting characters, and very short lines
-                    if not line or len(line) <= 3:
-                        continue
-                    # Skip all JSON syntax characters and patterns
-                    if line in ['{', '}', '[', ']', ',', '",', '"', '":"', '"facts":', '"city":']:
-                        continue
-                    # Skip lines that look like JSON structure
-                    if line.startswith('{') or line.endswith('}') or line.startswith('[') or line.endswith(']'):
-                        continue
-                    if line.endswith(':') or line.endswith('": [') or line.endswith('",') or line.endswith('"'):
-                        continue
-                    # Skip lines that are just field names
-                    if line.startswith('"') and '":' in line:
-                        continue
-                    # Remove leading numbers, bullets, quotes, and commas
-                    cleaned = line.lstrip('0123456789.-) ').strip('"').strip(',').strip()
-                    # Additional cleanup - remove any remaining quotes or brackets
-                    cleaned = cleaned.replace('{', '').replace('}', '').replace('[', '').replace(']', '').strip()
-                    # Only add substantial content (more than 20 chars, contains letters)
-                    if cleaned and len(cleaned) > 20 and any(c.isalpha() for c in cleaned):
-                        facts.append(cleaned)
-                # Limit to 10 facts
-                facts = facts[:10]
-        
-        success_response = {
-            "city": normalized_city,
-            "facts": facts,
-            "total_facts": len(facts),
-            "message": f"Here are facts about {normalized_city} generated by Claude 3 Haiku!",
-            "model_used": MODEL_ID,
-            "requested_city": city_name
-        }
+        success_response = build_facts_response(city, city_name, facts, cache_status, info, options)
         
         if is_agent_call:
             # For agent calls, return the expected format
+            with metrics.stage('serialization'):
+                body = json.dumps(success_response)
             return {
                 "messageVersion": "1.0",
                 "response": {
@@ -249,31 +682,31 @@ def handler(event, context):
                     "httpStatusCode": 200,
                     "responseBody": {
                         "application/json": {
-                            "body": json.dumps(success_response)
+                            "body": body
                         }
                     }
                 }
             }
         else:
-            # For direct calls, return HTTP response format
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                    "Access-Control-Allow-Methods": "POST,OPTIONS"
-                },
-                "body": json.dumps(success_response)
-            }
+            # For direct calls, return HTTP response format. The ETag only covers the
+            # facts, so a cache miss and later hits for the same city revalidate
+            with metrics.stage('serialization'):
+                return json_response(200, success_response, request, etag_content={
+                    "city": city.id, "facts": facts, "model_used": success_response["model_used"],
+                    "generation": options})
         
     except Exception as e:
         print(f"Error in handler: {str(e)}")
+        # An exhausted quota budget maps to 429 with Retry-After, Bedrock timeouts to 504
+        status_code, error_label = error_response_status(e)
+        retry_headers = error_response_headers(e)
         error_response = {
-            "error": "Internal server error",
+            "error": error_label,
             "message": str(e),
             "requested_city": city_name if 'city_name' in locals() else "Unknown"
         }
+        if retry_headers:
+            error_response["retry_after_seconds"] = int(retry_headers["Retry-After"])
         
         if is_agent_call:
             return {
@@ -282,7 +715,7 @@ def handler(event, context):
                     "actionGroup": event.get("actionGroup", "CityFactsActionGroup"),
                     "apiPath": event.get("apiPath", "/city-facts"),
                     "httpMethod": event.get("httpMethod", "POST"),
-                    "httpStatusCode": 500,
+                    "httpStatusCode": status_code,
                     "responseBody": {
                         "application/json": {
                             "body": json.dumps(error_response)
@@ -291,13 +724,4 @@ def handler(event, context):
                 }
             }
         else:
-            return {
-                "statusCode": 500,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                    "Access-Control-Allow-Methods": "POST,OPTIONS"
-                },
-                "body": json.dumps(error_response)
-            }
\ No newline at end of file
+            return json_response(status_code, error_response, extra_headers=retry_headers)
\ No newline at end of file
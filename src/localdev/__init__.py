@@ -0,0 +1,4 @@
+"""
+Local development helpers: Bedrock stubs and offline tooling.
+Not packaged into the Lambda functions.
+"""
@@ -0,0 +1,422 @@
+"""
+Local stand-in for the REST API in terraform/api_gateway.tf.
+
+An HTTP server mounts the Lambda handlers behind the same routes (POST and
+OPTIONS on /direct, /agent and /compare, optionally under /prod) and hands
+them the REST API proxy events API Gateway would send, without the Cognito
+authorizer. Like the deployed API, request bodies arrive base64-encoded
+(binary media types "*/*"), base64 responses are sent as bytes, the stage
+throttle (rate 25, burst 50) answers 429 and calls that run past the
+29 second integration timeout answer 504.
+
+Each function runs in a pool of container processes. A request goes to
+the most recently used idle container of its function; when none is idle
+a new one is started (a cold start: a fresh interpreter imports the
+handler module), up to max_containers, after which the request is
+throttled with 429 like a Lambda at its concurrency limit. Containers idle
+for longer than idle_timeout_s are stopped, so the next request is cold
+again. Every response carries X-Local-Container, X-Local-Cold-Start,
+X-Local-Init-Ms and X-Local-Duration-Ms for the load generator.
+"""
+import base64
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from common.admission import take
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGE = 'prod'
+INTEGRATION_TIMEOUT_S = 29
+DEFAULT_THROTTLE_RATE = 25
+DEFAULT_THROTTLE_BURST = 50
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match",
+    "Access-Control-Allow-Methods": "POST,OPTIONS",
+    "Access-Control-Allow-Origin": "*",
+}
+
+
+class FunctionConfig:
+    """
+    One Lambda function behind a route, with its terraform/lambda.tf settings.
+    """
+
+    def __init__(self, name, module, timeout_s, memory_mb=128, handler='handler'):
+        self.name = name
+        self.module = module
+        self.timeout_s = timeout_s
+        self.memory_mb = memory_mb
+        self.handler = handler
+
+
+ROUTES = {
+    '/direct': FunctionConfig('city-facts-direct', 'lambda_direct.index', 30),
+    '/agent': FunctionConfig('city-facts-agent', 'lambda_agent.index', 120),
+    '/compare': FunctionConfig('city-facts-compare', 'lambda_compare.index', 28, memory_mb=256),
+}
+
+
+def build_event(method, path, headers, query, body, source_ip='127.0.0.1'):
+    """
+    REST API proxy event for a request, as API Gateway builds it. With
+    binary media types "*/*" every request body is base64-encoded.
+    """
+    now = time.time()
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": dict(headers) or None,
+        "multiValueHeaders": {name: [value] for name, value in headers.items()} or None,
+        "queryStringParameters": {name: values[-1] for name, values in query.items()} or None,
+        "multiValueQueryStringParameters": dict(query) or None,
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": path,
+            "httpMethod": method,
+            "path": f"/{STAGE}{path}",
+            "stage": STAGE,
+            "requestId": str(uuid.uuid4()),
+            "requestTimeEpoch": int(now * 1000),
+            "identity": {"sourceIp": source_ip},
+            "protocol": "HTTP/1.1",
+            "apiId": "local",
+        },
+        "body": base64.b64encode(body).decode('ascii') if body else None,
+        "isBase64Encoded": bool(body),
+    }
+
+
+def _container_main(conn, config, environ, stub_options):
+    """
+    Body of a container process: import the handler (the cold start), then
+    answer invocations from the pipe until it is closed.
+    """
+    os.environ.update(environ)
+    if stub_options.get('quiet'):
+        sys.stdout = open(os.devnull, 'w')
+    sys.path.insert(0, SRC_ROOT)
+    started = time.perf_counter()
+    import importlib
+    module = importlib.import_module(config.module)
+    if stub_options.get('stub'):
+        from localdev.stub_bedrock import StubBedrockAgentRuntime, StubBedrockRuntime, install_stubs
+        install_stubs(
+            direct=StubBedrockRuntime(latency_ms=stub_options.get('latency_ms', 0),
+                                      token_ms=stub_options.get('token_ms', 0),
+                                      quota_rps=stub_options.get('quota_rps')),
+            agent=StubBedrockAgentRuntime(latency_ms=stub_options.get('agent_latency_ms', 0),
+                                          step_ms=stub_options.get('agent_step_ms', 0))
+        )
+    handler = getattr(module, config.handler)
+    conn.send({"init_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    while True:
+        try:
+            event, request_id = conn.recv()
+        except EOFError:
+            return
+        deadline = time.monotonic() + config.timeout_s
+        context = types.SimpleNamespace(
+            aws_request_id=request_id,
+            function_name=config.name,
+            memory_limit_in_mb=config.memory_mb,
+            invoked_function_arn=f"arn:aws:lambda:local:000000000000:function:{config.name}",
+            get_remaining_time_in_millis=lambda: max(0, int((deadline - time.monotonic()) * 1000))
+        )
+        invoke_started = time.perf_counter()
+        try:
+            result = {"response": handler(event, context)}
+        except Exception as e:
+            print(f"Unhandled error in {config.name}: {e}")
+            result = {"error": str(e)}
+        result["duration_ms"] = round((time.perf_counter() - invoke_started) * 1000, 1)
+        conn.send(result)
+
+
+class Container:
+    """
+    One container process and its end of the pipe.
+    """
+
+    def __init__(self, name, process, conn, init_ms):
+        self.name = name
+        self.process = process
+        self.conn = conn
+        self.init_ms = init_ms
+        self.invocations = 0
+        self.last_used = time.monotonic()
+
+    def stop(self):
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class ContainerPool:
+    """
+    Warm and cold containers for one function.
+    """
+
+    def __init__(self, config, max_containers=10, idle_timeout_s=300, environ=None, stub_options=None):
+        self.config = config
+        self.max_containers = max_containers
+        self.idle_timeout_s = idle_timeout_s
+        self.environ = dict(environ or {})
+        self.stub_options = dict(stub_options or {})
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._idle = []
+        self._busy = 0
+        self._started = 0
+        self.cold_starts = 0
+        self.throttles = 0
+
+    def _start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_container_main, daemon=True,
+                                        args=(child_conn, self.config, self.environ, self.stub_options))
+        process.start()
+        child_conn.close()
+        try:
+            ready = parent_conn.recv()
+        except EOFError:
+            process.join(1)
+            raise RuntimeError(f"{self.config.name} container exited during init (exit code {process.exitcode})")
+        with self._lock:
+            self._started += 1
+            number = self._started
+        return Container(f"{self.config.name}-{number}", process, parent_conn, ready["init_ms"])
+
+    def acquire(self):
+        """
+        (container, cold) for the next invocation, or (None, False) when the
+        function is at max_containers.
+        """
+        with self._lock:
+            if self._idle:
+                self._busy += 1
+                return self._idle.pop(), False
+            if self._busy >= self.max_containers:
+                self.throttles += 1
+                return None, False
+            self._busy += 1
+            self.cold_starts += 1
+        try:
+            return self._start(), True
+        except Exception:
+            with self._lock:
+                self._busy -= 1
+            raise
+
+    def release(self, container, healthy=True):
+        with self._lock:
+            self._busy -= 1
+            if healthy:
+                container.last_used = time.monotonic()
+                self._idle.append(container)
+                return
+        container.stop()
+
+    def prewarm(self, count):
+        # Hold every container until all are started, or the first one is reused
+        containers = [self.acquire()[0] for _ in range(min(count, self.max_containers))]
+        for container in containers:
+            self.release(container)
+
+    def reap(self):
+        """
+        Stop containers idle for longer than idle_timeout_s.
+        """
+        cutoff = time.monotonic() - self.idle_timeout_s
+        with self._lock:
+            expired = [c for c in self._idle if c.last_used < cutoff]
+            self._idle = [c for c in self._idle if c.last_used >= cutoff]
+        for container in expired:
+            container.stop()
+        return len(expired)
+
+    def invoke(self, event, timeout_s=INTEGRATION_TIMEOUT_S):
+        """
+        Run one invocation. Returns (result, container, cold): result holds
+        "response" or "error" and "duration_ms", or None when throttled or
+        when the integration timed out (the container finishes in the
+        background and is stopped if it passes the function timeout).
+        """
+        container, cold = self.acquire()
+        if container is None:
+            return None, None, False
+        container.invocations += 1
+        container.conn.send((event, event["requestContext"]["requestId"]))
+        if container.conn.poll(timeout_s):
+            try:
+                result = container.conn.recv()
+            except EOFError:
+                self.release(container, healthy=False)
+                return {"error": "Container exited"}, container, cold
+            self.release(container)
+            return result, container, cold
+
+        def finish_in_background():
+            healthy = container.conn.poll(max(0, self.config.timeout_s - timeout_s))
+            if healthy:
+                container.conn.recv()
+            self.release(container, healthy)
+
+        threading.Thread(target=finish_in_background, daemon=True).start()
+        return None, container, cold
+
+    def stats(self):
+        with self._lock:
+            return {"idle": len(self._idle), "busy": self._busy, "cold_starts": self.cold_starts,
+                    "throttles": self.throttles}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for container in idle:
+            container.stop()
+
+
+class LocalApiGateway:
+    """
+    Routes, stage throttle, container pools and optional request recording.
+    """
+
+    def __init__(self, pools, throttle_rate=DEFAULT_THROTTLE_RATE, throttle_burst=DEFAULT_THROTTLE_BURST,
+                 record_path=None, timeout_s=INTEGRATION_TIMEOUT_S):
+        self.pools = pools
+        self.limits = {"requests": (float(throttle_burst), float(throttle_rate))} if throttle_rate > 0 else {}
+        self.timeout_s = timeout_s
+        self._throttle_state = None
+        self._lock = threading.Lock()
+        self._record = open(record_path, 'a') if record_path else None
+
+    def admit(self):
+        """
+        Stage-level throttle (aws_api_gateway_method_settings): a token bucket.
+        """
+        if not self.limits:
+            return True
+        with self._lock:
+            state, wait_s = take(self._throttle_state, self.limits, {"requests": 1}, time.monotonic())
+            if state is not None:
+                self._throttle_state = state
+        return wait_s == 0
+
+    def record(self, method, path, headers, query, body):
+        if self._record is None:
+            return
+        entry = {"ts": round(time.time(), 3), "method": method, "path": path,
+                 "headers": {name: value for name, value in headers.items()
+                             if name.lower() not in ('authorization', 'host', 'content-length')},
+                 "query": {name: values[-1] for name, values in query.items()},
+                 "body": body.decode('utf-8', errors='replace') if body else None}
+        with self._lock:
+            self._record.write(json.dumps(entry) + '\n')
+            self._record.flush()
+
+    def handle(self, method, raw_path, headers, body, source_ip='127.0.0.1'):
+        """
+        (status, headers, body bytes) for one HTTP request.
+        """
+        parts = urlsplit(raw_path)
+        path = parts.path.rstrip('/') or '/'
+        if path.startswith(f"/{STAGE}/"):
+            path = path[len(STAGE) + 1:]
+        pool = self.pools.get(path)
+        if pool is None or method not in ('POST', 'OPTIONS'):
+            return 403, {"Content-Type": "application/json"}, b'{"message":"Missing Authentication Token"}'
+        if method == 'OPTIONS':
+            return 200, dict(CORS_HEADERS), b''
+        if not self.admit():
+            return 429, {"Content-Type": "application/json"}, b'{"message":"Too Many Requests"}'
+
+        query = parse_qs(parts.query)
+        self.record(method, path, headers, query, body)
+        event = build_event(method, path, headers, query, body, source_ip)
+        try:
+            result, container, cold = pool.invoke(event, self.timeout_s)
+        except Exception as e:
+            print(f"Invocation of {pool.config.name} failed: {e}")
+            return 502, {"Content-Type": "application/json"}, b'{"message": "Internal server error"}'
+        local_headers = {"x-amzn-RequestId": event["requestContext"]["requestId"]}
+        if container is not None:
+            local_headers.update({
+                "X-Local-Container": container.name,
+                "X-Local-Cold-Start": "true" if cold else "false",
+                "X-Local-Init-Ms": str(container.init_ms if cold else 0),
+            })
+        if container is None:
+            # Lambda at its concurrency limit
+            return 429, {"Content-Type": "application/json", **local_headers}, b'{"message":"Rate Exceeded."}'
+        if result is None:
+            return 504, {"Content-Type": "application/json", **local_headers}, \
+                b'{"message": "Endpoint request timed out"}'
+        local_headers["X-Local-Duration-Ms"] = str(result["duration_ms"])
+        response = result.get("response")
+        if "error" in result or not isinstance(response, dict) or "statusCode" not in response:
+            # Unhandled exceptions and malformed proxy responses
+            return 502, {"Content-Type": "application/json", **local_headers}, b'{"message": "Internal server error"}'
+        response_body = response.get("body") or ''
+        data = base64.b64decode(response_body) if response.get("isBase64Encoded") else response_body.encode('utf-8')
+        response_headers = dict(response.get("headers") or {})
+        for name, values in (response.get("multiValueHeaders") or {}).items():
+            response_headers[name] = ', '.join(str(value) for value in values)
+        return int(response["statusCode"]), {**response_headers, **local_headers}, data
+
+    def reap(self):
+        return sum(pool.reap() for pool in self.pools.values())
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        if self._record is not None:
+            self._record.close()
+
+
+def make_server(gateway, host='127.0.0.1', port=3000):
+    """
+    ThreadingHTTPServer in front of a LocalApiGateway.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _serve(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            headers = {name: value for name, value in self.headers.items()}
+            status, response_headers, data = gateway.handle(self.command, self.path, headers, body,
+                                                            self.client_address[0])
+            self.send_response(status)
+            for name, value in response_headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_POST = _serve
+        do_OPTIONS = _serve
+        do_GET = _serve
+        do_PUT = _serve
+        do_DELETE = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
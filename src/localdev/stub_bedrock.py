@@ -0,0 +1,377 @@
+"""
+Offline stand-ins for the Bedrock runtime and agent runtime clients.
+
+The stubs implement the subset of the boto3 client API the Lambdas use
+(invoke_model, invoke_model_with_response_stream, invoke_agent) and return
+realistic payloads: Messages API bodies with usage, streamed
+content_block_delta events, and agent completions split into byte chunks
+that may cut through multi-byte characters. Latency and token pacing are
+configurable so the handlers can be benchmarked without calling AWS.
+"""
+import collections
+import io
+import json
+import random
+import re
+import threading
+import time
+
+FACT_TEMPLATES = [
+    "{city} has a history that stretches back several centuries and shaped its street layout.",
+    "The historic centre of {city} draws millions of visitors every year.",
+    "{city} is known for a distinctive local cuisine built on regional ingredients.",
+    "Public transport in {city} carries a large share of daily commuters.",
+    "{city} hosts an annual festival that fills the city with music and street food.",
+    "Several universities in {city} make it a hub for research and students.",
+    "The skyline of {city} mixes landmark architecture from many different eras.",
+    "{city} sits in a region whose geography strongly influenced its trade routes.",
+    "Parks and green spaces cover a notable part of {city}'s urban area.",
+    "{city} has produced artists and writers whose \"local\" style became famous abroad.",
+]
+
+# Free-form answers elaborate on each fact; compact (tool-use) answers do not
+FACT_DETAILS = [
+    "Many of the oldest buildings still stand along the original roads laid out by its first settlers.",
+    "Guided walking tours, museums and small cafes line the narrow streets of the old town.",
+    "Markets sell seasonal produce, and several dishes from here are now served around the world.",
+    "The network keeps expanding, with new lines planned to connect the suburbs to the centre.",
+    "Hundreds of thousands of people attend, and many locals take time off work to join in.",
+    "Thousands of international students arrive each year, adding to the city's diverse population.",
+    "Modern towers now stand next to churches, palaces and civic buildings from earlier centuries.",
+    "Rivers, hills and the nearby coast determined where early markets and harbours were built.",
+    "Residents use them year round for sport, concerts, picnics and seasonal celebrations.",
+    "Their work is displayed in galleries across the city and studied in schools worldwide.",
+]
+
+# Output shapes seen from Claude, weighted roughly by how often they occur
+OUTPUT_SHAPES = [
+    ('clean_json', 6),
+    ('leading_prose', 2),
+    ('code_fence', 2),
+    ('trailing_comma', 1),
+    ('truncated', 1),
+    ('numbered_list', 1),
+]
+
+
+def estimate_tokens(text):
+    """
+    Rough Claude token estimate (~4 characters per token).
+    """
+    return max(1, len(text) // 4)
+
+
+def tokenize(text):
+    """
+    Split text into small pieces resembling model tokens.
+    """
+    return re.findall(r'\s*\S{1,4}|\s+', text)
+
+
+def build_facts(city, fact_count=10, detailed=True, max_chars=None):
+    """
+    Stub facts for a city; detailed facts add a second sentence, and
+    max_chars clips them the way a length-limited answer would be.
+    """
+    facts = []
+    for index in range(fact_count):
+        fact = FACT_TEMPLATES[index % len(FACT_TEMPLATES)].format(city=city)
+        if detailed:
+            fact = f"{fact} {FACT_DETAILS[index % len(FACT_DETAILS)]}"
+        if max_chars is not None and len(fact) > max_chars:
+            fact = fact[:max_chars].rsplit(' ', 1)[0].rstrip(',') + '.'
+        facts.append(fact)
+    return facts
+
+
+def build_claude_output(city, shape, fact_count=10):
+    """
+    Build a free-form Claude answer for a city in one of the OUTPUT_SHAPES.
+    """
+    facts = build_facts(city, fact_count)
+    answer = json.dumps({"city": city, "facts": facts}, indent=2, ensure_ascii=False)
+    if shape == 'leading_prose':
+        return f"Here are {fact_count} interesting facts about {city}:\n\n{answer}"
+    if shape == 'code_fence':
+        return f"```json\n{answer}\n```\n\nLet me know if you would like more detail!"
+    if shape == 'trailing_comma':
+        return answer.replace('"\n  ]', '",\n  ]')
+    if shape == 'truncated':
+        return answer[:int(len(answer) * 0.8)]
+    if shape == 'numbered_list':
+        return f"Facts about {city}:\n\n" + '\n'.join(f"{i}. {fact}" for i, fact in enumerate(facts, 1))
+    return answer
+
+
+class _Body:
+    """
+    Minimal StreamingBody replacement with read().
+    """
+
+    def __init__(self, payload):
+        self._stream = io.BytesIO(payload)
+
+    def read(self, amt=None):
+        return self._stream.read(amt)
+
+
+class StubBedrockRuntime:
+    """
+    Stub for the bedrock-runtime client.
+
+    latency_ms       time before the first byte (or the whole answer for invoke_model)
+    token_ms         delay between streamed tokens
+    shape            fixed output shape, or None to pick from OUTPUT_SHAPES
+    error_rate       fraction of calls raising ThrottlingException
+    tail_rate        fraction of calls delayed by an extra tail_ms (slow outliers)
+    quota_rps        calls allowed per rolling second; calls over it raise
+                     ThrottlingException, like an exhausted Bedrock quota
+    """
+
+    def __init__(self, latency_ms=0, token_ms=0, shape=None, error_rate=0.0, seed=0, jitter=0.0,
+                 tail_rate=0.0, tail_ms=0, quota_rps=None):
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.shape = shape
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.quota_rps = quota_rps
+        self.calls = 0
+        self.throttled = 0
+        self._window = collections.deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _prepare(self, body):
+        request = json.loads(body)
+        prompt = request['messages'][0]['content']
+        if isinstance(prompt, list):
+            prompt = ' '.join(part.get('text', '') for part in prompt)
+        match = re.search(r'about ([^.:\n]+?)[.:]', prompt)
+        city = match.group(1).strip() if match else 'Unknown'
+        tool = None
+        if request.get('tools') and (request.get('tool_choice') or {}).get('type') == 'tool':
+            tool = request['tools'][0]
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.error_rate
+            shape = self.shape or self._random.choices(
+                [name for name, _ in OUTPUT_SHAPES], [weight for _, weight in OUTPUT_SHAPES])[0]
+            jitter = 1 + self._random.uniform(-self.jitter, self.jitter) if self.jitter else 1
+            tail_ms = self.tail_ms if self.tail_rate and self._random.random() < self.tail_rate else 0
+            if self.quota_rps is not None and not fail:
+                now = time.monotonic()
+                while self._window and self._window[0] <= now - 1:
+                    self._window.popleft()
+                fail = len(self._window) >= self.quota_rps
+                if not fail:
+                    self._window.append(now)
+            self.throttled += 1 if fail else 0
+        if fail:
+            from botocore.exceptions import ClientError
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                'InvokeModel'
+            )
+        if tool is not None:
+            # Forced tool use: the answer is the tool input JSON, sized by the schema
+            facts_schema = tool['input_schema']['properties']['facts']
+            facts = build_facts(city, facts_schema.get('maxItems', 10), detailed=False,
+                                max_chars=facts_schema.get('items', {}).get('maxLength'))
+            shape = 'tool_use'
+            text = json.dumps({"city": city, "facts": facts}, ensure_ascii=False)
+            while facts and estimate_tokens(text) > request.get('max_tokens', 1000):
+                facts.pop()
+                text = json.dumps({"city": city, "facts": facts}, ensure_ascii=False)
+        else:
+            text = build_claude_output(city, shape)
+            limit = request.get('max_tokens', 1000) * 4
+            if len(text) > limit:
+                text, shape = text[:limit], 'truncated'
+        return prompt, text, shape, jitter, tail_ms, tool
+
+    def _sleep(self, ms):
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None, **kwargs):
+        prompt, text, shape, jitter, tail_ms, tool = self._prepare(body)
+        output_tokens = estimate_tokens(text)
+        self._sleep(self.latency_ms * jitter + tail_ms + self.token_ms * output_tokens)
+        if tool is not None:
+            content = [{"type": "tool_use", "id": f"toolu_stub_{self.calls}", "name": tool['name'],
+                        "input": json.loads(text)}]
+            stop_reason = "tool_use"
+        else:
+            content = [{"type": "text", "text": text}]
+            stop_reason = "max_tokens" if shape == 'truncated' else "end_turn"
+        payload = {
+            "id": f"msg_stub_{self.calls}",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": content,
+            "stop_reason": stop_reason,
+            "usage": {"input_tokens": estimate_tokens(prompt), "output_tokens": output_tokens}
+        }
+        return {
+            "body": _Body(json.dumps(payload).encode('utf-8')),
+            "contentType": "application/json",
+            "ResponseMetadata": {"HTTPStatusCode": 200}
+        }
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType=None, accept=None, **kwargs):
+        prompt, text, shape, jitter, tail_ms, tool = self._prepare(body)
+        tokens = tokenize(text)
+        if tool is not None:
+            block = {"type": "tool_use", "id": f"toolu_stub_{self.calls}", "name": tool['name'], "input": {}}
+            delta_type, delta_key, stop_reason = "input_json_delta", "partial_json", "tool_use"
+        else:
+            block = {"type": "text", "text": ""}
+            delta_type, delta_key = "text_delta", "text"
+            stop_reason = "max_tokens" if shape == 'truncated' else "end_turn"
+
+        def events():
+            started = time.perf_counter()
+            self._sleep(self.latency_ms * jitter + tail_ms)
+            first_byte_ms = (time.perf_counter() - started) * 1000
+            yield _event({"type": "message_start", "message": {
+                "id": f"msg_stub_{self.calls}", "model": modelId,
+                "usage": {"input_tokens": estimate_tokens(prompt), "output_tokens": 1}}})
+            yield _event({"type": "content_block_start", "index": 0, "content_block": block})
+            for token in tokens:
+                self._sleep(self.token_ms)
+                yield _event({"type": "content_block_delta", "index": 0,
+                              "delta": {"type": delta_type, delta_key: token}})
+            yield _event({"type": "content_block_stop", "index": 0})
+            yield _event({"type": "message_delta",
+                          "delta": {"stop_reason": stop_reason},
+                          "usage": {"output_tokens": len(tokens)}})
+            yield _event({"type": "message_stop", "amazon-bedrock-invocationMetrics": {
+                "inputTokenCount": estimate_tokens(prompt),
+                "outputTokenCount": len(tokens),
+                "invocationLatency": round((time.perf_counter() - started) * 1000),
+                "firstByteLatency": round(first_byte_ms)}})
+
+        return {"body": events(), "contentType": "application/json"}
+
+
+def _event(message):
+    return {"chunk": {"bytes": json.dumps(message).encode('utf-8')}}
+
+
+class StubBedrockAgentRuntime:
+    """
+    Stub for the bedrock-agent-runtime client.
+    The completion is a numbered list of facts (with a KB-style metric line)
+    delivered as byte chunks of random size. With enableTrace=True it is
+    preceded by trace events for pre-processing, a knowledge-base lookup,
+    the CityFactsActionGroup call and the final model call; step_ms is
+    the time each of those steps takes.
+    """
+
+    def __init__(self, latency_ms=0, chunk_ms=0, chunk_bytes=(8, 64), seed=0, step_ms=0):
+        self.latency_ms = latency_ms
+        self.chunk_ms = chunk_ms
+        self.chunk_bytes = chunk_bytes
+        self.step_ms = step_ms
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke_agent(self, agentId, agentAliasId, sessionId, inputText, enableTrace=False, **kwargs):
+        match = re.search(r'facts about (.+?)\.', inputText)
+        city = match.group(1).strip() if match else 'Unknown'
+        facts = [template.format(city=city) for template in FACT_TEMPLATES]
+        facts.insert(3, f"According to the knowledge base, {city} has an air quality index of "
+                        f"61.9 and a cost of living index of 93.8 — São Paulo–style data, with citations.")
+        payload = '\n'.join(f"{i}. {fact}" for i, fact in enumerate(facts, 1)).encode('utf-8')
+
+        with self._lock:
+            self.calls += 1
+            sizes = []
+            remaining = len(payload)
+            while remaining > 0:
+                size = min(remaining, self._random.randint(*self.chunk_bytes))
+                sizes.append(size)
+                remaining -= size
+
+        def completion():
+            self._sleep(self.latency_ms)
+            if enableTrace:
+                for trace in self._trace_events(agentId, sessionId, city):
+                    yield {"trace": trace}
+            offset = 0
+            for size in sizes:
+                self._sleep(self.chunk_ms)
+                yield {"chunk": {"bytes": payload[offset:offset + size]}}
+                offset += size
+
+        return {"completion": completion(), "sessionId": sessionId, "contentType": "text/plain"}
+
+    def _trace_events(self, agent_id, session_id, city):
+        """
+        Trace events in the shape invoke_agent sends them, with a pause
+        of step_ms between each input and its output.
+        """
+        def wrap(phase, body):
+            return {"agentId": agent_id, "sessionId": session_id, "trace": {phase: body}}
+
+        def usage(input_tokens, output_tokens):
+            return {"usage": {"inputTokens": input_tokens, "outputTokens": output_tokens}}
+
+        yield wrap("preProcessingTrace", {"modelInvocationInput": {"traceId": "pre-0", "type": "PRE_PROCESSING"}})
+        self._sleep(self.step_ms)
+        yield wrap("preProcessingTrace", {"modelInvocationOutput": {"traceId": "pre-0", "metadata": usage(412, 58)}})
+
+        yield wrap("orchestrationTrace", {"modelInvocationInput": {"traceId": "orch-0", "type": "ORCHESTRATION"}})
+        self._sleep(self.step_ms)
+        yield wrap("orchestrationTrace", {"modelInvocationOutput": {"traceId": "orch-0",
+                                                                    "metadata": usage(1530, 96)}})
+        yield wrap("orchestrationTrace", {"rationale": {"traceId": "orch-0", "text": "Search the knowledge base."}})
+        yield wrap("orchestrationTrace", {"invocationInput": {
+            "traceId": "orch-0", "invocationType": "KNOWLEDGE_BASE",
+            "knowledgeBaseLookupInput": {"knowledgeBaseId": "STUBKB", "text": f"{city} air quality cost of living"}}})
+        self._sleep(self.step_ms)
+        yield wrap("orchestrationTrace", {"observation": {
+            "traceId": "orch-0", "type": "KNOWLEDGE_BASE", "knowledgeBaseLookupOutput": {"retrievedReferences": [
+                {"content": {"text": f"{city} passage {i}"}, "location": {"type": "S3"}} for i in range(5)]}}})
+
+        yield wrap("orchestrationTrace", {"modelInvocationInput": {"traceId": "orch-1", "type": "ORCHESTRATION"}})
+        self._sleep(self.step_ms)
+        yield wrap("orchestrationTrace", {"modelInvocationOutput": {"traceId": "orch-1",
+                                                                    "metadata": usage(2710, 74)}})
+        yield wrap("orchestrationTrace", {"invocationInput": {
+            "traceId": "orch-1", "invocationType": "ACTION_GROUP",
+            "actionGroupInvocationInput": {"actionGroupName": "CityFactsActionGroup", "apiPath": "/city-facts",
+                                           "verb": "post"}}})
+        self._sleep(self.step_ms)
+        yield wrap("orchestrationTrace", {"observation": {
+            "traceId": "orch-1", "type": "ACTION_GROUP",
+            "actionGroupInvocationOutput": {"text": json.dumps({"city": city, "total_facts": 10})}}})
+
+        yield wrap("orchestrationTrace", {"modelInvocationInput": {"traceId": "orch-2", "type": "ORCHESTRATION"}})
+        self._sleep(self.step_ms)
+        yield wrap("orchestrationTrace", {"modelInvocationOutput": {"traceId": "orch-2",
+                                                                    "metadata": usage(3604, 402)}})
+        yield wrap("orchestrationTrace", {"observation": {"traceId": "orch-2", "type": "FINISH",
+                                                          "finalResponse": {"text": "..."}}})
+
+    def _sleep(self, ms):
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+
+def install_stubs(direct=None, agent=None):
+    """
+    Install stub clients into the shared runtime so both handlers use them.
+    """
+    from common.runtime import set_client
+
+    direct = direct or StubBedrockRuntime()
+    agent = agent or StubBedrockAgentRuntime()
+    set_client('bedrock-runtime', direct)
+    set_client('bedrock-agent-runtime', agent)
+    return direct, agent
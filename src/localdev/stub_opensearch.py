@@ -0,0 +1,144 @@
+"""
+Offline stand-in for the opensearch-py client, for the knowledge-base
+ingestion pipeline in scripts/create-opensearch-index.py.
+
+Implements the calls the pipeline makes (indices.exists, indices.create,
+bulk, search, count) with OpenSearch Serverless vector-collection
+behaviour: documents get generated IDs and index/create actions that
+carry a custom _id fail per item. Search supports match_all and a
+brute-force knn query on the vector field. State can be persisted to a
+file so incremental re-ingestion can be exercised across runs.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+
+
+class StubIndices:
+    def __init__(self, store):
+        self._store = store
+
+    def exists(self, index):
+        return index in self._store.data
+
+    def create(self, index, body=None):
+        with self._store.lock:
+            if index in self._store.data:
+                raise Exception(f"resource_already_exists_exception: index [{index}] already exists")
+            self._store.data[index] = {"body": body or {}, "docs": {}}
+            self._store.save()
+        return {"acknowledged": True, "index": index}
+
+
+class StubOpenSearch:
+    """
+    In-memory OpenSearch with the subset of the client API the pipeline uses.
+    """
+
+    def __init__(self, state_path=None, latency_ms=0):
+        self.state_path = state_path
+        self.latency_ms = latency_ms
+        self.lock = threading.Lock()
+        # index name -> {"body": creation body, "docs": {_id: _source}}
+        self.data = {}
+        self.bulk_requests = 0
+        self._next_id = 0
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'rb') as f:
+                state = pickle.load(f)
+            self.data, self._next_id = state["data"], state["next_id"]
+        self.indices = StubIndices(self)
+
+    def save(self):
+        if self.state_path:
+            with open(self.state_path, 'wb') as f:
+                pickle.dump({"data": self.data, "next_id": self._next_id}, f)
+
+    def _sleep(self):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    def _index(self, name):
+        index = self.data.get(name)
+        if index is None:
+            raise Exception(f"index_not_found_exception: no such index [{name}]")
+        return index
+
+    def bulk(self, body, index=None, **kwargs):
+        """
+        Apply an NDJSON _bulk body (string or list of lines).
+        """
+        self._sleep()
+        lines = body.splitlines() if isinstance(body, str) else list(body)
+        lines = [json.loads(line) if isinstance(line, str) else line for line in lines if line]
+        started = time.perf_counter()
+        items = []
+        with self.lock:
+            self.bulk_requests += 1
+            position = 0
+            while position < len(lines):
+                action = lines[position]
+                operation, meta = next(iter(action.items()))
+                target = self._index(meta.get("_index", index))
+                position += 1
+                if operation == 'delete':
+                    found = target["docs"].pop(meta["_id"], None) is not None
+                    items.append({"delete": {"_id": meta["_id"], "status": 200 if found else 404,
+                                             "result": "deleted" if found else "not_found"}})
+                    continue
+                source = lines[position]
+                position += 1
+                if meta.get("_id") is not None:
+                    items.append({operation: {"status": 400, "error": {
+                        "type": "illegal_argument_exception",
+                        "reason": "Document ID is not supported in create/index operation request"}}})
+                    continue
+                self._next_id += 1
+                doc_id = f"stub-{self._next_id}"
+                target["docs"][doc_id] = source
+                items.append({operation: {"_id": doc_id, "status": 201, "result": "created"}})
+            self.save()
+        errors = any(next(iter(item.values())).get("status", 200) >= 300 and "delete" not in item
+                     for item in items)
+        return {"took": int((time.perf_counter() - started) * 1000), "errors": errors, "items": items}
+
+    def search(self, index, body=None, **kwargs):
+        """
+        match_all (with size and _source filtering) or knn on one vector field.
+        """
+        self._sleep()
+        body = body or {}
+        size = body.get("size", 10)
+        with self.lock:
+            docs = list(self._index(index)["docs"].items())
+        query = body.get("query", {"match_all": {}})
+        if "knn" in query:
+            field, spec = next(iter(query["knn"].items()))
+            vector = spec["vector"]
+            scored = []
+            for doc_id, source in docs:
+                # OpenSearch reports l2 similarity as 1 / (1 + squared distance)
+                distance = sum((a - b) ** 2 for a, b in zip(vector, source.get(field, [])))
+                scored.append((1 / (1 + distance), doc_id, source))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            hits = scored[:min(size, spec.get("k", size))]
+        else:
+            hits = [(1.0, doc_id, source) for doc_id, source in docs[:size]]
+
+        fields = body.get("_source")
+        results = []
+        for score, doc_id, source in hits:
+            if isinstance(fields, list):
+                source = {key: source[key] for key in fields if key in source}
+            elif fields is False:
+                source = {}
+            results.append({"_index": index, "_id": doc_id, "_score": round(score, 6), "_source": source})
+        return {"hits": {"total": {"value": len(docs), "relation": "eq"},
+                         "max_score": results[0]["_score"] if results else None, "hits": results}}
+
+    def count(self, index, body=None, **kwargs):
+        with self.lock:
+            return {"count": len(self._index(index)["docs"])}
+
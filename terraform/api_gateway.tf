@@ -3,6 +3,11 @@ resource "aws_api_gateway_rest_api" "city_facts_api" {
   count       = var.enable_frontend ? 1 : 0
   name        = "${local.full_project_name}-api"
   description = "API Gateway for City Facts Lambda functions"
+
+  # Lets the Lambdas return gzip/br-compressed bodies (isBase64Encoded) as bytes. Browsers
+  # send Accept: */*, so narrower types would not match; the CORS MOCK integrations set
+  # content_handling = "CONVERT_TO_TEXT" instead so their mapping templates still apply
+  binary_media_types = ["*/*"]
   
   endpoint_configuration {
     types = ["REGIONAL"]
@@ -25,6 +30,14 @@ resource "aws_api_gateway_resource" "agent" {
   path_part   = "agent"
 }
 
+# API Gateway Resource for /compare endpoint
+resource "aws_api_gateway_resource" "compare" {
+  count       = var.enable_frontend ? 1 : 0
+  rest_api_id = aws_api_gateway_rest_api.city_facts_api[0].id
+  parent_id   = aws_api_gateway_rest_api.city_facts_api[0].root_resource_id
+  path_part   = "compare"
+}
+
 # POST method for /direct
 resource "aws_api_gateway_method" "direct_post" {
   count         = var.enable_frontend ? 1 : 0
@@ -45,6 +58,16 @@ resource "aws_api_gateway_method" "agent_post" {
   authorizer_id = aws_api_gateway_authorizer.cognito[0].id
 }
 
+# POST method for /compare
+resource "aws_api_gateway_method" "compare_post" {
+  count         = var.enable_frontend ? 1 : 0
+  rest_api_id   = aws_api_gateway_rest_api.city_facts_api[0].id
+  resource_id   = aws_api_gateway_resource.compare[0].id
+  http_method   = "POST"
+  authorization = "COGNITO_USER_POOLS"
+  authorizer_id = aws_api_gateway_authorizer.cognito[0].id
+}
+
 # Lambda integration for /direct
 resource "aws_api_gateway_integration" "direct_lambda" {
   count       = var.enable_frontend ? 1 : 0
@@ -69,6 +92,18 @@ resource "aws_api_gateway_integration" "agent_lambda" {
   uri                     = aws_lambda_function.city_facts_agent.invoke_arn
 }
 
+# Lambda integration for /compare
+resource "aws_api_gateway_integration" "compare_lambda" {
+  count       = var.enable_frontend ? 1 : 0
+  rest_api_id = aws_api_gateway_rest_api.city_facts_api[0].id
+  resource_id = aws_api_gateway_resource.compare[0].id
+  http_method = aws_api_gateway_method.compare_post[0].http_method
+
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.city_facts_compare.invoke_arn
+}
+
 # Lambda permissions for API Gateway to invoke functions
 resource "aws_lambda_permission" "apigw_direct" {
   count         = var.enable_frontend ? 1 : 0
@@ -88,6 +123,15 @@ resource "aws_lambda_permission" "apigw_agent" {
   source_arn    = "${aws_api_gateway_rest_api.city_facts_api[0].execution_arn}/*/*"
 }
 
+resource "aws_lambda_permission" "apigw_compare" {
+  count         = var.enable_frontend ? 1 : 0
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.city_facts_compare.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.city_facts_api[0].execution_arn}/*/*"
+}
+
 # CORS configuration for /direct OPTIONS
 resource "aws_api_gateway_method" "direct_options" {
   count         = var.enable_frontend ? 1 : 0
@@ -103,6 +147,9 @@ resource "aws_api_gateway_integration" "direct_options" {
   resource_id = aws_api_gateway_resource.direct[0].id
   http_method = aws_api_gateway_method.direct_options[0].http_method
   type        = "MOCK"
+
+  # binary_media_types = ["*/*"] makes every payload binary; the mapping template needs text
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -129,9 +176,11 @@ resource "aws_api_gateway_integration_response" "direct_options" {
   resource_id = aws_api_gateway_resource.direct[0].id
   http_method = aws_api_gateway_method.direct_options[0].http_method
   status_code = aws_api_gateway_method_response.direct_options[0].status_code
+
+  content_handling = "CONVERT_TO_TEXT"
   
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match'"
     "method.response.header.Access-Control-Allow-Methods" = "'POST,OPTIONS'"
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -152,6 +201,9 @@ resource "aws_api_gateway_integration" "agent_options" {
   resource_id = aws_api_gateway_resource.agent[0].id
   http_method = aws_api_gateway_method.agent_options[0].http_method
   type        = "MOCK"
+
+  # binary_media_types = ["*/*"] makes every payload binary; the mapping template needs text
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -178,9 +230,65 @@ resource "aws_api_gateway_integration_response" "agent_options" {
   resource_id = aws_api_gateway_resource.agent[0].id
   http_method = aws_api_gateway_method.agent_options[0].http_method
   status_code = aws_api_gateway_method_response.agent_options[0].status_code
+
+  content_handling = "CONVERT_TO_TEXT"
+  
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match'"
+    "method.response.header.Access-Control-Allow-Methods" = "'POST,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
+# CORS configuration for /compare OPTIONS
+resource "aws_api_gateway_method" "compare_options" {
+  count         = var.enable_frontend ? 1 : 0
+  rest_api_id   = aws_api_gateway_rest_api.city_facts_api[0].id
+  resource_id   = aws_api_gateway_resource.compare[0].id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "compare_options" {
+  count       = var.enable_frontend ? 1 : 0
+  rest_api_id = aws_api_gateway_rest_api.city_facts_api[0].id
+  resource_id = aws_api_gateway_resource.compare[0].id
+  http_method = aws_api_gateway_method.compare_options[0].http_method
+  type        = "MOCK"
+
+  # binary_media_types = ["*/*"] makes every payload binary; the mapping template needs text
+  content_handling = "CONVERT_TO_TEXT"
+  
+  request_templates = {
+    "application/json" = "{\"statusCode\": 200}"
+  }
+}
+
+resource "aws_api_gateway_method_response" "compare_options" {
+  count       = var.enable_frontend ? 1 : 0
+  rest_api_id = aws_api_gateway_rest_api.city_facts_api[0].id
+  resource_id = aws_api_gateway_resource.compare[0].id
+  http_method = aws_api_gateway_method.compare_options[0].http_method
+  status_code = "200"
+  
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "compare_options" {
+  count       = var.enable_frontend ? 1 : 0
+  rest_api_id = aws_api_gateway_rest_api.city_facts_api[0].id
+  resource_id = aws_api_gateway_resource.compare[0].id
+  http_method = aws_api_gateway_method.compare_options[0].http_method
+  status_code = aws_api_gateway_method_response.compare_options[0].status_code
+
+  content_handling = "CONVERT_TO_TEXT"
   
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match'"
     "method.response.header.Access-Control-Allow-Methods" = "'POST,OPTIONS'"
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -195,10 +303,20 @@ resource "aws_api_gateway_deployment" "city_facts_api" {
     redeployment = sha1(jsonencode([
       aws_api_gateway_resource.direct[0].id,
       aws_api_gateway_resource.agent[0].id,
+      aws_api_gateway_resource.compare[0].id,
       aws_api_gateway_method.direct_post[0].id,
       aws_api_gateway_method.agent_post[0].id,
+      aws_api_gateway_method.compare_post[0].id,
       aws_api_gateway_integration.direct_lambda[0].id,
       aws_api_gateway_integration.agent_lambda[0].id,
+      aws_api_gateway_integration.compare_lambda[0].id,
+      aws_api_gateway_rest_api.city_facts_api[0].binary_media_types,
+      aws_api_gateway_integration.direct_options[0].content_handling,
+      aws_api_gateway_integration.agent_options[0].content_handling,
+      aws_api_gateway_integration.compare_options[0].content_handling,
+      aws_api_gateway_integration_response.direct_options[0].response_parameters,
+      aws_api_gateway_integration_response.agent_options[0].response_parameters,
+      aws_api_gateway_integration_response.compare_options[0].response_parameters,
     ]))
   }
 
@@ -209,8 +327,10 @@ resource "aws_api_gateway_deployment" "city_facts_api" {
   depends_on = [
     aws_api_gateway_integration.direct_lambda,
     aws_api_gateway_integration.agent_lambda,
+    aws_api_gateway_integration.compare_lambda,
     aws_api_gateway_integration.direct_options,
     aws_api_gateway_integration.agent_options,
+    aws_api_gateway_integration.compare_options,
   ]
 }
 
@@ -9,6 +9,14 @@ resource "aws_lambda_function" "city_facts_direct" {
   memory_size     = 128
   publish         = false
 
+  environment {
+    variables = {
+      ADMISSION_TOKENS_PER_MINUTE = var.bedrock_tokens_per_minute
+      ADMISSION_REQUESTS_PER_MINUTE = var.bedrock_requests_per_minute
+      ADMISSION_STORE = "dynamodb:${aws_dynamodb_table.admission_buckets.name}"
+    }
+  }
+
   # Ignore changes to code since it's managed externally
   lifecycle {
     ignore_changes = [
@@ -29,7 +37,7 @@ resource "aws_lambda_function" "city_facts_agent" {
   role            = aws_iam_role.lambda_role.arn
   handler         = "index.handler"
   runtime         = "python3.11"
-  timeout         = 30
+  timeout         = var.agent_lambda_timeout
   memory_size     = 128
   publish         = false
 
@@ -37,6 +45,10 @@ resource "aws_lambda_function" "city_facts_agent" {
     variables = {
       BEDROCK_AGENT_ID = aws_bedrockagent_agent.city_facts_agent.agent_id
       BEDROCK_AGENT_ALIAS_ID = "TSTALIASID"
+      AGENT_JOB_STORE = "dynamodb:${aws_dynamodb_table.agent_jobs.name}"
+      ADMISSION_TOKENS_PER_MINUTE = var.bedrock_tokens_per_minute
+      ADMISSION_REQUESTS_PER_MINUTE = var.bedrock_requests_per_minute
+      ADMISSION_STORE = "dynamodb:${aws_dynamodb_table.admission_buckets.name}"
     }
   }
 
@@ -53,6 +65,81 @@ resource "aws_lambda_function" "city_facts_agent" {
   ]
 }
 
+# Lambda function comparing both paths: runs the direct model call and the agent concurrently
+resource "aws_lambda_function" "city_facts_compare" {
+  filename         = "city_facts_compare.zip"
+  function_name    = "${local.full_project_name}-city-facts-compare"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "index.handler"
+  runtime         = "python3.11"
+  # Below API Gateway's 29 second integration limit, so the deadline returns the finished path first
+  timeout         = 28
+  # Holds both paths' clients and indexes in one process
+  memory_size     = 256
+  publish         = false
+
+  environment {
+    variables = {
+      BEDROCK_AGENT_ID = aws_bedrockagent_agent.city_facts_agent.agent_id
+      BEDROCK_AGENT_ALIAS_ID = "TSTALIASID"
+      ADMISSION_TOKENS_PER_MINUTE = var.bedrock_tokens_per_minute
+      ADMISSION_REQUESTS_PER_MINUTE = var.bedrock_requests_per_minute
+      ADMISSION_STORE = "dynamodb:${aws_dynamodb_table.admission_buckets.name}"
+      # Traced agent runs send an event per step, so a 10 second silence is a stall;
+      # the read then fails well before the 28 second timeout and the ticket is settled
+      AGENT_READ_TIMEOUT = "10"
+    }
+  }
+
+  # Ignore changes to code since it's managed externally
+  lifecycle {
+    ignore_changes = [
+      source_code_hash
+    ]
+  }
+
+  depends_on = [
+    aws_iam_role_policy_attachment.lambda_logs,
+    aws_cloudwatch_log_group.lambda_logs_compare,
+  ]
+}
+
+# Async agent jobs: job records, read by status polls and written by the worker
+resource "aws_dynamodb_table" "agent_jobs" {
+  name         = "${local.full_project_name}-agent-jobs"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "job_id"
+
+  attribute {
+    name = "job_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Admission control: token-bucket state shared by every container of the three functions
+resource "aws_dynamodb_table" "admission_buckets" {
+  name         = "${local.full_project_name}-admission-buckets"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "bucket_key"
+
+  attribute {
+    name = "bucket_key"
+    type = "S"
+  }
+}
+
+# Async job workers are self-invocations; a failed run is not retried so it never doubles Bedrock load
+resource "aws_lambda_function_event_invoke_config" "city_facts_agent" {
+  function_name                = aws_lambda_function.city_facts_agent.function_name
+  maximum_retry_attempts       = 0
+  maximum_event_age_in_seconds = 300
+}
+
 # IAM role for Lambda
 resource "aws_iam_role" "lambda_role" {
   name = "${local.full_project_name}-lambda-role"
@@ -98,6 +185,55 @@ resource "aws_iam_role_policy" "bedrock_policy" {
   })
 }
 
+# Admission control bucket reads and conditional writes
+resource "aws_iam_role_policy" "admission_policy" {
+  name = "${local.full_project_name}-admission-policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ]
+        Resource = aws_dynamodb_table.admission_buckets.arn
+      }
+    ]
+  })
+}
+
+# Agent job store and self-invocation for async agent jobs
+resource "aws_iam_role_policy" "agent_jobs_policy" {
+  name = "${local.full_project_name}-agent-jobs-policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem"
+        ]
+        Resource = aws_dynamodb_table.agent_jobs.arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = "lambda:InvokeFunction"
+        Resource = [
+          aws_lambda_function.city_facts_agent.arn,
+          "${aws_lambda_function.city_facts_agent.arn}:*"
+        ]
+      }
+    ]
+  })
+}
+
 # CloudWatch log groups
 resource "aws_cloudwatch_log_group" "lambda_logs_direct" {
   name              = "/aws/lambda/${local.full_project_name}-city-facts-direct"
@@ -107,4 +243,9 @@ resource "aws_cloudwatch_log_group" "lambda_logs_direct" {
 resource "aws_cloudwatch_log_group" "lambda_logs_agent" {
   name              = "/aws/lambda/${local.full_project_name}-city-facts-agent"
   retention_in_days = 14
-}
\ No newline at end of file
+}
+
+resource "aws_cloudwatch_log_group" "lambda_logs_compare" {
+  name              = "/aws/lambda/${local.full_project_name}-city-facts-compare"
+  retention_in_days = 14
+}
@@ -67,6 +67,24 @@ variable "enable_frontend" {
   default     = true
 }
 
+variable "agent_lambda_timeout" {
+  description = "Timeout in seconds for the agent Lambda. Async agent jobs run in a self-invocation of this function, so they can take this long; synchronous API Gateway requests keep a 29-second deadline (API_GATEWAY_TIMEOUT_MS) so retries and admission waits stop before the gateway's 504"
+  type        = number
+  default     = 120
+}
+
+variable "bedrock_tokens_per_minute" {
+  description = "Claude 3 Haiku tokens-per-minute quota the Lambdas admit requests against (0 disables the token limit). Set it a little below the account's Bedrock quota"
+  type        = number
+  default     = 0
+}
+
+variable "bedrock_requests_per_minute" {
+  description = "Claude 3 Haiku requests-per-minute quota the Lambdas admit requests against (0 disables the request limit)"
+  type        = number
+  default     = 0
+}
+
 # Data source to get current AWS caller identity
 data "aws_caller_identity" "current" {}
 
@@ -18,6 +18,16 @@ output "lambda_function_agent_arn" {
   value       = aws_lambda_function.city_facts_agent.arn
 }
 
+output "lambda_function_compare_name" {
+  description = "Name of the comparison Lambda function (direct and agent paths concurrently)"
+  value       = aws_lambda_function.city_facts_compare.function_name
+}
+
+output "lambda_function_compare_arn" {
+  description = "ARN of the comparison Lambda function"
+  value       = aws_lambda_function.city_facts_compare.arn
+}
+
 output "bedrock_agent_id" {
   description = "ID of the Bedrock agent"
   value       = aws_bedrockagent_agent.city_facts_agent.agent_id
@@ -84,6 +94,11 @@ output "api_gateway_agent_endpoint" {
   value       = var.enable_frontend ? "${aws_api_gateway_stage.prod[0].invoke_url}/agent" : "Not deployed - set enable_frontend = true to deploy"
 }
 
+output "api_gateway_compare_endpoint" {
+  description = "Full URL for the comparison Lambda endpoint"
+  value       = var.enable_frontend ? "${aws_api_gateway_stage.prod[0].invoke_url}/compare" : "Not deployed - set enable_frontend = true to deploy"
+}
+
 # Cognito Outputs
 output "cognito_user_pool_id" {
   description = "ID of the Cognito User Pool"